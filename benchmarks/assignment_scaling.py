@@ -0,0 +1,130 @@
+# Copyright 2009-2014 Ram Rachum.
+# This program is distributed under the MIT license.
+
+'''
+Benchmark how `selecting_assignments` scales on pathological input.
+
+The regex that `selecting_assignments` used before its assignment index, kept
+here as `reference_assignment_pattern`, backtracks over runs of spaces in
+lines that have no assignment, so its time grows with the square of the line
+width. This builds the assignment index and runs the old regex on lines that
+get twice as wide each round, and then on modules that get twice as long, and
+reports the time of each and the time per KB.
+
+Run with Python 2.7, like Wing does:
+
+    python benchmarks/assignment_scaling.py
+    python benchmarks/assignment_scaling.py --lines 400 --rounds 5
+'''
+
+from __future__ import division
+from __future__ import with_statement
+
+import os.path, sys
+benchmarks_folder = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [benchmarks_folder]
+
+import argparse
+import re
+import timeit
+
+import run_benchmarks # Sets up `sys.path` for the scripts.
+import selecting_assignments
+
+
+###############################################################################
+
+
+reference_assignment_pattern = re.compile(
+    r'''(?<=\n)(?P<indent>[ \t]*)''' # Before LHS
+
+    # LHS:
+    r'''(?P<lhs>(?!if |while |elif |assert )[^ \n][^=\n\(]*?)'''
+
+    r''' +(?:[+\-*/%|&^]|<<|>>|//|\*\*)?= +''' # operator and padding
+
+    # RHS:
+    r'''(?P<rhs>[^ ][^\n]*(?:\n|$)'''
+    r'''(?:(?:[ \t]*[)\]}][^\n]*[\n])|(?:(?=(?P=indent)'''
+    r'''[ \t])[^\n]*(?:\n|$)))*)'''
+)
+
+
+def make_wide_module(n_lines, width):
+    '''
+    Make a module whose lines are deeply indented and `width` spaces apart.
+
+    Like a table that's lined up with spaces, in a function that's nested
+    deep. Every fourth line is an assignment.
+    '''
+    lines = ['def function():\n']
+    for i in range(n_lines):
+        indent = ' ' * (4 * (1 + i % 10))
+        if i % 4:
+            lines.append('%svalue_%d%sother_%d%s+ %d\n' % (
+                indent, i, ' ' * width, i, ' ' * width, i
+            ))
+        else:
+            lines.append('%svalue_%d = other_%d%s+ %d\n' % (
+                indent, i, i, ' ' * width, i
+            ))
+    return ''.join(lines)
+
+
+def _time(function, n_runs):
+    '''Get the best time of `n_runs` runs of `function`, in milliseconds.'''
+    return min(timeit.repeat(function, number=1, repeat=n_runs)) * 1000
+
+
+def _print_row(label, text, reference_time, index_time):
+    size = len(text) / 1024
+    print('%-14s %9.1f %12.2f %12.2f %12.3f %12.3f' % (
+        label, size, reference_time, index_time, reference_time / size,
+        index_time / size
+    ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--lines', type=int, default=200,
+                        help='Lines in the module whose width grows.')
+    parser.add_argument('--width', type=int, default=25,
+                        help='Width of the runs of spaces in the first round.')
+    parser.add_argument('--rounds', type=int, default=5,
+                        help='Number of times to double the input.')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='Number of runs per round; the best one counts.')
+    arguments = parser.parse_args(argv)
+
+    header = '%-14s %9s %12s %12s %12s %12s' % (
+        'input', 'KB', 'regex ms', 'index ms', 'regex ms/KB', 'index ms/KB'
+    )
+
+    for title, make_text in (
+        ('Doubling line width:',
+         lambda i: ('width %d' % (arguments.width * 2 ** i),
+                    make_wide_module(arguments.lines,
+                                     arguments.width * 2 ** i))),
+        ('Doubling module length:',
+         lambda i: ('lines %d' % (arguments.lines * 2 ** i),
+                    make_wide_module(arguments.lines * 2 ** i,
+                                     arguments.width))),
+    ):
+        print('\n%s' % title)
+        print(header)
+        for i in range(arguments.rounds):
+            label, text = make_text(i)
+            reference_time = _time(
+                lambda: list(reference_assignment_pattern.finditer(text)),
+                arguments.runs
+            )
+            index_time = _time(
+                lambda: selecting_assignments.AssignmentIndex(text, 0),
+                arguments.runs
+            )
+            _print_row(label, text, reference_time, index_time)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# Copyright 2009-2014 Ram Rachum.
+# This program is distributed under the MIT license.
+
+'''
+Benchmark how completing a file name scales with the size of the folder.
+
+The `ExpandFileFragment` that `monkeypatch` installs for `open-from-keyboard`
+used to list the folder, and check every matching entry for being a folder, on
+every keystroke, like `reference_expand_file_fragment` here does. Now it uses
+`shared.get_folder_listing`, which lists the folder again only when its mtime
+changes, checks each entry for being a folder once, and finds the matches with
+a bisect. This makes folders that get twice as big each round, and times the
+reference, the first completion in a folder, (which lists it,) the
+completions after it, and just their lookups, without making the paths of the
+matches, which both ways do.
+
+Run with Python 2.7, like Wing does:
+
+    python benchmarks/folder_completion_scaling.py
+    python benchmarks/folder_completion_scaling.py --files 5000 --rounds 3
+'''
+
+from __future__ import division
+from __future__ import with_statement
+
+import os.path, sys
+benchmarks_folder = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [benchmarks_folder]
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import timeit
+
+import run_benchmarks # Sets up `sys.path` for the scripts.
+import shared
+
+
+###############################################################################
+
+
+ignored_extensions = ('.pyc', '.pyo', '.pyd')
+
+
+def reference_expand_file_fragment(entry):
+    '''The old `ExpandFileFragment`, with `os.listdir` instead of Wing's.'''
+    dirname, filefrag = os.path.split(entry)
+    try:
+        file_list = os.listdir(os.path.expanduser(dirname))
+    except OSError:
+        file_list = []
+    allfiles = []
+    for file in file_list:
+        if file.endswith(ignored_extensions):
+            continue
+        if sys.platform == 'win32':
+            file_matches = file.lower().startswith(filefrag.lower())
+        else:
+            file_matches = file.startswith(filefrag)
+        if file_matches:
+            match = os.path.join(dirname, file)
+            if os.path.isdir(match) and match[-1] != os.sep:
+                match = match + os.sep
+            allfiles.append(match)
+    return allfiles
+
+
+def expand_file_fragment(entry):
+    '''The new `ExpandFileFragment`, with `os.listdir` instead of Wing's.'''
+    dirname, filefrag = os.path.split(entry)
+    try:
+        folder_listing = shared.get_folder_listing(
+            os.path.expanduser(dirname), ignored_extensions=ignored_extensions
+        )
+    except OSError:
+        return []
+    allfiles = []
+    for file in folder_listing.find_by_prefix(filefrag):
+        match = os.path.join(dirname, file)
+        if folder_listing.is_folder(file) and match[-1] != os.sep:
+            match = match + os.sep
+        allfiles.append(match)
+    return allfiles
+
+
+def make_folder(folder, n_files):
+    '''
+    Fill `folder` with `n_files` entries, like a big folder of a project.
+
+    A third of them are compiled files, and one in 20 is a folder.
+    '''
+    for i in range(n_files):
+        name = 'module_%d' % i
+        if i % 20 == 0:
+            os.mkdir(os.path.join(folder, name))
+        else:
+            with open(os.path.join(folder, name +
+                                   ('.pyc' if i % 3 == 0 else '.py')), 'w'):
+                pass
+    # Making sure the listings aren't made within the folder's mtime
+    # resolution, so they can be used.
+    past_time = time.time() - 10
+    os.utime(folder, (past_time, past_time))
+
+
+def _time(function, n_runs):
+    '''Get the best time of `n_runs` runs of `function`, in milliseconds.'''
+    return min(timeit.repeat(function, number=1, repeat=n_runs)) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--files', type=int, default=2500,
+                        help='Number of files in the first round.')
+    parser.add_argument('--rounds', type=int, default=5,
+                        help='Number of times to double the folder.')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Number of runs per round; the best one counts.')
+    arguments = parser.parse_args(argv)
+
+    print('%-9s %12s %12s %12s %12s' % ('files', 'old ms', 'first ms',
+                                        'next ms', 'lookup ms'))
+    for i in range(arguments.rounds):
+        n_files = arguments.files * 2 ** i
+        folder = tempfile.mkdtemp(prefix='folder_completion_')
+        try:
+            make_folder(folder, n_files)
+            # Typing `module_1`, one keystroke at a time:
+            entries = [os.path.join(folder, 'module_1'[:j]) for j in
+                       range(len('module_1') + 1)]
+            shared._folder_listings.clear()
+            first_time = _time(lambda: expand_file_fragment(entries[-1]), 1)
+            for entry in entries:
+                assert sorted(expand_file_fragment(entry)) == \
+                                  sorted(reference_expand_file_fragment(entry))
+            next_time = _time(
+                lambda: [expand_file_fragment(entry) for entry in entries],
+                arguments.runs
+            ) / len(entries)
+            lookup_time = _time(
+                lambda: [
+                    shared.get_folder_listing(os.path.dirname(entry),
+                                              ignored_extensions)
+                    .find_by_prefix(os.path.basename(entry))
+                    for entry in entries
+                ],
+                arguments.runs
+            ) / len(entries)
+            reference_time = _time(
+                lambda: [reference_expand_file_fragment(entry) for entry in
+                         entries],
+                arguments.runs
+            ) / len(entries)
+        finally:
+            shutil.rmtree(folder)
+        print('%-9d %12.2f %12.2f %12.3f %12.3f' % (
+            n_files, reference_time, first_time, next_time, lookup_time
+        ))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
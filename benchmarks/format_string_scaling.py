@@ -0,0 +1,177 @@
+# Copyright 2009-2014 Ram Rachum.
+# This program is distributed under the MIT license.
+
+'''
+Benchmark how `edit_string.format_string` scales with the size of the string.
+
+The formatter that `edit_string` used before, kept here as
+`reference_format_string`, escaped the string one character at a time, cut
+segments off by copying the rest of the content each time, and verified the
+result by evaluating all of it again. This formats strings from 1 KB to 1 MB
+with both, (the reference one only up to `--reference-limit` KB, because it
+gets slow,) and then formats each string again after changing one character
+in its middle, which re-validates only the segments that changed.
+
+Run with Python 2.7, like Wing does:
+
+    python benchmarks/format_string_scaling.py
+    python benchmarks/format_string_scaling.py --reference-limit 1024
+'''
+
+from __future__ import division
+from __future__ import with_statement
+
+import os.path, sys
+benchmarks_folder = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [benchmarks_folder]
+
+import argparse
+import ast
+import random
+import timeit
+
+import run_benchmarks # Sets up `sys.path` for the scripts.
+import edit_string
+
+
+###############################################################################
+
+
+def reference_format_string(string, double=False, triple=False, raw=False,
+                            starting_column=0, last_column=78):
+    '''The old `format_string`, without the prefixes we don't benchmark.'''
+    quote_character = '"' if double else "'"
+    quote_string = quote_character * (3 if triple else 1)
+    content_list = []
+    i = 0
+    while i < len(string):
+        if triple and string.startswith(quote_string, i):
+            content_list.append('\\%s' % quote_string)
+            i += 3
+            continue
+        elif triple and (i == len(string) - 1) and \
+                                                string[i] == quote_string[0]:
+            content_list.append('\\%s' % quote_string[0])
+            i += 1
+            continue
+        else:
+            current_substring = string[i]
+            i += 1
+        if ((current_substring in ('"', "'")) and triple) or \
+                                 (current_substring == '"' and not double) or \
+                                         (current_substring == "'" and double):
+            content_list.append(current_substring)
+        elif current_substring in edit_string.base_escape_map and not raw:
+            content_list.append(edit_string.base_escape_map[current_substring])
+        else:
+            content_list.append(current_substring)
+    content = ''.join(content_list)
+
+    def wrap_content(content):
+        return '%s%s%s%s' % ('r' if raw else '', quote_string, content,
+                             quote_string)
+
+    formatted_string = wrap_content(content)
+    if starting_column + len(formatted_string) > last_column:
+        segment_length = last_column - starting_column - \
+                                            len(quote_string) * 2 - int(raw)
+        content_segments = [content]
+        while True:
+            last_content_segment = content_segments[-1]
+            if len(last_content_segment) <= segment_length:
+                break
+            rfind_result = last_content_segment.rfind(' ', 0, segment_length)
+            if rfind_result == -1:
+                place_to_cut = segment_length
+            else:
+                place_to_cut = rfind_result
+            del content_segments[-1]
+            content_segments.append(last_content_segment[:place_to_cut+1])
+            content_segments.append(last_content_segment[place_to_cut+1:])
+        separator = ('\n%s' % (' ' * (starting_column)))
+        formatted_string = separator.join(
+            map(wrap_content, content_segments)
+        )
+    if not ast.literal_eval('(%s)' % formatted_string) == string:
+        raise Exception('Formatting unsuccessful.')
+    return formatted_string
+
+
+def make_prose(size, seed=0):
+    '''Make `size` characters of text with quotes, tabs and newlines in it.'''
+    random_ = random.Random(seed)
+    words = ('the', 'string', "it's", 'a', '"quoted"', 'C:\\Windows',
+             'tab\there', 'line\n', 'formatting', 'of')
+    parts = []
+    length = 0
+    while length < size:
+        word = random_.choice(words)
+        parts.append(word)
+        length += len(word) + 1
+    return ' '.join(parts)[:size]
+
+
+def _time(function, n_runs):
+    '''Get the best time of `n_runs` runs of `function`, in milliseconds.'''
+    return min(timeit.repeat(function, number=1, repeat=n_runs)) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--smallest', type=int, default=1,
+                        help='Size of the first string, in KB.')
+    parser.add_argument('--rounds', type=int, default=11,
+                        help='Number of times to double the string.')
+    parser.add_argument('--reference-limit', type=int, default=64,
+                        help="Largest string, in KB, to give the reference "
+                             "formatter.")
+    parser.add_argument('--runs', type=int, default=3,
+                        help='Number of runs per round; the best one counts.')
+    arguments = parser.parse_args(argv)
+
+    print('%-9s %12s %12s %12s %12s %12s' % (
+        'KB', 'old ms', 'new ms', 'edited ms', 'old ms/KB', 'new ms/KB'
+    ))
+    for i in range(arguments.rounds):
+        size = arguments.smallest * 2 ** i
+        string = make_prose(size * 1024)
+        middle = len(string) // 2
+        edited_string = '%sX%s' % (string[:middle], string[middle + 1:])
+
+        if size <= arguments.reference_limit:
+            reference_time = _time(
+                lambda: reference_format_string(string, starting_column=8),
+                arguments.runs
+            )
+            assert reference_format_string(string, starting_column=8) == \
+                          edit_string.format_string(string, starting_column=8)
+        else:
+            reference_time = None
+
+        def format_from_scratch():
+            edit_string._literal_values.clear()
+            edit_string.format_string(string, starting_column=8)
+        new_time = _time(format_from_scratch, arguments.runs)
+
+        def format_edited():
+            edit_string._literal_values.clear()
+            edit_string.format_string(string, starting_column=8)
+            start_time = timeit.default_timer()
+            edit_string.format_string(edited_string, starting_column=8)
+            return timeit.default_timer() - start_time
+        edited_time = min(format_edited() for _ in range(arguments.runs)) * \
+                                                                          1000
+
+        print('%-9d %12s %12.2f %12.2f %12s %12.4f' % (
+            size,
+            '-' if reference_time is None else '%.2f' % reference_time,
+            new_time, edited_time,
+            '-' if reference_time is None else '%.4f' % (reference_time /
+                                                         size),
+            new_time / size
+        ))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
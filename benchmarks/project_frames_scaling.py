@@ -0,0 +1,136 @@
+# Copyright 2009-2014 Ram Rachum.
+# This program is distributed under the MIT license.
+
+'''
+Benchmark how `go-up-to-project-frame` scales with the size of the project.
+
+The scripts in `navigate_project_frames` used to resolve the real path of
+every project file, and of every stack frame, each time they ran, like
+`reference_go_up_to_project_frame` here does. Now the normalized paths are
+kept in the project's path index and `normalize_path` is memoized, and the
+stack is classified once per pause. This makes projects that get twice as big
+each round, and times the reference, the first call of the new one on a
+project, (which builds the index,) the first calls after a pause, and the
+calls after those, in the same pause.
+
+Run with Python 2.7, like Wing does:
+
+    python benchmarks/project_frames_scaling.py
+    python benchmarks/project_frames_scaling.py --files 2000 --rounds 5
+'''
+
+from __future__ import division
+from __future__ import with_statement
+
+import os.path, sys
+benchmarks_folder = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [benchmarks_folder]
+
+import argparse
+import timeit
+
+import run_benchmarks # Sets up `sys.path` for the scripts.
+import wingapi
+import navigate_project_frames
+
+
+###############################################################################
+
+
+def reference_normalize_path(path):
+    if not sys.platform.startswith('win'):
+        return os.path.realpath(path)
+    else:
+        return os.path.realpath(path).lower()
+
+
+def reference_go_up_to_project_frame(application):
+    '''The old `go_up_to_project_frame`.'''
+    project = application.GetProject()
+    debugger = application.GetDebugger()
+    all_project_files = set(map(reference_normalize_path,
+                                project.GetAllFiles()))
+    run_state = debugger.GetCurrentRunState()
+    thread_id, frame_index = run_state.GetStackFrame()
+    stack = run_state.GetStack()
+    if not stack:
+        return
+    file_paths = [reference_normalize_path(file_path) for file_path, _, _, _, _
+                  in stack]
+    file_paths_in_project_above_current_frame = [
+        (i, file_path) for i, file_path in enumerate(file_paths) if
+        file_path in all_project_files and i < frame_index
+    ]
+    if not file_paths_in_project_above_current_frame:
+        return
+    run_state.SetStackFrame(thread_id,
+                            file_paths_in_project_above_current_frame[-1][0])
+
+
+def make_project_file_paths(n_files):
+    '''Make paths of `n_files` files, in folders nested like a real project.'''
+    return [
+        os.path.join(os.sep, 'home', 'user', 'project', 'package_%d' %
+                     (i // 500), 'subpackage_%d' % (i // 50 % 10),
+                     'module_%d.py' % i) for i in range(n_files)
+    ]
+
+
+def _time_call(application, function, stack, pause=True):
+    '''Time one call of `function` from the bottom of `stack`, in ms.'''
+    run_state = application.GetDebugger().GetCurrentRunState()
+    if pause:
+        run_state._pause(stack)
+    else:
+        run_state._frame_index = len(stack) - 1
+    start_time = timeit.default_timer()
+    function(application=application)
+    return (timeit.default_timer() - start_time) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--files', type=int, default=1000,
+                        help='Number of project files in the first round.')
+    parser.add_argument('--rounds', type=int, default=6,
+                        help='Number of times to double the project.')
+    parser.add_argument('--depth', type=int, default=60,
+                        help='Number of frames in the stack.')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Number of runs per round; the best one counts.')
+    arguments = parser.parse_args(argv)
+
+    application = wingapi.gApplication
+    print('%-9s %12s %12s %12s %12s' % ('files', 'old ms', 'first ms',
+                                        'next ms', 'same pause ms'))
+    for i in range(arguments.rounds):
+        n_files = arguments.files * 2 ** i
+        file_paths = make_project_file_paths(n_files)
+        stack = run_benchmarks._make_stack(file_paths, arguments.depth)
+        application._project = wingapi.CAPIProject(file_paths)
+        first_time = _time_call(
+            application, navigate_project_frames.go_up_to_project_frame, stack
+        )
+        next_time = min(
+            _time_call(application,
+                       navigate_project_frames.go_up_to_project_frame, stack)
+            for _ in range(arguments.runs)
+        )
+        same_pause_time = min(
+            _time_call(application,
+                       navigate_project_frames.go_up_to_project_frame, stack,
+                       pause=False)
+            for _ in range(arguments.runs)
+        )
+        reference_time = min(
+            _time_call(application, reference_go_up_to_project_frame, stack)
+            for _ in range(arguments.runs)
+        )
+        print('%-9d %12.2f %12.2f %12.3f %12.4f' % (
+            n_files, reference_time, first_time, next_time, same_pause_time
+        ))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+# Copyright 2009-2014 Ram Rachum.
+# This program is distributed under the MIT license.
+
+'''
+Benchmark `shared.RuleSet` dispatch against trying the patterns one by one.
+
+`deep_to_var` used to try its patterns with `re.search` one after another on
+the stripped line. Now its `RuleSet` tries only the rules whose required word
+is in the line, plus the rules that don't require a word. This runs both over
+a corpus of real lines, (the lines of the Python files in the given folders,
+which are this repo's scripts by default,) first with `deep_to_var`'s own
+rules and then with more and more rules added, like the rules of plugins, and
+reports the time per line of each. It also checks that both ways pick the
+same rule with the same groups for every line.
+
+Then it times `deep_to_var`'s rules on long query chains that don't match,
+with twice as many calls each round. A rule whose parts can match the same
+text in many ways takes exponential time on these, so this checks that each
+chain is searched in well under a second.
+
+Run with Python 2.7, like Wing does:
+
+    python benchmarks/rule_dispatch.py
+    python benchmarks/rule_dispatch.py --corpus /usr/lib/python2.7
+'''
+
+from __future__ import division
+from __future__ import with_statement
+
+import os.path, sys
+benchmarks_folder = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [benchmarks_folder]
+
+import argparse
+import timeit
+
+import run_benchmarks # Sets up `sys.path` for the scripts.
+import deep_to_var
+import shared
+
+
+###############################################################################
+
+
+def search_one_by_one(rules, text):
+    '''Find the first of `rules` that matches `text`, the way it used to be.'''
+    for name, pattern in rules:
+        match = pattern.search(text)
+        if match:
+            return (name, match.groups())
+    return (None, None)
+
+
+def make_extra_rules(n_rules):
+    '''
+    Make `n_rules` rules that look like the rules of a plugin.
+
+    Each of them is a different ORM-like getter, so few lines match any.
+    '''
+    return [
+        ('extra_%d' % i,
+         r'''([a-zA-Z_][0-9a-zA-Z_]*)\.manager_%d\.(?:fetch|load)\(.*\)$'''
+                                                                          % i)
+        for i in range(n_rules)
+    ]
+
+
+def make_query_chains(n_calls):
+    '''Make lines with query chains of `n_calls` calls that match no rule.'''
+    calls = '.filter(x == 1)' * n_calls + '.all()'
+    return ['q = session.query(User)' + calls, 'q = User.query' + calls]
+
+
+def read_corpus(folders):
+    '''Get the stripped, non-empty lines of the Python files in `folders`.'''
+    lines = []
+    for folder in folders:
+        for path, _, file_names in os.walk(folder):
+            for file_name in sorted(file_names):
+                if file_name.endswith('.py'):
+                    with open(os.path.join(path, file_name)) as file:
+                        lines.extend(line.strip() for line in file
+                                     if line.strip())
+    return lines
+
+
+def _time(function, n_runs):
+    '''Get the best time of `n_runs` runs of `function`, in milliseconds.'''
+    return min(timeit.repeat(function, number=1, repeat=n_runs)) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument(
+        '--corpus', nargs='+',
+        default=[os.path.join(os.path.dirname(benchmarks_folder), 'scripts')],
+        help='Folders whose Python files make the corpus.'
+    )
+    parser.add_argument('--rounds', type=int, default=5,
+                        help='Number of times to double the extra rules.')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Number of runs per round; the best one counts.')
+    arguments = parser.parse_args(argv)
+
+    lines = read_corpus(arguments.corpus)
+    base_rules = deep_to_var.rule_set.rules
+    print('%d lines, %d matched by deep_to_var\'s rules.\n' % (
+        len(lines),
+        sum(deep_to_var.rule_set.search(line)[0] is not None for line in lines)
+    ))
+    print('%-8s %16s %16s' % ('rules', 'one by one us', 'rule set us'))
+    for i in range(arguments.rounds + 1):
+        rules = base_rules + make_extra_rules(8 * 2 ** i - 8 if i else 0)
+        rule_set = shared.RuleSet(rules)
+        compiled_rules = rule_set.rules
+        for line in lines:
+            assert rule_set.search(line) == \
+                                     search_one_by_one(compiled_rules, line)
+        one_by_one_time = _time(
+            lambda: [search_one_by_one(compiled_rules, line) for line in
+                     lines],
+            arguments.runs
+        )
+        rule_set_time = _time(
+            lambda: [rule_set.search(line) for line in lines], arguments.runs
+        )
+        print('%-8d %16.2f %16.2f' % (
+            len(rules), one_by_one_time * 1000 / len(lines),
+            rule_set_time * 1000 / len(lines)
+        ))
+
+    print('\n%-8s %16s' % ('calls', 'chain ms'))
+    for i in range(arguments.rounds + 1):
+        chains = make_query_chains(24 * 2 ** i)
+        for chain in chains:
+            assert deep_to_var.rule_set.search(chain) == (None, None)
+        chain_time = _time(
+            lambda: [deep_to_var.rule_set.search(chain) for chain in chains],
+            arguments.runs
+        ) / len(chains)
+        assert chain_time < 100
+        print('%-8d %16.3f' % (24 * 2 ** i, chain_time))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
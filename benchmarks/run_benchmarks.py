@@ -0,0 +1,562 @@
+# Copyright 2009-2014 Ram Rachum.
+# This program is distributed under the MIT license.
+
+'''
+Benchmark the script commands headless, against big documents.
+
+This runs the commands in `scripts/` against the in-memory `wingapi`
+stand-in in `wing_stand_in/`, on a synthetic module and on any real files you
+give it, and reports latency percentiles and the number of API calls made per
+command invocation.
+
+Run with Python 2.7, like Wing does:
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --lines 20000 --file path/to/big.py
+    python benchmarks/run_benchmarks.py --only "cute-word|argument"
+
+Save a baseline and later compare against it to catch regressions:
+
+    python benchmarks/run_benchmarks.py --save baseline.json
+    python benchmarks/run_benchmarks.py --compare baseline.json
+'''
+
+from __future__ import division
+from __future__ import with_statement
+
+import os.path, sys
+benchmarks_folder = os.path.dirname(os.path.abspath(__file__))
+scripts_folder = os.path.join(os.path.dirname(benchmarks_folder), 'scripts')
+sys.path[:0] = [os.path.join(benchmarks_folder, 'wing_stand_in')]
+sys.path += [
+    scripts_folder,
+    os.path.join(scripts_folder, 'third_party.zip'),
+]
+
+import argparse
+import collections
+import importlib
+import json
+import random
+import re
+import shutil
+import tempfile
+import timeit
+
+import wingapi
+
+
+###############################################################################
+
+
+_synthetic_templates = (
+'''
+
+class %(Camel)sManager(BaseManager):
+    """
+    Manage %(name)s objects, with %(number)s retries by default.
+
+    Call `get_%(name)s(pk=7)` to fetch one.
+    """
+    MAX_%(NAME)s_COUNT = %(number)s
+
+    def __init__(self, %(name)s_factory, timeout=%(number)s.5, **kwargs):
+        super(%(Camel)sManager, self).__init__(**kwargs)
+        self.%(name)s_factory = %(name)s_factory
+        self._cache = {} # Maps pk to %(name)s
+        self.timeout = timeout * 2 + 0.25
+
+    def get_%(name)s(self, pk, default=None):
+        if pk in self._cache and not self.is_stale(pk):
+            return self._cache[pk]
+        %(name)s = self.%(name)s_factory.objects.get(pk=pk, active=True)
+        self._cache[pk] = %(name)s
+        return %(name)s
+''',
+'''
+def compute_%(name)s_total(items, start=0, scale=%(number)s):
+    total = start
+    for item in items:
+        total += item.value * scale - (item.discount or 0)
+        total -= max(item.fee, %(number)s) // 3
+    result_%(name)s = dict(total=total, count=len(items),
+                           label='%(name)s total: %%s' %% total,
+                           flags=[True, False, None])
+    return result_%(name)s
+''',
+'''
+%(NAME)s_QUERY = \'\'\'
+    SELECT id, name, created_at FROM %(name)s_table
+    WHERE created_at > %%s AND status = 'active'
+    ORDER BY created_at DESC LIMIT %(number)s
+\'\'\'
+
+%(name)sHandlerMap = {
+    'start': handle_start, "end": handle_end, # Opposites.
+    'width': compute_width(%(number)s, height=get_height(%(number)s)),
+}
+''',
+'''
+@decorator(%(number)s)
+def process_%(name)s(request, first_%(name)s, last_%(name)s=None, *args):
+    if first_%(name)s is not None and last_%(name)s >= %(number)s:
+        raise ValueError("Can't process %(name)s number %%d" %% last_%(name)s)
+    response = render(request, 'app/%(name)s.html',
+                      {'%(name)s': first_%(name)s, 'items': get_items()})
+    x, y = os.path.join(settings.BASE_DIR, '%(name)s'), response.status_code
+    return response if x and y else HttpResponse(status=%(number)s)
+''',
+)
+
+_synthetic_words = ('banana', 'directory', 'widget', 'rocket', 'invoice',
+                    'cache', 'payload', 'request', 'column', 'matrix')
+
+
+def make_synthetic_module(n_lines, seed=0):
+    '''Make Python source of about `n_lines` lines in a realistic mix.'''
+    random_ = random.Random(seed)
+    chunks = ['# Synthetic module for benchmarks.\n\nimport os.path\n']
+    total_lines = 3
+    i = 0
+    while total_lines < n_lines:
+        word = '%s%d' % (random_.choice(_synthetic_words), i)
+        chunk = random_.choice(_synthetic_templates) % {
+            'name': word,
+            'NAME': word.upper(),
+            'Camel': word.capitalize(),
+            'number': random_.randint(1, 9999),
+        }
+        chunks.append(chunk)
+        total_lines += chunk.count('\n')
+        i += 1
+    return ''.join(chunks)
+
+
+###############################################################################
+
+
+class BenchmarkContext(object):
+    '''Everything a benchmark needs: The application, editor and document.'''
+    def __init__(self, application, editor, project_folder):
+        self.application = application
+        self.editor = editor
+        self.document = editor.GetDocument()
+        self.project_folder = project_folder
+
+
+class Benchmark(object):
+    '''
+    A single measured operation.
+
+    `function` is called with `(context, position)` after the caret was put
+    in `position`. Set `mutates=True` for operations that change the
+    document, so it'll be restored after each run.
+    '''
+    def __init__(self, name, function, mutates=False):
+        self.name = name
+        self.function = function
+        self.mutates = mutates
+
+
+def _command(command_name, **kwargs):
+    '''Make a benchmark function that runs `command_name` like Wing does.'''
+    def run(context, position):
+        context.application._execute_command(command_name, context.editor,
+                                             kwargs)
+    return run
+
+
+def _key_repeat(command_name, n_repeats, **kwargs):
+    '''
+    Make a benchmark function that runs `command_name` `n_repeats` times.
+
+    This is like holding down a key: the invocations pile up before Wing gets
+    back to its event loop and runs the timeouts installed meanwhile.
+    '''
+    def run(context, position):
+        for _ in range(n_repeats):
+            context.application._execute_command(command_name, context.editor,
+                                                 kwargs)
+        context.application._run_timeouts()
+    return run
+
+
+def _while_typing(command_name, **kwargs):
+    '''
+    Make a benchmark function that runs `command_name` in half-typed code.
+    
+    A call that's still being typed is inserted in `position` first, so the
+    statement around it doesn't parse.
+    '''
+    def run(context, position):
+        context.document.InsertChars(position, 'foo(bar, baz=')
+        context.editor.SetSelection(position + 6, position + 6)
+        context.application._execute_command(command_name, context.editor,
+                                             kwargs)
+    return run
+
+
+def _format_string(context, position):
+    import edit_string
+    text = context.document.GetCharRange(position, position + 2000)
+    edit_string.format_string(text, starting_column=8)
+
+
+def _go_to_project_frame(direction):
+    def run(context, position):
+        import navigate_project_frames
+        run_state = context.application.GetDebugger().GetCurrentRunState()
+        run_state._frame_index = len(run_state._stack) // 2
+        if direction == -1:
+            navigate_project_frames.go_up_to_project_frame(
+                                       application=context.application)
+        else:
+            navigate_project_frames.go_down_to_project_frame(
+                                       application=context.application)
+    return run
+
+
+def _django_toggle(from_template):
+    def run(context, position):
+        import django_toggle_between_view_and_template as django_toggle
+        application = context.application
+        number = position % _n_django_views
+        folder = context.project_folder
+        if from_template:
+            file_path = os.path.join(folder, 'templates', 'app',
+                                     'page_%d.html' % number)
+        else:
+            file_path = os.path.join(folder, 'app', 'views_%d.py' % number)
+        application.OpenEditor(file_path)
+        try:
+            django_toggle.django_toggle_between_view_and_template()
+        finally:
+            application._active_editor = context.editor
+    return run
+
+
+benchmarks = [
+    Benchmark('cute-word forward', _command('cute-word')),
+    Benchmark('cute-word backward', _command('cute-word', direction=-1)),
+    Benchmark('cute-word extend', _command('cute-word', extend=True)),
+    Benchmark('cute-word traverse', _command('cute-word', traverse=True)),
+    Benchmark('cute-word delete', _command('cute-word', delete=True),
+              mutates=True),
+    Benchmark('cute-word forward x10', _key_repeat('cute-word', 10)),
+    Benchmark('cute-word forward count=10',
+              _command('cute-word', count=10)),
+    Benchmark('cute-word forward x10 coalesced',
+              _key_repeat('cute-word', 10, coalesce=True)),
+    Benchmark('cute-word delete x10', _key_repeat('cute-word', 10,
+                                                  delete=True),
+              mutates=True),
+    Benchmark('cute-word delete x10 coalesced',
+              _key_repeat('cute-word', 10, delete=True, coalesce=True),
+              mutates=True),
+    Benchmark('select-next-invocation', _command('select-next-invocation')),
+    Benchmark('select-prev-invocation', _command('select-prev-invocation')),
+    Benchmark('select-next-argument', _command('select-next-argument')),
+    Benchmark('select-prev-argument', _command('select-prev-argument')),
+    Benchmark('select-next-argument keywords',
+              _command('select-next-argument', limit_to_keywords=True)),
+    Benchmark('select-next-argument while typing',
+              _while_typing('select-next-argument'), mutates=True),
+    Benchmark('select-next-lhs', _command('select-next-lhs')),
+    Benchmark('select-prev-lhs', _command('select-prev-lhs')),
+    Benchmark('select-next-rhs', _command('select-next-rhs')),
+    Benchmark('select-prev-rhs', _command('select-prev-rhs')),
+    Benchmark('select-next-number', _command('select-next-number')),
+    Benchmark('select-prev-number', _command('select-prev-number')),
+    Benchmark('select-next-operator', _command('select-next-operator')),
+    Benchmark('select-next-assignment', _command('select-next-assignment')),
+    Benchmark('select-next-constant', _command('select-next-constant')),
+    Benchmark('select-next-camelcase', _command('select-next-camelcase')),
+    Benchmark('select-next-dotted', _command('select-next-dotted')),
+    Benchmark('select-next-scope-name', _command('select-next-scope-name')),
+    Benchmark('select-prev-scope-name', _command('select-prev-scope-name')),
+    Benchmark('select-next-sibling-scope-name',
+              _command('select-next-sibling-scope-name')),
+    Benchmark('select-enclosing-scope-name',
+              _command('select-enclosing-scope-name')),
+    Benchmark('select-expression', _command('select-expression')),
+    Benchmark('select-expression while typing',
+              _while_typing('select-expression'), mutates=True),
+    Benchmark('select-dotted-name', _command('select-dotted-name')),
+    Benchmark('select-whitespaceless-name',
+              _command('select-whitespaceless-name')),
+    Benchmark('select-next-string', _command('select-next-string')),
+    Benchmark('select-prev-string inner',
+              _command('select-prev-string', inner=True)),
+    Benchmark('brace-match-inner', _command('brace-match-inner')),
+    Benchmark('previous-brace-match', _command('previous-brace-match')),
+    Benchmark('reverse-selection', _command('reverse-selection')),
+    Benchmark('forward-half-page', _command('forward-half-page')),
+    Benchmark('backward-half-page', _command('backward-half-page')),
+    Benchmark('cute-start-select-line', _command('cute-start-select-line')),
+    Benchmark('flip', _command('flip'), mutates=True),
+    Benchmark('flip-case', _command('flip-case'), mutates=True),
+    Benchmark('arg-to-attr', _command('arg-to-attr'), mutates=True),
+    Benchmark('instantiate', _command('instantiate'), mutates=True),
+    Benchmark('unpack-tuple-to-one', _command('unpack-tuple-to-one'),
+              mutates=True),
+    Benchmark('deep-to-var', _command('deep-to-var'), mutates=True),
+    Benchmark('for-thing-in-things', _command('for-thing-in-things'),
+              mutates=True),
+    Benchmark('dict-direct-to-get', _command('dict-direct-to-get'),
+              mutates=True),
+    Benchmark('implicit-getattr-to-explicit',
+              _command('implicit-getattr-to-explicit'), mutates=True),
+    Benchmark('slash-line', _command('slash-line'), mutates=True),
+    Benchmark('push-line-to-end', _command('push-line-to-end'),
+              mutates=True),
+    Benchmark('cute-open-line stand-ground',
+              _command('cute-open-line', stand_ground=True), mutates=True),
+    Benchmark('comment-hr', _command('comment-hr'), mutates=True),
+    Benchmark('guess-class-name', _command('guess-class-name'),
+              mutates=True),
+    Benchmark('edit-string format_string', _format_string),
+    Benchmark('go-up-to-project-frame', _go_to_project_frame(-1)),
+    Benchmark('go-down-to-project-frame', _go_to_project_frame(1)),
+    Benchmark('django-toggle from template', _django_toggle(True)),
+    Benchmark('django-toggle from view', _django_toggle(False)),
+]
+
+_script_modules = (
+    'arg_to_attr', 'brace_matching', 'backward_half_page', 'comment_hr',
+    'cute_open_line', 'cute_start_select_line', 'cute_word', 'deep_to_var',
+    'dict_direct_to_get', 'django_toggle_between_view_and_template',
+    'edit_string', 'flip', 'flip_case', 'for_thing_in_things',
+    'forward_half_page', 'guess_class_name', 'implicit_getattr_to_explicit',
+    'instantiate', 'navigate_project_frames', 'push_line_to_end',
+    'reverse_selection', 'selecting_assignments', 'selecting_camelcase',
+    'selecting_constants', 'selecting_dotted', 'selecting_invocations',
+    'selecting_numbers', 'selecting_operators', 'selecting_stuff',
+    'slash_line', 'string_selecting', 'unpack_tuple_to_one',
+)
+
+
+###############################################################################
+
+
+_n_django_views = 200
+
+
+def _make_project_folder(n_project_files):
+    '''
+    Make a temporary Django-like project with views and templates.
+
+    Returns `(folder, file_paths)`, where `file_paths` has `n_project_files`
+    paths, the real Django files plus made-up paths that don't exist on disk.
+    '''
+    folder = tempfile.mkdtemp(prefix='cute-wing-stuff-benchmark-')
+    os.makedirs(os.path.join(folder, 'app'))
+    os.makedirs(os.path.join(folder, 'templates', 'app'))
+    file_paths = []
+    for i in range(_n_django_views):
+        view_file_path = os.path.join(folder, 'app', 'views_%d.py' % i)
+        template_file_path = os.path.join(folder, 'templates', 'app',
+                                          'page_%d.html' % i)
+        with open(view_file_path, 'w') as file:
+            file.write(
+                'class PageView(TemplateView):\n'
+                '    template_name = \'app/page_%d.html\'\n' % i
+            )
+        with open(template_file_path, 'w') as file:
+            file.write('<html>%d</html>\n' % i)
+        file_paths += [view_file_path, template_file_path]
+    for i in range(max(n_project_files - len(file_paths), 0)):
+        file_paths.append(os.path.join(folder, 'lib', 'package_%d' % (i // 50),
+                                       'module_%d.py' % i))
+    return folder, file_paths
+
+
+def _make_stack(project_file_paths, depth, seed=0):
+    '''Make a debugger stack mixing project frames and library frames.'''
+    random_ = random.Random(seed)
+    stack = []
+    for i in range(depth):
+        if random_.random() < 0.3:
+            file_path = random_.choice(project_file_paths)
+        else:
+            file_path = '/usr/lib/python2.7/site-packages/framework/' \
+                                                       'layer_%d.py' % i
+        stack.append((file_path, i + 1, None, 'function_%d' % i, None))
+    return stack
+
+
+def _percentile(sorted_values, fraction):
+    '''Get a percentile from `sorted_values` using the nearest-rank method.'''
+    if not sorted_values:
+        return float('nan')
+    index = min(int(round(fraction * (len(sorted_values) - 1))),
+                len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_benchmark(benchmark, context, n_runs, seed=0):
+    '''
+    Run `benchmark` `n_runs` times from random caret positions.
+
+    Returns a dict of statistics.
+    '''
+    random_ = random.Random(seed)
+    document = context.document
+    editor = context.editor
+    original_text = document._text
+    durations = []
+    api_call_counts = []
+    n_errors = 0
+    for _ in range(n_runs):
+        position = random_.randint(0, len(document._text))
+        editor.SetSelection(position, position)
+        undo_depth = len(document._undo_stack)
+        wingapi.reset_api_calls()
+        start_time = timeit.default_timer()
+        try:
+            benchmark.function(context, position)
+        except Exception:
+            n_errors += 1
+        durations.append(timeit.default_timer() - start_time)
+        api_call_counts.append(sum(wingapi.api_calls.values()))
+        if benchmark.mutates:
+            # Undoing rather than resetting the text, so per-document indexes
+            # get patched the way they would be in a real editing session.
+            while len(document._undo_stack) > undo_depth:
+                document._undo()
+            if document._text != original_text:
+                document._replace(0, len(document._text), original_text)
+    durations.sort()
+    return {
+        'runs': n_runs,
+        'errors': n_errors,
+        'p50': _percentile(durations, 0.5) * 1000,
+        'p90': _percentile(durations, 0.9) * 1000,
+        'p99': _percentile(durations, 0.99) * 1000,
+        'max': durations[-1] * 1000,
+        'api_calls': sum(api_call_counts) / n_runs,
+    }
+
+
+def _print_table(document_name, results):
+    print('\n%s' % document_name)
+    print('%-36s %5s %4s %9s %9s %9s %9s %10s' % (
+        'command', 'runs', 'err', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms',
+        'API calls'
+    ))
+    for name, statistics in results:
+        print('%-36s %5d %4d %9.3f %9.3f %9.3f %9.3f %10.1f' % (
+            name, statistics['runs'], statistics['errors'],
+            statistics['p50'], statistics['p90'], statistics['p99'],
+            statistics['max'], statistics['api_calls']
+        ))
+
+
+def _compare(all_results, baseline, tolerance):
+    '''Print regressions against `baseline`. Returns whether there were any.'''
+    regressions = []
+    for document_name, results in all_results.items():
+        baseline_results = baseline.get(document_name, {})
+        for name, statistics in results:
+            if name not in baseline_results:
+                continue
+            old_statistics = baseline_results[name]
+            for key in ('p50', 'api_calls'):
+                # (Small absolute differences are just noise.)
+                if statistics[key] > old_statistics[key] * tolerance and \
+                                statistics[key] - old_statistics[key] > 0.05:
+                    regressions.append(
+                        '%s: %s: %s went from %.3f to %.3f' % (
+                            document_name, name, key, old_statistics[key],
+                            statistics[key]
+                        )
+                    )
+    if regressions:
+        print('\nRegressions:')
+        for regression in regressions:
+            print('    %s' % regression)
+    else:
+        print('\nNo regressions.')
+    return bool(regressions)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--lines', type=int, default=20000,
+                        help='Size of the synthetic module, in lines.')
+    parser.add_argument('--file', action='append', default=[],
+                        help='Also benchmark on this real file. Repeatable.')
+    parser.add_argument('--runs', type=int, default=30,
+                        help='Number of runs per command per document.')
+    parser.add_argument('--only', default=None,
+                        help='Regex; run only benchmarks whose name matches.')
+    parser.add_argument('--project-files', type=int, default=2000,
+                        help='Number of files in the simulated project.')
+    parser.add_argument('--stack-depth', type=int, default=80,
+                        help='Depth of the simulated debugger stack.')
+    parser.add_argument('--save', default=None,
+                        help='Save results as JSON to this path.')
+    parser.add_argument('--compare', default=None,
+                        help='Compare against results saved with `--save`.')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='Ratio above baseline counted as a regression.')
+    arguments = parser.parse_args(argv)
+
+    application = wingapi.gApplication
+    for module_name in _script_modules:
+        application._add_script_commands(importlib.import_module(module_name))
+
+    project_folder, project_file_paths = \
+                                _make_project_folder(arguments.project_files)
+    application.GetProject()._file_paths = project_file_paths
+    application.GetProject()._filename = os.path.join(project_folder,
+                                                      'benchmark.wpr')
+    application.GetDebugger().GetCurrentRunState()._pause(
+        _make_stack(project_file_paths, arguments.stack_depth)
+    )
+
+    documents = [('synthetic %d lines' % arguments.lines,
+                  make_synthetic_module(arguments.lines))]
+    for file_path in arguments.file:
+        with open(file_path) as file:
+            documents.append((file_path, file.read()))
+
+    selected_benchmarks = [
+        benchmark for benchmark in benchmarks if arguments.only is None or
+                                      re.search(arguments.only, benchmark.name)
+    ]
+
+    all_results = collections.OrderedDict()
+    try:
+        for document_name, text in documents:
+            editor = wingapi.open_document(
+                text, os.path.join(project_folder, 'synthetic_module.py')
+            )
+            context = BenchmarkContext(application, editor, project_folder)
+            results = []
+            for benchmark in selected_benchmarks:
+                results.append((benchmark.name,
+                                run_benchmark(benchmark, context,
+                                              arguments.runs)))
+            wingapi.close_editor(editor)
+            all_results[document_name] = results
+            _print_table(document_name, results)
+    finally:
+        shutil.rmtree(project_folder, ignore_errors=True)
+
+    if arguments.save:
+        with open(arguments.save, 'w') as file:
+            json.dump(
+                dict((document_name, dict(results)) for (document_name, results)
+                     in all_results.items()),
+                file, indent=4, sort_keys=True
+            )
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            baseline = json.load(file)
+        if _compare(all_results, baseline, arguments.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
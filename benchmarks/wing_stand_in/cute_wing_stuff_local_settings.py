@@ -0,0 +1,15 @@
+# Copyright 2009-2014 Ram Rachum.
+# This program is distributed under the MIT license.
+
+'''
+Local settings for the scripts when they run under the benchmarks.
+
+This keeps the cache files that the scripts save between sessions out of your
+home folder.
+'''
+
+import os.path
+import tempfile
+
+cache_folder = os.path.join(tempfile.gettempdir(),
+                            'cute-wing-stuff-benchmark-cache')
@@ -0,0 +1,6 @@
+# Copyright 2009-2014 Ram Rachum.
+# This program is distributed under the MIT license.
+
+'''Stand-in for Wing's internal `edit.editor` module: Character types.'''
+
+from wingapi import kCodeCharType, kStringCharType, kCommentCharType
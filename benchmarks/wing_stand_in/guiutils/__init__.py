@@ -0,0 +1,9 @@
+# Copyright 2009-2014 Ram Rachum.
+# This program is distributed under the MIT license.
+
+'''
+Stand-in for Wing's internal `guiutils` package.
+
+There's no GUI when running headless; these modules exist only so scripts
+that build dialogs can be imported and have their non-GUI parts measured.
+'''
@@ -0,0 +1,4 @@
+# Copyright 2009-2014 Ram Rachum.
+# This program is distributed under the MIT license.
+
+'''Stand-in for Wing's internal `guiutils.dialogs` module. Has no dialogs.'''
@@ -0,0 +1,9 @@
+# Copyright 2009-2014 Ram Rachum.
+# This program is distributed under the MIT license.
+
+'''Stand-in for Wing's internal `guiutils.wgtk` module. Has no widgets.'''
+
+
+class Qt(object):
+    Unchecked = 0
+    Checked = 2
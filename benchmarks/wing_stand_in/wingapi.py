@@ -0,0 +1,820 @@
+# Copyright 2009-2014 Ram Rachum.
+# This program is distributed under the MIT license.
+
+'''
+In-memory stand-in for Wing's `wingapi` module.
+
+This lets the scripts in `scripts/` run without a running IDE, so we can
+measure how they behave on big files. Only the parts of the API that the
+scripts actually use are implemented. Every API call is counted in
+`api_calls`, so benchmarks can report how chatty each command is.
+
+Documents emit the `modified` signal, (the API-level face of Wing's
+`text-modified`,) with arguments `(insert, position, length, text, lines)`.
+'''
+
+from __future__ import with_statement
+
+import bisect
+import collections
+import functools
+import inspect
+import re
+import tokenize
+import StringIO
+
+
+api_calls = collections.Counter()
+'''Number of calls made to each API method, like `CAPIDocument.GetLength`.'''
+
+
+def reset_api_calls():
+    '''Reset the `api_calls` counter.'''
+    api_calls.clear()
+
+
+def _api_call(method):
+    '''Decorator for counting calls to an API method in `api_calls`.'''
+    @functools.wraps(method)
+    def inner(self, *args, **kwargs):
+        api_calls['%s.%s' % (self._api_name, method.__name__)] += 1
+        return method(self, *args, **kwargs)
+    return inner
+
+
+class _ArgMarker(object):
+    '''Marker for an argument that Wing fills in when running a command.'''
+    def __init__(self, name):
+        self.name = name
+    def __repr__(self):
+        return '<%s>' % self.name
+
+kArgEditor = _ArgMarker('kArgEditor')
+kArgDocument = _ArgMarker('kArgDocument')
+kArgApplication = _ArgMarker('kArgApplication')
+kArgProject = _ArgMarker('kArgProject')
+kArgDebugger = _ArgMarker('kArgDebugger')
+
+
+class CArgInfo(object):
+    def __init__(self, label=None, type=None, formlet=None, doc=''):
+        self.label = label
+        self.type = type
+        self.formlet = formlet
+        self.doc = doc
+
+
+class _SignalSource(object):
+    '''Mixin providing Wing-style `Connect`/`Disconnect` signals.'''
+
+    def _init_signals(self):
+        self._signal_callbacks = collections.OrderedDict()
+        self._next_signal_id = 1
+
+    def Connect(self, signal, callback):
+        signal_id = self._next_signal_id
+        self._next_signal_id += 1
+        self._signal_callbacks[signal_id] = (signal, callback)
+        return signal_id
+
+    def Disconnect(self, signal_id):
+        self._signal_callbacks.pop(signal_id, None)
+
+    # Some Wing objects spell these in lower case:
+    connect = Connect
+    disconnect = Disconnect
+
+    def _emit(self, signal, *args):
+        for connected_signal, callback in self._signal_callbacks.values():
+            if connected_signal == signal:
+                callback(*args)
+
+
+###############################################################################
+
+
+_line_break_pattern = re.compile(r'\r\n|\r|\n')
+
+kCodeCharType = 0
+kStringCharType = 1
+kCommentCharType = 2
+
+
+class CAPIDocument(_SignalSource):
+    '''An in-memory document.'''
+
+    _api_name = 'CAPIDocument'
+
+    def __init__(self, text='', filename='untitled.py'):
+        self._init_signals()
+        self._text = text
+        self._filename = filename
+        self._line_starts = None
+        self._char_types = None
+        self._undo_depth = 0
+        self._undo_stack = []
+        self._current_undo_group = None
+
+    def _get_line_starts(self):
+        if self._line_starts is None:
+            self._line_starts = [0] + [
+                match.end() for match in
+                _line_break_pattern.finditer(self._text)
+            ]
+        return self._line_starts
+
+    def _get_char_types(self):
+        '''Get (starts, types) runs of character types, like Scintilla's.'''
+        if self._char_types is None:
+            self._char_types = _lex_char_types(self._text,
+                                               self._get_line_starts())
+        return self._char_types
+
+    def _get_char_type(self, position):
+        run_starts, run_types = self._get_char_types()
+        return run_types[bisect.bisect_right(run_starts, position) - 1]
+
+    def _replace(self, start, end, new_text):
+        '''Replace `[start, end)` with `new_text`, keeping undo and signals.'''
+        old_text = self._text[start:end]
+        if not old_text and not new_text:
+            return
+        if self._current_undo_group is not None:
+            self._current_undo_group.append((start, old_text, new_text))
+        else:
+            self._undo_stack.append([(start, old_text, new_text)])
+        self._text = self._text[:start] + new_text + self._text[end:]
+        self._line_starts = self._char_types = None
+        if old_text:
+            self._emit('modified', False, start, len(old_text), old_text,
+                       len(_line_break_pattern.findall(old_text)))
+        if new_text:
+            self._emit('modified', True, start, len(new_text), new_text,
+                       len(_line_break_pattern.findall(new_text)))
+        for editor in _editors:
+            if editor._document is self:
+                editor._adjust_selection(start, len(old_text), len(new_text))
+
+    @_api_call
+    def GetFilename(self):
+        return self._filename
+
+    @_api_call
+    def GetLength(self):
+        return len(self._text)
+
+    @_api_call
+    def GetText(self):
+        return unicode(self._text)
+
+    @_api_call
+    def SetText(self, text):
+        self._replace(0, len(self._text), text)
+
+    @_api_call
+    def GetCharRange(self, start, end):
+        return self._text[max(start, 0):max(end, 0)]
+
+    @_api_call
+    def InsertChars(self, position, text):
+        self._replace(position, position, text)
+
+    @_api_call
+    def DeleteChars(self, start, end):
+        '''Delete characters from `start` to `end`, inclusive, like Wing.'''
+        self._replace(start, end + 1, '')
+
+    @_api_call
+    def GetLineCount(self):
+        return len(self._get_line_starts())
+
+    @_api_call
+    def GetLineNumberFromPosition(self, position):
+        return bisect.bisect_right(self._get_line_starts(), position) - 1
+
+    @_api_call
+    def GetLineStart(self, line_number):
+        line_starts = self._get_line_starts()
+        line_number = min(max(line_number, 0), len(line_starts) - 1)
+        return line_starts[line_number]
+
+    @_api_call
+    def GetLineEnd(self, line_number):
+        return self._get_line_end(line_number)
+
+    def _get_line_end(self, line_number):
+        line_starts = self._get_line_starts()
+        line_number = min(max(line_number, 0), len(line_starts) - 1)
+        if line_number == len(line_starts) - 1:
+            return len(self._text)
+        end = line_starts[line_number + 1]
+        line_break = _line_break_pattern.search(self._text,
+                                                line_starts[line_number])
+        return line_break.start() if line_break else end
+
+    @_api_call
+    def BeginUndoAction(self):
+        if self._undo_depth == 0:
+            self._current_undo_group = []
+        self._undo_depth += 1
+
+    @_api_call
+    def EndUndoAction(self):
+        assert self._undo_depth >= 1
+        self._undo_depth -= 1
+        if self._undo_depth == 0:
+            if self._current_undo_group:
+                self._undo_stack.append(self._current_undo_group)
+            self._current_undo_group = None
+
+    def _undo(self):
+        '''Undo the last undoable action.'''
+        if not self._undo_stack:
+            return
+        group = self._undo_stack.pop()
+        for start, old_text, new_text in reversed(group):
+            self._replace(start, start + len(new_text), old_text)
+            self._undo_stack.pop() # `_replace` recorded the undo itself
+
+
+def _lex_char_types(text, line_starts):
+    '''
+    Find runs of code, string and comment characters in Python `text`.
+
+    Returns `(run_starts, run_types)`. Falls back to treating the rest of the
+    document as code when the text can't be tokenized.
+    '''
+    run_starts = [0]
+    run_types = [kCodeCharType]
+
+    def mark(start, end, char_type):
+        if run_starts[-1] == start:
+            run_types[-1] = char_type
+        else:
+            run_starts.append(start)
+            run_types.append(char_type)
+        run_starts.append(end)
+        run_types.append(kCodeCharType)
+
+    readline = StringIO.StringIO(text).readline
+    try:
+        for token in tokenize.generate_tokens(readline):
+            token_type, _, (start_row, start_column), (end_row, end_column), \
+                                                                      _ = token
+            if token_type == tokenize.STRING:
+                char_type = kStringCharType
+            elif token_type == tokenize.COMMENT:
+                char_type = kCommentCharType
+            else:
+                continue
+            mark(line_starts[start_row - 1] + start_column,
+                 line_starts[end_row - 1] + end_column, char_type)
+    except (tokenize.TokenError, IndentationError, IndexError):
+        pass
+    return run_starts, run_types
+
+
+###############################################################################
+
+
+_editors = []
+
+
+class _CEditorInternals(object):
+    '''Stand-in for the `fEditor` object that some scripts reach into.'''
+
+    _api_name = 'fEditor'
+
+    def __init__(self, editor):
+        self._editor = editor
+
+    @_api_call
+    def GetCharType(self, position):
+        return self._editor._document._get_char_type(position)
+
+    @_api_call
+    def _CalcNaturalIndent(self, line_number):
+        document = self._editor._document
+        line_start = document._get_line_starts()[line_number]
+        line = document._text[line_start:document._get_line_end(line_number)]
+        indent_string = line[:len(line) - len(line.lstrip(' \t'))]
+        return len(indent_string.expandtabs()), indent_string
+
+
+class CAPIEditor(_SignalSource):
+    '''An editor showing a `CAPIDocument`.'''
+
+    _api_name = 'CAPIEditor'
+
+    def __init__(self, document, application=None):
+        self._init_signals()
+        self._document = document
+        self._application = application
+        self._anchor = self._caret = 0
+        self._first_visible_line = 0
+        self.n_visible_lines = 40
+        self.fEditor = _CEditorInternals(self)
+        _editors.append(self)
+
+    def _adjust_selection(self, position, n_removed, n_inserted):
+        def adjust(offset):
+            if offset <= position:
+                return offset
+            elif offset < position + n_removed:
+                return position + n_inserted
+            else:
+                return offset - n_removed + n_inserted
+        self._anchor = adjust(self._anchor)
+        self._caret = adjust(self._caret)
+
+    @_api_call
+    def GetDocument(self):
+        return self._document
+
+    @_api_call
+    def GetSelection(self):
+        return (min(self._anchor, self._caret),
+                max(self._anchor, self._caret))
+
+    @_api_call
+    def GetAnchorAndCaret(self):
+        return (self._anchor, self._caret)
+
+    @_api_call
+    def SetSelection(self, start, end):
+        length = len(self._document._text)
+        self._anchor = min(max(start, 0), length)
+        self._caret = min(max(end, 0), length)
+        self._emit('selection-changed', self._anchor, self._caret)
+
+    @_api_call
+    def ExecuteCommand(self, command_name, **kwargs):
+        application = self._application or gApplication
+        return application._execute_command(command_name, self, kwargs)
+
+    @_api_call
+    def GetFirstVisibleLine(self):
+        return self._first_visible_line
+
+    @_api_call
+    def GetNumberOfVisibleLines(self):
+        return self.n_visible_lines
+
+    @_api_call
+    def ScrollToLine(self, line_number, select=0, pos='slop', callout=0):
+        self._first_visible_line = min(
+            max(line_number, 0),
+            max(len(self._document._get_line_starts()) - 1, 0)
+        )
+
+
+###############################################################################
+
+
+class CAPIProject(_SignalSource):
+    '''A project holding a list of file paths.'''
+
+    _api_name = 'CAPIProject'
+
+    def __init__(self, file_paths=(), filename=None):
+        self._init_signals()
+        self._file_paths = list(file_paths)
+        self._filename = filename
+
+    @_api_call
+    def GetFilename(self):
+        return self._filename
+
+    @_api_call
+    def GetAllFiles(self):
+        return list(self._file_paths)
+
+    @_api_call
+    def AddFiles(self, file_paths):
+        file_paths = [file_path for file_path in file_paths
+                      if file_path not in self._file_paths]
+        self._file_paths.extend(file_paths)
+        self._emit('files-added', file_paths)
+
+    @_api_call
+    def RemoveFiles(self, file_paths):
+        file_paths = [file_path for file_path in file_paths
+                      if file_path in self._file_paths]
+        for file_path in file_paths:
+            self._file_paths.remove(file_path)
+        self._emit('files-removed', file_paths)
+
+    @_api_call
+    def ExpandEnvVars(self, text):
+        return text
+
+
+class CAPIDebugRunState(_SignalSource):
+    '''
+    The run state of a paused debug process.
+
+    `stack` is a list of `(file_path, line_number, ...)` 5-tuples, outermost
+    frame first, like Wing's.
+    '''
+
+    _api_name = 'CAPIDebugRunState'
+
+    def __init__(self, stack=(), thread_id=1, frame_index=None):
+        self._init_signals()
+        self._stack = list(stack)
+        self._thread_id = thread_id
+        self._frame_index = (len(self._stack) - 1 if frame_index is None
+                             else frame_index)
+
+    @_api_call
+    def GetStack(self):
+        return list(self._stack)
+
+    @_api_call
+    def GetStackFrame(self):
+        return (self._thread_id, self._frame_index)
+
+    @_api_call
+    def SetStackFrame(self, thread_id, frame_index):
+        self._thread_id = thread_id
+        self._frame_index = frame_index
+        self._emit('frame-changed', thread_id, frame_index)
+
+    def _pause(self, stack, thread_id=None, frame_index=None):
+        '''Simulate the debug process pausing with a new `stack`.'''
+        self._stack = list(stack)
+        if thread_id is not None:
+            self._thread_id = thread_id
+        self._frame_index = (len(self._stack) - 1 if frame_index is None
+                             else frame_index)
+        self._emit('paused')
+
+    def _run(self):
+        '''Simulate the debug process continuing to run.'''
+        self._stack = []
+        self._emit('running')
+
+
+class CAPIDebugger(_SignalSource):
+
+    _api_name = 'CAPIDebugger'
+
+    def __init__(self):
+        self._init_signals()
+        self._run_state = CAPIDebugRunState()
+
+    @_api_call
+    def GetCurrentRunState(self):
+        return self._run_state
+
+
+###############################################################################
+
+
+class CAPIApplication(_SignalSource):
+    '''The application, holding editors, the project and the commands.'''
+
+    _api_name = 'CAPIApplication'
+
+    def __init__(self):
+        self._init_signals()
+        self._preferences = {
+            'edit.text-wrap-column': 79,
+            'edit.show-line-numbers': False,
+            'edit.wrap-lines': False,
+        }
+        self._active_editor = None
+        self._clipboard = ''
+        self._project = CAPIProject()
+        self._debugger = CAPIDebugger()
+        self._commands = dict(_builtin_commands)
+        self._timeouts = []
+        self.executed_commands = collections.Counter()
+        self.status_message = None
+
+    def _add_command(self, command_name, function):
+        '''
+        Make `function` available as `command_name` for `ExecuteCommand`.
+
+        `function` is called like Wing calls script commands: Arguments that
+        default to `kArgEditor` and friends are filled in automatically.
+        '''
+        self._commands[command_name] = function
+
+    def _add_script_commands(self, module):
+        '''Add all the public functions in a script module as commands.'''
+        if getattr(module, '_ignore_scripts', False):
+            return
+        for name, value in vars(module).items():
+            if inspect.isfunction(value) and not name.startswith('_') and \
+                                           value.__module__ == module.__name__:
+                self._add_command(name.replace('_', '-'), value)
+
+    def _execute_command(self, command_name, editor, kwargs):
+        match = re.match(r'^([a-z0-9\-]+)(?:\((.*)\))?$', command_name)
+        if match and match.group(2):
+            command_name = match.group(1)
+            kwargs = dict(kwargs, **eval('dict(%s)' % match.group(2)))
+        self.executed_commands[command_name] = \
+                                     self.executed_commands[command_name] + 1
+        try:
+            function = self._commands[command_name]
+        except KeyError:
+            return # Unknown commands are no-ops, but still counted above.
+        return _call_with_arg_markers(function, self, editor, kwargs)
+
+    def _run_timeouts(self):
+        '''Run all the callbacks installed with `InstallTimeout`.'''
+        timeouts, self._timeouts = self._timeouts, []
+        for _, callback in timeouts:
+            callback()
+
+    @_api_call
+    def ExecuteCommand(self, command_name, **kwargs):
+        return self._execute_command(command_name, self._active_editor, kwargs)
+
+    @_api_call
+    def CommandAvailable(self, command_name):
+        return True
+
+    @_api_call
+    def GetActiveEditor(self):
+        return self._active_editor
+
+    @_api_call
+    def GetActiveDocument(self):
+        return self._active_editor._document if self._active_editor else None
+
+    @_api_call
+    def OpenEditor(self, file_path, raise_window=False):
+        for editor in _editors:
+            if editor._document._filename == file_path:
+                break
+        else:
+            with open(file_path) as file:
+                editor = CAPIEditor(CAPIDocument(file.read(), file_path),
+                                    application=self)
+        self._active_editor = editor
+        return editor
+
+    @_api_call
+    def GetPreference(self, name):
+        return self._preferences[name]
+
+    @_api_call
+    def SetPreference(self, name, value):
+        self._preferences[name] = value
+
+    @_api_call
+    def GetClipboard(self):
+        return self._clipboard
+
+    @_api_call
+    def SetClipboard(self, text):
+        self._clipboard = text
+
+    @_api_call
+    def SetStatusMessage(self, message):
+        self.status_message = message
+
+    @_api_call
+    def ShowMessageDialog(self, title, text, buttons=None):
+        self.status_message = text
+
+    @_api_call
+    def InstallTimeout(self, milliseconds, callback):
+        self._timeouts.append((milliseconds, callback))
+
+    @_api_call
+    def GetProject(self):
+        return self._project
+
+    @_api_call
+    def GetDebugger(self):
+        return self._debugger
+
+    @_api_call
+    def GetCurrentSourceScopes(self):
+        return []
+
+
+def _call_with_arg_markers(function, application, editor, kwargs):
+    '''Call `function`, filling in `kArgEditor` and friends like Wing does.'''
+    arg_spec = inspect.getargspec(function)
+    defaults = arg_spec.defaults or ()
+    arg_names_with_defaults = arg_spec.args[len(arg_spec.args) -
+                                                               len(defaults):]
+    kwargs = dict(kwargs)
+    for name, default in zip(arg_names_with_defaults, defaults):
+        if name in kwargs or not isinstance(default, _ArgMarker):
+            continue
+        if default is kArgEditor:
+            kwargs[name] = editor
+        elif default is kArgDocument:
+            kwargs[name] = editor._document if editor else None
+        elif default is kArgApplication:
+            kwargs[name] = application
+        elif default is kArgProject:
+            kwargs[name] = application._project
+        elif default is kArgDebugger:
+            kwargs[name] = application._debugger
+    return function(**kwargs)
+
+
+###############################################################################
+
+
+_identifier_pattern = re.compile(r'[0-9a-zA-Z_]+')
+_word_start_pattern = re.compile(r'(?<![0-9a-zA-Z_])[0-9a-zA-Z_]')
+_word_end_pattern = re.compile(r'[0-9a-zA-Z_](?![0-9a-zA-Z_])')
+_opening_braces = '([{'
+_closing_braces = ')]}'
+
+
+def _move_caret(editor, position):
+    editor.SetSelection(position, position)
+
+
+def _forward_char(editor):
+    _move_caret(editor, editor._caret + 1)
+
+def _backward_char(editor):
+    _move_caret(editor, editor._caret - 1)
+
+def _forward_word(editor):
+    match = _word_end_pattern.search(editor._document._text, editor._caret)
+    _move_caret(editor, match.end() if match else
+                                                len(editor._document._text))
+
+def _backward_word(editor):
+    text = editor._document._text
+    starts = [match.start() for match in
+              _word_start_pattern.finditer(text, 0, editor._caret)]
+    _move_caret(editor, starts[-1] if starts else 0)
+
+def _current_line(editor):
+    document = editor._document
+    line_number = bisect.bisect_right(document._get_line_starts(),
+                                      editor._caret) - 1
+    return (document._get_line_starts()[line_number],
+            document._get_line_end(line_number))
+
+def _beginning_of_line(editor):
+    _move_caret(editor, _current_line(editor)[0])
+
+def _beginning_of_line_text(editor, toggle=True):
+    line_start, line_end = _current_line(editor)
+    line = editor._document._text[line_start:line_end]
+    _move_caret(editor, line_start + len(line) - len(line.lstrip(' \t')))
+
+def _end_of_line(editor):
+    _move_caret(editor, _current_line(editor)[1])
+
+def _new_line(editor):
+    line_start, line_end = _current_line(editor)
+    line = editor._document._text[line_start:line_end]
+    indent = line[:len(line) - len(line.lstrip(' \t'))]
+    start, end = editor.GetSelection()
+    editor._document._replace(start, end, '\n' + indent)
+    _move_caret(editor, start + 1 + len(indent))
+
+def _delete_line(editor):
+    document = editor._document
+    line_number = bisect.bisect_right(document._get_line_starts(),
+                                      editor._caret) - 1
+    line_starts = document._get_line_starts()
+    end = line_starts[line_number + 1] if \
+                 line_number + 1 < len(line_starts) else len(document._text)
+    document._replace(line_starts[line_number], end, '')
+
+def _undo(editor):
+    editor._document._undo()
+
+def _find_brace_pair(text, opening_position):
+    '''Find the closing brace matching the one in `opening_position`.'''
+    depth = 0
+    for i in xrange(opening_position, len(text)):
+        if text[i] in _opening_braces:
+            depth += 1
+        elif text[i] in _closing_braces:
+            depth -= 1
+            if depth == 0:
+                return i
+    return None
+
+def _get_enclosing_brace_spans(text, position):
+    '''Get the spans of all brace pairs around `position`, innermost first.'''
+    spans = []
+    depth = 0
+    for i in xrange(position - 1, -1, -1):
+        if text[i] in _closing_braces:
+            depth += 1
+        elif text[i] in _opening_braces:
+            if depth:
+                depth -= 1
+            else:
+                closing_position = _find_brace_pair(text, i)
+                if closing_position is not None:
+                    spans.append((i, closing_position + 1))
+    return spans
+
+def _brace_match(editor):
+    text = editor._document._text
+    start, end = editor.GetSelection()
+    enclosing_brace_spans = _get_enclosing_brace_spans(text, start)
+    if enclosing_brace_spans:
+        editor.SetSelection(*enclosing_brace_spans[0])
+        return
+    for i in xrange(start, len(text)):
+        if text[i] in _opening_braces:
+            closing_position = _find_brace_pair(text, i)
+            if closing_position is not None:
+                editor.SetSelection(i, closing_position + 1)
+            return
+
+def _select_more(editor):
+    '''
+    Grow the selection to the next bigger syntactic unit.
+
+    This approximates Wing's `select-more`: identifier, whitespace-less run,
+    inside of braces, braces, line, whole document.
+    '''
+    text = editor._document._text
+    start, end = editor.GetSelection()
+    candidates = []
+    for pattern in (_identifier_pattern, re.compile(r'\S+')):
+        for match in pattern.finditer(text, max(start - 200, 0),
+                                      min(end + 200, len(text))):
+            if match.start() <= start and end <= match.end():
+                candidates.append(match.span())
+    for brace_start, brace_end in _get_enclosing_brace_spans(text, start):
+        candidates.append((brace_start + 1, brace_end - 1))
+        candidates.append((brace_start, brace_end))
+    line_start, line_end = _current_line(editor)
+    candidates.append((line_start, max(line_end, end)))
+    candidates.append((0, len(text)))
+    bigger_candidates = [
+        (candidate_start, candidate_end) for (candidate_start, candidate_end)
+        in candidates if candidate_start <= start and end <= candidate_end and
+                            (candidate_start, candidate_end) != (start, end)
+    ]
+    if bigger_candidates:
+        editor.SetSelection(*min(bigger_candidates,
+                                 key=lambda (s, e): (e - s, -s)))
+
+def _no_op(*args, **kwargs):
+    pass
+
+
+def _editor_command(function):
+    '''Wrap an editor command so it gets the editor like a Wing command.'''
+    def command(editor=kArgEditor, **kwargs):
+        return function(editor, **kwargs)
+    return command
+
+_builtin_commands = dict(
+    (command_name, _editor_command(function)) for (command_name, function) in
+    {
+        'forward-char': _forward_char,
+        'backward-char': _backward_char,
+        'forward-word': _forward_word,
+        'backward-word': _backward_word,
+        'beginning-of-line': _beginning_of_line,
+        'home': _beginning_of_line,
+        'beginning-of-line-text': _beginning_of_line_text,
+        'end-of-line': _end_of_line,
+        'new-line': _new_line,
+        'delete-line': _delete_line,
+        'brace-match': _brace_match,
+        'select-more': _select_more,
+        'undo': _undo,
+        'set-visit-history-anchor': _no_op,
+    }.items()
+)
+
+
+###############################################################################
+
+
+gApplication = CAPIApplication()
+
+
+def open_document(text, filename='untitled.py', application=None):
+    '''
+    Create a document with `text`, open it in an editor and make it active.
+
+    Returns the new `CAPIEditor`.
+    '''
+    application = application or gApplication
+    editor = CAPIEditor(CAPIDocument(text, filename), application=application)
+    application._active_editor = editor
+    return editor
+
+
+def close_editor(editor):
+    '''Forget about `editor`, so its document stops getting edit updates.'''
+    if editor in _editors:
+        _editors.remove(editor)
+    for application in (gApplication,):
+        if application._active_editor is editor:
+            application._active_editor = None
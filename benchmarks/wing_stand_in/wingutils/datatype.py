@@ -0,0 +1,10 @@
+# Copyright 2009-2014 Ram Rachum.
+# This program is distributed under the MIT license.
+
+'''Stand-in for Wing's internal `wingutils.datatype` module.'''
+
+
+class CType(object):
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
@@ -0,0 +1,275 @@
+# Copyright 2009-2014 Ram Rachum.
+# This program is distributed under the MIT license.
+
+'''
+Check and benchmark the alpha-word tokenizer that `cute_word` uses.
+
+First this checks, on random text built to hit the edge cases, that
+`cute_word._get_alpha_word_spans_in_text` finds exactly the same spans as the
+three-phase tokenizer it replaced, which is kept here as
+`reference_alpha_word_spans`. Then it reports the throughput of both, in MB/s,
+on a generated module and on a minified version of it.
+
+Run with Python 2.7, like Wing does:
+
+    python benchmarks/word_tokenizer.py
+    python benchmarks/word_tokenizer.py --cases 20000 --lines 50000
+'''
+
+from __future__ import division
+from __future__ import with_statement
+
+import os.path, sys
+benchmarks_folder = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [benchmarks_folder]
+
+import argparse
+import collections
+import random
+import re
+import timeit
+
+import run_benchmarks # Sets up `sys.path` for the scripts.
+import cute_word
+
+
+###############################################################################
+
+
+def reference_alpha_word_spans(text, post_offset=0):
+    '''The three-phase tokenizer `cute_word` used before the regex one.'''
+    
+    # We have three phases here. In the first phase we get words like
+    # `IToldYou_soFooBar`, in the second phase we get words like `IToldYou`,
+    # `soFooBar`, in the third and final phase we get words like `I`, `Told`,
+    # `You`, `so`, `Foo`, `Bar`.
+    
+    pre_pre_alpha_word_spans = cute_word._find_spans(
+        cute_word.alpha_word_pattern, text
+    )
+    pre_alpha_word_spans = collections.deque()
+    alpha_word_spans = []
+    
+    for pre_pre_alpha_word_span in pre_pre_alpha_word_spans:
+        pre_pre_alpha_word = \
+                    text[pre_pre_alpha_word_span[0]:pre_pre_alpha_word_span[1]]
+        relative_middle_underscore_indices = []
+        
+        ### Finding middle underscores: #######################################
+        #                                                                     #
+        saw_non_underscore = False
+        enumerated = list(enumerate(pre_pre_alpha_word))
+        for i, character in enumerated:
+            if character == '_':
+                if saw_non_underscore:
+                    relative_middle_underscore_indices.append(i)
+            else: # character != '_'
+                saw_non_underscore = True
+        for i, character in reversed(enumerated):
+            if character == '_':
+                try:
+                    relative_middle_underscore_indices.remove(i)
+                except ValueError:
+                    pass
+            else: # character != '_'
+                break
+        #                                                                     #
+        ### Finished finding middle underscores. ##############################
+        
+        middle_underscore_indices = map(
+            lambda i: i + pre_pre_alpha_word_span[0],
+            relative_middle_underscore_indices
+        )
+        
+        non_middle_underscore_indices = filter(
+            lambda i: i not in middle_underscore_indices, 
+            xrange(
+                pre_pre_alpha_word_span[0], 
+                pre_pre_alpha_word_span[1] + 1, 
+            )
+        )
+        
+        current_word_span = None
+        for i in non_middle_underscore_indices:
+            if current_word_span is None:
+                current_word_span = [i, i]
+            else: # current_word is not None
+                if current_word_span[1] == i - 1:
+                    current_word_span[1] = i
+                else:
+                    assert i - current_word_span[1] >= 2
+                    pre_alpha_word_spans.append(tuple(current_word_span))
+                    current_word_span = [i, i]
+        if current_word_span:
+            pre_alpha_word_spans.append(tuple(current_word_span))
+        
+            
+    ######################################################################
+    # Finished separating using middle underscores, now separating using
+    # case.
+    
+    # We're popping word spans out of `pre_alpha_word_spans` one-by-one. We
+    # analyze them, sometimes we throw them into `pre_alpha_word_spans`,
+    # which means they're words that are already separated by case, and
+    # sometimes we throw one part of them into `alpha_word_spans`, and
+    # throw the remaining substring back into `pre_alpha_word_spans`, where
+    # it will be analyzed on a later run of the loop.
+    
+    while pre_alpha_word_spans:
+        pre_alpha_word_span = pre_alpha_word_spans.pop()
+        pre_alpha_word = \
+                  text[pre_alpha_word_span[0] : pre_alpha_word_span[1] + 1]
+        alpha_characters = filter(str.isalpha, pre_alpha_word)
+        if not alpha_characters:
+            alpha_word_spans.append(pre_alpha_word_span)
+            continue
+        could_be_lower_case = True
+        could_be_upper_case = True
+        could_be_camel_case = True
+        saw_first_alpha = False
+
+        for i in \
+                xrange(pre_alpha_word_span[0], pre_alpha_word_span[1] + 1):
+            character = text[i]
+            if not character.isalpha():
+                continue
+            assert character.isalpha()
+            if character.islower():
+                if not saw_first_alpha:
+                    saw_first_alpha = True
+                    could_be_camel_case = could_be_upper_case = False
+                else: # saw_first_alpha is True
+                    if could_be_lower_case or could_be_camel_case:
+                        could_be_upper_case = False
+                    else:
+                        alpha_word_spans.append((
+                            pre_alpha_word_span[0], 
+                            i - 1
+                        ))
+                        pre_alpha_word_spans.append((
+                            i, 
+                            pre_alpha_word_span[1], 
+                        ))
+                        break
+            else:
+                assert character.isupper()
+                if not saw_first_alpha:
+                    saw_first_alpha = True
+                    could_be_lower_case = False
+                else: # saw_first_alpha is True
+                    if could_be_upper_case:
+                        could_be_camel_case = could_be_lower_case = False
+                    else:
+                        alpha_word_spans.append((
+                            pre_alpha_word_span[0], 
+                            i - 1
+                        ))
+                        pre_alpha_word_spans.append((
+                            i, 
+                            pre_alpha_word_span[1], 
+                        ))
+                        break
+                
+        else:
+            alpha_word_spans.append(pre_alpha_word_span)
+            continue
+            
+    alpha_word_spans.sort()
+        
+    alpha_word_spans = cute_word._offset_word_spans(alpha_word_spans,
+                                                    post_offset)
+
+    return alpha_word_spans
+
+
+###############################################################################
+
+
+_random_text_pieces = (
+    '_', '__', 'a', 'foo', 'Bar', 'BAZ', 'x', 'Q', '7', '42', ' ', '\n',
+    '\r\n', '\t', '.', '(', '==', '"', '\xe9', '\x0c',
+)
+
+
+def make_random_text(random_, n_pieces):
+    '''Make text that's dense in underscores, case changes and separators.'''
+    return ''.join(random_.choice(_random_text_pieces)
+                   for _ in xrange(n_pieces))
+
+
+def check(n_cases, seed=0):
+    '''
+    Check the tokenizer against the reference one on `n_cases` random texts.
+
+    Returns a list of the texts they disagree on.
+    '''
+    random_ = random.Random(seed)
+    failures = []
+    for _ in xrange(n_cases):
+        text = make_random_text(random_, random_.randint(0, 40))
+        post_offset = random_.choice((0, 0, 1000))
+        spans = cute_word._get_alpha_word_spans_in_text(text, post_offset)
+        if spans != reference_alpha_word_spans(text, post_offset):
+            failures.append(text)
+    return failures
+
+
+_minify_pattern = re.compile(r'''#[^\n]*|\s+''')
+
+
+def minify(text):
+    '''Crush runs of whitespace and drop comments, like a minifier would.'''
+    return _minify_pattern.sub(
+        lambda match: '' if match.group().startswith('#') else ' ', text
+    )
+
+
+def measure_throughput(function, text, min_duration=0.5):
+    '''Get the throughput of `function(text)`, in MB/s.'''
+    n_calls = 0
+    start_time = timeit.default_timer()
+    while True:
+        function(text)
+        n_calls += 1
+        duration = timeit.default_timer() - start_time
+        if duration >= min_duration:
+            return n_calls * len(text) / duration / 2 ** 20
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--cases', type=int, default=5000,
+                        help='Number of random texts to check.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed for the random texts.')
+    parser.add_argument('--lines', type=int, default=20000,
+                        help='Size of the generated module, in lines.')
+    arguments = parser.parse_args(argv)
+
+    failures = check(arguments.cases, arguments.seed)
+    if failures:
+        print('Tokenizers disagree on %d of %d texts, for example %r.' %
+              (len(failures), arguments.cases, failures[0]))
+        return 1
+    print('Tokenizers agree on %d random texts.' % arguments.cases)
+
+    generated_text = run_benchmarks.make_synthetic_module(arguments.lines)
+    texts = collections.OrderedDict((
+        ('generated', generated_text),
+        ('minified', minify(generated_text)),
+    ))
+    tokenizers = collections.OrderedDict((
+        ('regex', cute_word._get_alpha_word_spans_in_text),
+        ('reference', reference_alpha_word_spans),
+    ))
+    print('%-12s%12s%12s%12s' % (('text', 'size MB') + tuple(tokenizers)))
+    for text_name, text in texts.items():
+        print('%-12s%12.2f' % (text_name, len(text) / 2 ** 20) + ''.join(
+            '%9.2f MB/s' % measure_throughput(tokenizer, text)
+            for tokenizer in tokenizers.values()
+        ))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
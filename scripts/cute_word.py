@@ -12,14 +12,15 @@ sys.path += [
 ]
 
 import sys
+import array
 import inspect
 import bisect
 import collections
+import itertools
+import operator
 import re
 import string
 
-from python_toolbox import caching
-
 import wingapi
 
 import shared
@@ -38,21 +39,54 @@ newline_word_pattern = re.compile(
 alpha_word_pattern = re.compile(
     r'''[^!"#$%&'()*+,\-./:;<=>?@[\\\]^`{|}~ \t\r\n]+'''
 )
+# Building blocks for `_alpha_sub_word_pattern`:
+_word_separators = r'''!"#$%&'()*+,\-./:;<=>?@[\\\]^`{|}~ \t\r\n'''
+_non_middle_underscores = r'''_+(?!_)(?![^_%s][^%s])''' % (_word_separators,
+                                                          _word_separators)
+_non_letters = r'''(?:[^a-zA-Z_%s]+|%s)''' % (_word_separators,
+                                              _non_middle_underscores)
+_lower_case_rest = r'''(?:[^A-Z_%s]+|%s)*''' % (_word_separators,
+                                                _non_middle_underscores)
+_upper_case_rest = r'''(?:[^a-z_%s]+|%s)*''' % (_word_separators,
+                                                _non_middle_underscores)
+_letter_word = (
+    r'''[a-z]%(lower_case_rest)s|'''
+    r'''[A-Z]%(non_letters)s*'''
+    r'''(?:[a-z]%(lower_case_rest)s|[A-Z]%(upper_case_rest)s)?''' % {
+        'non_letters': _non_letters, 'lower_case_rest': _lower_case_rest,
+        'upper_case_rest': _upper_case_rest,
+    }
+)
 
-
-def _round(n, step=100, direction=-1):
-    assert isinstance(n, int)
-    low = (n // step) * step
-    high = low + step
-    if low == n:
-        return low
-    elif high == n:
-        return high
-    elif direction == 1:
-        return high
-    else:
-        assert direction == -1
-        return low
+_alpha_sub_word_pattern = re.compile(
+    # Matches the words `_get_alpha_word_spans_in_text` finds, one after the
+    # other. An alpha word, like `IToldYou_soFooBar`, is split on its middle
+    # underscores, i.e. underscores that have a non-underscore somewhere before
+    # them and a non-underscore after them that isn't the alpha word's last
+    # character. Then a lower-case letter continues a lower-case or camel-case
+    # word, and an upper-case letter continues an upper-case word; any other
+    # letter starts a new word. Everything else goes along with the letters
+    # before it.
+    #
+    # Runs of underscores are always taken whole, and other loops are kept at
+    # the ends of the alternatives or followed only by optional groups, so the
+    # regex never has to backtrack through them. A word may start with
+    # underscores only at the start of an alpha word, which also lets the
+    # regex skip separators quickly.
+    r'''(?<![^%(word_separators)s])_+(?!_)(?:%(rest)s)?|'''
+    r'''(?=[^_%(word_separators)s])(?:%(rest)s)''' % {
+        'word_separators': _word_separators, 
+        'rest': r'''%(non_letters)s+(?:%(letter_word)s)?|%(letter_word)s''' % {
+            'non_letters': _non_letters, 'letter_word': _letter_word,
+        }
+    }
+)
+_whitespace_run_start_pattern = re.compile(
+    r'''(?<![^ \t\r\n])[^ \t\r\n]'''
+)
+_whitespace_run_end_pattern = re.compile(
+    r'''[^ \t\r\n](?![^ \t\r\n])'''
+)
 
 
 def _find_spans(pattern, text):
@@ -67,7 +101,6 @@ def _get_word_spans_in_text(text, post_offset=0):
     )
 
 
-@caching.cache(max_size=20)
 def _get_non_alpha_word_spans_in_text(text, post_offset=0):
     return _offset_word_spans(
         sorted(_find_spans(punctuation_word_pattern, text) + 
@@ -76,163 +109,299 @@ def _get_non_alpha_word_spans_in_text(text, post_offset=0):
     )
 
 
-@caching.cache(max_size=20)
 def _get_alpha_word_spans_in_text(text, post_offset=0):
+    # Words like `IToldYou_soFooBar` get split to `I`, `Told`, `You`, `so`,
+    # `Foo`, `Bar`, in one pass of `_alpha_sub_word_pattern` over the text.
+    return [(match.start() + post_offset, match.end() - 1 + post_offset)
+                        for match in _alpha_sub_word_pattern.finditer(text)]
+
+
+def _offset_word_spans(word_spans, post_offset):
+    if post_offset:
+        return [
+            (word_span[0] + post_offset, word_span[1] + post_offset)
+                                                    for word_span in word_spans
+        ]
+    else:
+        return word_spans
+
+
+def _shift_values(values, shift):
+    '''Get `values` with `shift` added to each of them.'''
+    if not shift:
+        return values
+    return itertools.imap(operator.add, values,
+                          itertools.repeat(shift, len(values)))
+
+
+class _SpanIndex(object):
+    '''
+    Sorted, non-overlapping `(start, end)` spans, `end` being inclusive.
     
-    # We have three phases here. In the first phase we get words like
-    # `IToldYou_soFooBar`, in the second phase we get words like `IToldYou`,
-    # `soFooBar`, in the third and final phase we get words like `I`, `Told`,
-    # `You`, `so`, `Foo`, `Bar`.
+    The spans are kept in blocks of about `_block_size` spans, each with an
+    offset that's added to its positions. That way an edit only has to
+    rewrite the block it's in and shift the offsets of the blocks after it,
+    instead of shifting every span after it, wherever in the document it is.
+    '''
     
-    pre_pre_alpha_word_spans = _find_spans(alpha_word_pattern, text)
-    pre_alpha_word_spans = collections.deque()
-    alpha_word_spans = []
+    _block_size = 256
     
-    for pre_pre_alpha_word_span in pre_pre_alpha_word_spans:
-        pre_pre_alpha_word = \
-                    text[pre_pre_alpha_word_span[0]:pre_pre_alpha_word_span[1]]
-        relative_middle_underscore_indices = []
+    def __init__(self, spans):
+        self._block_starts = []
+        self._block_ends = []
+        self._offsets = []
+        # The index of each block's first span, and then the number of spans:
+        self._first_indices = [0]
+        self._last_starts = []
+        self._last_ends = []
+        self._splice(0, 0, [start for start, end in spans],
+                     [end for start, end in spans], 0)
         
-        ### Finding middle underscores: #######################################
-        #                                                                     #
-        saw_non_underscore = False
-        enumerated = list(enumerate(pre_pre_alpha_word))
-        for i, character in enumerated:
-            if character == '_':
-                if saw_non_underscore:
-                    relative_middle_underscore_indices.append(i)
-            else: # character != '_'
-                saw_non_underscore = True
-        for i, character in reversed(enumerated):
-            if character == '_':
-                try:
-                    relative_middle_underscore_indices.remove(i)
-                except ValueError:
-                    pass
-            else: # character != '_'
-                break
-        #                                                                     #
-        ### Finished finding middle underscores. ##############################
+    def __len__(self):
+        return self._first_indices[-1]
+    
+    def __nonzero__(self):
+        return bool(self._block_starts)
+    
+    def _locate(self, index):
+        '''Get the block that has the span `index`, and its index in it.'''
+        block_index = min(bisect.bisect_right(self._first_indices, index) - 1,
+                          len(self._block_starts) - 1)
+        return (block_index, index - self._first_indices[block_index])
         
-        middle_underscore_indices = map(
-            lambda i: i + pre_pre_alpha_word_span[0],
-            relative_middle_underscore_indices
-        )
+    def get_span(self, index):
+        block_index, index_in_block = self._locate(index)
+        offset = self._offsets[block_index]
+        return (self._block_starts[block_index][index_in_block] + offset,
+                self._block_ends[block_index][index_in_block] + offset)
+            
+    def get_start(self, index):
+        return self.get_span(index)[0]
         
-        non_middle_underscore_indices = filter(
-            lambda i: i not in middle_underscore_indices, 
-            xrange(
-                pre_pre_alpha_word_span[0], 
-                pre_pre_alpha_word_span[1] + 1, 
-            )
+    def _bisect(self, bisector, blocks, last_values, position):
+        block_index = bisector(last_values, position)
+        if block_index == len(blocks):
+            return len(self)
+        return self._first_indices[block_index] + bisector(
+            blocks[block_index], position - self._offsets[block_index]
         )
         
-        current_word_span = None
-        for i in non_middle_underscore_indices:
-            if current_word_span is None:
-                current_word_span = [i, i]
-            else: # current_word is not None
-                if current_word_span[1] == i - 1:
-                    current_word_span[1] = i
-                else:
-                    assert i - current_word_span[1] >= 2
-                    pre_alpha_word_spans.append(tuple(current_word_span))
-                    current_word_span = [i, i]
-        if current_word_span:
-            pre_alpha_word_spans.append(tuple(current_word_span))
+    def bisect_starts(self, position, right=False):
+        bisector = bisect.bisect_right if right else bisect.bisect_left
+        return self._bisect(bisector, self._block_starts, self._last_starts,
+                            position)
         
-            
-    ######################################################################
-    # Finished separating using middle underscores, now separating using
-    # case.
-    
-    # We're popping word spans out of `pre_alpha_word_spans` one-by-one. We
-    # analyze them, sometimes we throw them into `pre_alpha_word_spans`,
-    # which means they're words that are already separated by case, and
-    # sometimes we throw one part of them into `alpha_word_spans`, and
-    # throw the remaining substring back into `pre_alpha_word_spans`, where
-    # it will be analyzed on a later run of the loop.
-    
-    while pre_alpha_word_spans:
-        pre_alpha_word_span = pre_alpha_word_spans.pop()
-        pre_alpha_word = \
-                  text[pre_alpha_word_span[0] : pre_alpha_word_span[1] + 1]
-        alpha_characters = filter(str.isalpha, pre_alpha_word)
-        if not alpha_characters:
-            alpha_word_spans.append(pre_alpha_word_span)
-            continue
-        could_be_lower_case = True
-        could_be_upper_case = True
-        could_be_camel_case = True
-        saw_first_alpha = False
-
-        for i in \
-                xrange(pre_alpha_word_span[0], pre_alpha_word_span[1] + 1):
-            character = text[i]
-            if not character.isalpha():
-                continue
-            assert character.isalpha()
-            if character.islower():
-                if not saw_first_alpha:
-                    saw_first_alpha = True
-                    could_be_camel_case = could_be_upper_case = False
-                else: # saw_first_alpha is True
-                    if could_be_lower_case or could_be_camel_case:
-                        could_be_upper_case = False
-                    else:
-                        alpha_word_spans.append((
-                            pre_alpha_word_span[0], 
-                            i - 1
-                        ))
-                        pre_alpha_word_spans.append((
-                            i, 
-                            pre_alpha_word_span[1], 
-                        ))
-                        break
-            else:
-                assert character.isupper()
-                if not saw_first_alpha:
-                    saw_first_alpha = True
-                    could_be_lower_case = False
-                else: # saw_first_alpha is True
-                    if could_be_upper_case:
-                        could_be_camel_case = could_be_lower_case = False
-                    else:
-                        alpha_word_spans.append((
-                            pre_alpha_word_span[0], 
-                            i - 1
-                        ))
-                        pre_alpha_word_spans.append((
-                            i, 
-                            pre_alpha_word_span[1], 
-                        ))
-                        break
-                
+    def bisect_ends(self, position, right=False):
+        bisector = bisect.bisect_right if right else bisect.bisect_left
+        return self._bisect(bisector, self._block_ends, self._last_ends,
+                            position)
+        
+    def _splice(self, first_index, last_index, starts, ends, shift):
+        '''
+        Replace spans `first_index` to `last_index` and shift the ones after.
+        
+        `starts` and `ends` are the positions of the new spans, and `shift`
+        is added to the positions of the spans after `last_index`.
+        '''
+        if self._block_starts:
+            first_block_index, first_index_in_block = \
+                                                  self._locate(first_index)
+            last_block_index, last_index_in_block = self._locate(last_index)
         else:
-            alpha_word_spans.append(pre_alpha_word_span)
-            continue
+            first_block_index = first_index_in_block = last_block_index = \
+                                                     last_index_in_block = 0
+        new_starts = array.array('l')
+        new_ends = array.array('l')
+        if self._block_starts:
+            offset = self._offsets[first_block_index]
+            new_starts.extend(_shift_values(
+                self._block_starts[first_block_index][:first_index_in_block],
+                offset
+            ))
+            new_ends.extend(_shift_values(
+                self._block_ends[first_block_index][:first_index_in_block],
+                offset
+            ))
+        new_starts.extend(starts)
+        new_ends.extend(ends)
+        n_blocks = len(self._block_starts)
+        while n_blocks:
+            offset = self._offsets[last_block_index] + shift
+            new_starts.extend(_shift_values(
+                self._block_starts[last_block_index][last_index_in_block:],
+                offset
+            ))
+            new_ends.extend(_shift_values(
+                self._block_ends[last_block_index][last_index_in_block:],
+                offset
+            ))
+            # Taking in the next block too if the new ones would be too
+            # small, so blocks don't get ever smaller:
+            if len(new_starts) >= self._block_size // 2 or \
+                                             last_block_index + 1 == n_blocks:
+                break
+            last_block_index += 1
+            last_index_in_block = 0
+        if n_blocks and len(new_starts) < self._block_size // 2 and \
+                                                          first_block_index:
+            # At the last block, so taking in the one before it instead:
+            first_block_index -= 1
+            offset = self._offsets[first_block_index]
+            new_starts[0:0] = array.array('l', _shift_values(
+                self._block_starts[first_block_index], offset
+            ))
+            new_ends[0:0] = array.array('l', _shift_values(
+                self._block_ends[first_block_index], offset
+            ))
             
-    alpha_word_spans.sort()
+        n_new = len(new_starts)
+        n_new_blocks = -(-n_new // self._block_size)
+        # Splitting evenly, so none of the new blocks is much smaller:
+        bounds = [n_new * i // max(n_new_blocks, 1) for i in
+                  range(n_new_blocks + 1)]
+        block_slice = slice(first_block_index,
+                            last_block_index + 1 if n_blocks else 0)
+        self._block_starts[block_slice] = [
+            new_starts[bound:next_bound] for bound, next_bound in
+            zip(bounds, bounds[1:])
+        ]
+        self._block_ends[block_slice] = [
+            new_ends[bound:next_bound] for bound, next_bound in
+            zip(bounds, bounds[1:])
+        ]
+        self._offsets[block_slice] = [0] * n_new_blocks
+        self._last_starts[block_slice] = [
+            new_starts[next_bound - 1] for next_bound in bounds[1:]
+        ]
+        self._last_ends[block_slice] = [
+            new_ends[next_bound - 1] for next_bound in bounds[1:]
+        ]
         
-    alpha_word_spans = _offset_word_spans(alpha_word_spans, post_offset)
-
-    return alpha_word_spans
-
-
-def _offset_word_spans(word_spans, post_offset):
-    if post_offset:
-        return [
-            (word_span[0] + post_offset, word_span[1] + post_offset)
-                                                    for word_span in word_spans
+        # Updating the blocks after the new ones:
+        first_index_of_block = self._first_indices[first_block_index]
+        n_replaced = self._first_indices[block_slice.stop] - \
+                                                         first_index_of_block
+        self._first_indices[block_slice.start + 1:block_slice.stop + 1] = [
+            first_index_of_block + bound for bound in bounds[1:]
         ]
-    else:
-        return word_spans
-
-
+        next_block_index = first_block_index + n_new_blocks
+        if n_new != n_replaced:
+            self._first_indices[next_block_index + 1:] = [
+                first_index + n_new - n_replaced for first_index in
+                self._first_indices[next_block_index + 1:]
+            ]
+        if shift:
+            for values in (self._offsets, self._last_starts,
+                           self._last_ends):
+                values[next_block_index:] = [
+                    value + shift for value in values[next_block_index:]
+                ]
+        
+    def apply_edit(self, position, n_removed, n_inserted):
+        '''
+        Drop the spans touched by an edit and shift the ones after it.
+        
+        Returns the position where the dropped text starts, which is before
+        `position` when the edit cut into a span.
+        '''
+        first_index = self.bisect_ends(position)
+        last_index = max(
+            self.bisect_starts(position + n_removed, right=True), first_index
+        )
+        dropped_start = min(self.get_start(first_index), position) if \
+                                      last_index > first_index else position
+        self._splice(first_index, last_index, (), (), n_inserted - n_removed)
+        return dropped_start
+        
+    def replace_range(self, range_start, range_end, spans):
+        '''Replace the spans starting in `[range_start, range_end)`.'''
+        first_index = self.bisect_starts(range_start)
+        last_index = max(self.bisect_starts(range_end), first_index)
+        self._splice(first_index, last_index, [start for start, end in spans],
+                     [end for start, end in spans], 0)
 
 
+class WordIndex(object):
+    '''
+    Index of all the word spans in a document, as used by `cute_word`.
+    
+    Built once for the whole document, and then patched after edits by
+    re-tokenizing only the run of non-whitespace text around each edit.
+    '''
+    
+    def __init__(self, text, revision):
+        self.word_spans = _SpanIndex(_get_word_spans_in_text(text))
+        self.alpha_word_spans = _SpanIndex(_get_alpha_word_spans_in_text(text))
+        self.revision = revision
+        
+    def patch(self, text, edits, revision):
+        '''
+        Bring the index up to date with `text`, given the edits made to it.
+        
+        `edits` is a list of `(position, n_removed, n_inserted)` tuples, as
+        returned by `shared.DocumentState.get_edits_since`.
+        '''
+        dirty_start = dirty_end = None
+        for position, n_removed, n_inserted in edits:
+            dropped_start = min(
+                self.word_spans.apply_edit(position, n_removed, n_inserted),
+                self.alpha_word_spans.apply_edit(position, n_removed,
+                                                 n_inserted)
+            )
+            # `apply_edit` also drops a span starting right after the edit,
+            # hence the `+ 1`.
+            if dirty_start is None:
+                dirty_start = dropped_start
+                dirty_end = position + n_inserted + 1
+            else:
+                if dirty_end > position + n_removed:
+                    dirty_end += n_inserted - n_removed
+                else:
+                    dirty_end = max(dirty_end, position + n_inserted + 1)
+                dirty_start = min(dirty_start, dropped_start)
+        self.revision = revision
+        if dirty_start is None:
+            return
+        
+        # Tokenization never crosses from whitespace into non-whitespace, so
+        # we widen the dirty range to whole runs of non-whitespace text and
+        # re-tokenize just that.
+        range_start = 0
+        window_size = 100
+        while True:
+            window_start = max(dirty_start - window_size, 0)
+            matches = list(_whitespace_run_start_pattern.finditer(
+                text, window_start, dirty_start + 1
+            ))
+            if matches or window_start == 0:
+                if matches:
+                    range_start = matches[-1].start()
+                break
+            window_size *= 4
+        match = _whitespace_run_end_pattern.search(
+            text, max(dirty_end - 1, range_start)
+        )
+        range_end = match.end() if match else len(text)
+        
+        range_text = text[range_start:range_end]
+        self.word_spans.replace_range(
+            range_start, range_end,
+            _get_word_spans_in_text(range_text, post_offset=range_start)
+        )
+        self.alpha_word_spans.replace_range(
+            range_start, range_end,
+            _get_alpha_word_spans_in_text(range_text, post_offset=range_start)
+        )
+        
+        
+def _get_word_index(document):
+    '''Get the `WordIndex` of `document`, building or patching it as needed.'''
+    return shared.get_patched_index(document, 'word_index', WordIndex)
+    
+    
 def cute_word(direction=1, extend=False, delete=False, traverse=False, 
-              editor=wingapi.kArgEditor, app=wingapi.kArgApplication):
+              count=1, coalesce=False, editor=wingapi.kArgEditor,
+              app=wingapi.kArgApplication):
     '''
     Move, select or delete words.
     
@@ -273,12 +442,58 @@ def cute_word(direction=1, extend=False, delete=False, traverse=False,
     then I also suggest you bind `Ctrl-Right-Up` and `Ctrl-Right-Down` to
     `goto-previous-bookmark` and `goto-next-bookmark` respectively, so you'll
     still have bookmark-traversing commands available.)
+    
+    Use `count` to do all of the above `count` times in one go, as a single
+    undoable action.
+    
+    When used with `coalesce=True`, the command doesn't act right away;
+    instead, invocations that come in before Wing gets back to its event loop,
+    like the ones queued up while holding down a key, are merged into one with
+    a bigger `count`. Bind the keys with `coalesce=True` if word-moving lags
+    behind when you hold them down.
     '''    
     assert isinstance(editor, wingapi.CAPIEditor)
     
     assert direction in (-1, 1)
     assert (delete, extend, traverse).count(True) in (0, 1)
+    assert count >= 1
+    
+    if coalesce:
+        _queue_cute_word(direction, extend, delete, traverse, count, editor,
+                         app)
+    else:
+        _flush_queued_cute_word()
+        _cute_word(direction, extend, delete, traverse, count, editor, app)
+        
+        
+_queued_cute_word = None
+'''
+A coalesced `cute_word` that hasn't been done yet, as a list of its arguments.
+'''
+
+
+def _queue_cute_word(direction, extend, delete, traverse, count, editor, app):
+    global _queued_cute_word
+    if _queued_cute_word is not None:
+        if _queued_cute_word[:4] + _queued_cute_word[5:] == \
+                          [direction, extend, delete, traverse, editor, app]:
+            _queued_cute_word[4] += count
+            return
+        _flush_queued_cute_word()
+    _queued_cute_word = \
+                    [direction, extend, delete, traverse, count, editor, app]
+    app.InstallTimeout(0, _flush_queued_cute_word)
+    
+    
+def _flush_queued_cute_word():
+    global _queued_cute_word
+    if _queued_cute_word is None:
+        return
+    queued_cute_word, _queued_cute_word = _queued_cute_word, None
+    _cute_word(*queued_cute_word)
     
+    
+def _cute_word(direction, extend, delete, traverse, count, editor, app):
     selection_start, selection_end = editor.GetSelection()
     document = editor.GetDocument()
     anchor_position, caret_position = editor.GetAnchorAndCaret()
@@ -286,72 +501,45 @@ def cute_word(direction=1, extend=False, delete=False, traverse=False,
                                  1 if caret_position >= anchor_position else -1
     
     
-    # Trying to round the text startpoint and endpoint, so it'll more likely to
-    # be cached when doing many word-movings rapidly.
-    
-    text_start = max(
-        _round(selection_start - 70, step=100, direction=-1),
-        0
-    )
-    text_end = min(
-        _round(selection_end + 70, step=100, direction=1),
-        document.GetLength()
-    )
-    
-    #caret_position = 0
-    #text_start = 0
-    #text_end = 100
-    
-    text = document.GetCharRange(text_start, text_end)
-    
-    word_spans = _get_word_spans_in_text(text, post_offset=text_start)
-    word_starts = zip(*word_spans)[0]
-    #print(word_starts)
-    bisector = bisect.bisect_right if direction == 1 else bisect.bisect_left
-    word_start_index = bisector(word_starts, caret_position)
+    word_index = _get_word_index(document)
+    word_spans = word_index.word_spans
     if direction == 1:
-        if word_start_index == len(word_starts):
+        target_word_start_index = \
+           word_spans.bisect_starts(caret_position, right=True) + count - 1
+        if target_word_start_index >= len(word_spans):
             target_word_start = document.GetLength()
         else:
-            target_word_start = word_starts[word_start_index]
+            target_word_start = word_spans.get_start(target_word_start_index)
     else: # direction == -1:
-        if word_start_index == 0:
+        target_word_start_index = \
+                          word_spans.bisect_starts(caret_position) - count
+        if target_word_start_index < 0:
             target_word_start = 0
         else:
-            target_word_start = word_starts[word_start_index - 1]
+            target_word_start = word_spans.get_start(target_word_start_index)
             
-    
-    #print(next_word_start)
     if traverse:
         nominal_position = caret_position
-        alpha_word_spans = _get_alpha_word_spans_in_text(text,
-                                                        post_offset=text_start)
+        alpha_word_spans = word_index.alpha_word_spans
         if not alpha_word_spans:
             return 
-        fixed_alpha_word_spans = [
-            (word_start, word_end + 1) for (word_start, word_end) in
-            alpha_word_spans
-        ]
-        alpha_word_spans_before_us = [
-            (word_start, word_end) for (word_start, word_end) in
-                          fixed_alpha_word_spans if word_end < nominal_position
-        ]
-        alpha_word_spans_after_us = [
-            (word_start, word_end) for (word_start, word_end) in
-                         fixed_alpha_word_spans if word_end >= nominal_position
-        ]
-        index_of_next_or_current = len(alpha_word_spans_before_us)
-        if not alpha_word_spans_after_us:
+        # Spans are inclusive, but selections aren't, hence the `+ 1`s.
+        index_of_next_or_current = \
+                        alpha_word_spans.bisect_ends(nominal_position - 1)
+        if index_of_next_or_current == len(alpha_word_spans):
             index_of_next_or_current -= 1
             
-        target_index = index_of_next_or_current if direction == 1 else \
-                                           max(index_of_next_or_current - 1, 0)
-        
-        target_alpha_word_span = fixed_alpha_word_spans[target_index]
-        if direction == 1 and \
-              (selection_start, selection_end) ==  target_alpha_word_span and \
-                                target_index < len(fixed_alpha_word_spans) - 1:
-            target_alpha_word_span = fixed_alpha_word_spans[target_index+1]
+        if direction == 1:
+            target_index = index_of_next_or_current
+            word_start, word_end = alpha_word_spans.get_span(target_index)
+            if (selection_start, selection_end) == (word_start, word_end + 1):
+                target_index += 1
+            target_index = min(target_index + count - 1,
+                               len(alpha_word_spans) - 1)
+        else: # direction == -1
+            target_index = max(index_of_next_or_current - count, 0)
+        word_start, word_end = alpha_word_spans.get_span(target_index)
+        target_alpha_word_span = (word_start, word_end + 1)
         app.ExecuteCommand('set-visit-history-anchor')
         editor.SetSelection(*target_alpha_word_span)
     elif extend:
@@ -79,14 +79,98 @@ timezone_now_pattern = re.compile(r'''timezone\.(now)\(\)$''')
 #                                                                             #
 ### Finished defining datetime module patterns. ###############################
 
-patterns = [django_orm_get_pattern, getter_pattern, attribute_pattern,
-            mapping_get_pattern, getitem_pattern, today_pattern, now_pattern,
-            timezone_now_pattern, instantiation_pattern, iter_pattern]
+### Defining plugin patterns: ################################################
+#                                                                             #
+# The arguments of a call, with at most one level of nested parentheses. They
+# can't contain the parentheses of the next call in a chain, so long chains
+# that don't match fail quickly instead of backtracking exponentially.
+sqlalchemy_call_arguments = r'''\([^()]*(?:\([^()]*\)[^()]*)*\)'''
+sqlalchemy_query_get_pattern = re.compile(
+    r'''\.query\(([A-Z][0-9a-zA-Z_]*)\)(?:\.[a-zA-Z_][0-9a-zA-Z_]*%s)*'''
+    r'''\.(?:get|first|one|one_or_none)%s$''' %
+    (sqlalchemy_call_arguments, sqlalchemy_call_arguments)
+)
+sqlalchemy_model_query_get_pattern = re.compile(
+    r'''([A-Z][0-9a-zA-Z_]*)\.query(?:\.[a-zA-Z_][0-9a-zA-Z_]*%s)*'''
+    r'''\.(?:get|get_or_404|first|first_or_404|one|one_or_none)%s$''' %
+    (sqlalchemy_call_arguments, sqlalchemy_call_arguments)
+)
+sqlalchemy_session_get_pattern = re.compile(
+    r'''session\.get\(([A-Z][0-9a-zA-Z_]*),.*\)$'''
+)
+attrs_evolve_pattern = re.compile(
+    r'''attrs?\.evolve\((?:[a-zA-Z_][0-9a-zA-Z_]*\.)*'''
+    r'''([a-zA-Z_][0-9a-zA-Z_]*)[,)].*$'''
+)
+attrs_fields_pattern = re.compile(r'''attrs?\.(fields(?:_dict)?)\(.*\)$''')
+#                                                                             #
+### Finished defining plugin patterns. ########################################
+
+rules = [
+    ('getter', getter_pattern), ('attribute', attribute_pattern),
+    ('mapping_get', mapping_get_pattern), ('getitem', getitem_pattern),
+    ('today', today_pattern), ('now', now_pattern),
+    ('timezone_now', timezone_now_pattern),
+    ('instantiation', instantiation_pattern), ('iter', iter_pattern),
+]
+
+rule_plugins = {
+    'django': [('django_orm_get', django_orm_get_pattern)],
+    'sqlalchemy': [
+        ('sqlalchemy_query_get', sqlalchemy_query_get_pattern),
+        ('sqlalchemy_model_query_get', sqlalchemy_model_query_get_pattern),
+        ('sqlalchemy_session_get', sqlalchemy_session_get_pattern),
+    ],
+    'attrs': [
+        ('attrs_evolve', attrs_evolve_pattern),
+        ('attrs_fields', attrs_fields_pattern),
+    ],
+}
 
 variable_name_map = {
-    iter_pattern: 'iterator',
+    'iter': 'iterator',
 }
 
+
+def _make_rule_set():
+    '''
+    Make the `RuleSet` that `deep_to_var` uses.
+    
+    The rules of the plugins come before the core rules, and the rules in
+    `deep_to_var_rules` in `cute_wing_stuff_local_settings.py` come before
+    both. Which plugins are used is set by `deep_to_var_plugins` there; it's
+    all of them by default.
+    '''
+    rule_set = shared.RuleSet(rules)
+    plugin_rules = []
+    for plugin_name in shared.get_local_setting('deep_to_var_plugins',
+                                                ('django', 'sqlalchemy',
+                                                 'attrs')):
+        if plugin_name not in rule_plugins:
+            raise Exception(
+                "There's no plugin %r, which `deep_to_var_plugins` in "
+                "`cute_wing_stuff_local_settings.py` lists. The plugins are: "
+                "%s." % (plugin_name, ', '.join(sorted(rule_plugins)))
+            )
+        plugin_rules.extend(rule_plugins[plugin_name])
+    user_rules = [
+        (name, re.compile(pattern)) for name, pattern in
+        shared.get_local_setting('deep_to_var_rules', ())
+    ]
+    for name, pattern in user_rules:
+        if pattern.groups != 1:
+            raise Exception(
+                "The rule %r in `deep_to_var_rules` in "
+                "`cute_wing_stuff_local_settings.py` has %d groups. It should "
+                "capture the variable name in one group, and use `(?:...)` "
+                "for any other groups." % (name, pattern.groups)
+            )
+    rule_set.add_rules(user_rules + plugin_rules, first=True)
+    return rule_set
+
+rule_set = _make_rule_set()
+
+
 def deep_to_var(editor=wingapi.kArgEditor):
     '''
     Create a variable from a deep expression.
@@ -118,6 +202,13 @@ def deep_to_var(editor=wingapi.kArgEditor):
     Just write your deep expression, like `self._style_handler.html_color`,
     invoke this `deep-to-var` script, and you'll get the full line and have the
     caret put on the next line.
+    
+    There are also rules for Django, SQLAlchemy and attrs, like
+    `user = session.query(User).get(pk)` and `point = attr.evolve(point, x=0)`.
+    You can choose which of these plugins to use by setting
+    `deep_to_var_plugins` in `cute_wing_stuff_local_settings.py`, and add your
+    own `(name, pattern)` rules in `deep_to_var_rules` there. A pattern should
+    end with `$` and capture the variable name in its only group.
 
     Suggested key combination: `Insert E`
     '''
@@ -132,18 +223,13 @@ def deep_to_var(editor=wingapi.kArgEditor):
     line = document.GetCharRange(line_start, line_end)
     line_stripped = line.strip()
     
-    variable_name = None
-    match = None
-    for pattern in patterns:
-        match = pattern.search(line_stripped)
-        if match:
-            if pattern in variable_name_map:
-                variable_name = variable_name_map[pattern]
-            else:
-                (variable_name,) = match.groups()
-            break
+    rule_name, groups = rule_set.search(line_stripped)
+    if rule_name in variable_name_map:
+        variable_name = variable_name_map[rule_name]
+    elif rule_name is not None:
+        (variable_name,) = groups
         
-    if match:
+    if rule_name is not None:
         if variable_name != variable_name.lower():
             # `variable_name` has an uppercase letter, and thus is probably
             # camel-case. Let's flip it to underscore:
@@ -3,10 +3,13 @@
 
 from __future__ import with_statement
 
+import hashlib
 import itertools
+import json
 import re
 import os.path
 import shutil
+import threading
 
 import os.path, sys; sys.path.append(os.path.dirname(__file__))
 
@@ -27,6 +30,177 @@ template_file_pattern = re.compile(r'''^.*\.(shpaml|html?)''')
 python_file_pattern = re.compile(r'''^.*\.pyw?''')
 
 
+def _read_template_names(view_file_path):
+    '''Get the template names that the view file at a path specifies.'''
+    return tuple(template_name_pattern.findall(
+        shared.get_file_content(view_file_path)
+    ))
+
+
+def _shorten_template_file_path(file_path):
+    match = shorten_template_file_path_pattern.match(
+                                                 file_path.replace('\\', '/'))
+    return match.group(1) if match else None
+
+
+class _ViewTemplateIndex(object):
+    '''
+    Index of which view files specify which templates, in both directions.
+    
+    `state` is a tuple `(views, views_by_template, templates_by_name)`, which
+    is replaced as a whole when a refresh is done. `views` maps the path of
+    each view file to `(mtime, template_names)`. `views_by_template` maps each
+    template name, like `app/page.html`, to the view files that specify it,
+    and `templates_by_name` maps it to the template file, both in project
+    order.
+    
+    `refresh` updates the index on a background thread. It checks the mtime
+    of each view file, reads only the ones that changed, and saves the index
+    to the cache file `cache_file_name`, so the next Wing session starts with
+    it. If the cache folder can't be used, the index isn't saved.
+    '''
+    
+    _FORMAT_VERSION = 1
+    
+    def __init__(self, cache_file_name):
+        self.cache_file_name = cache_file_name
+        self.state = (None, {}, {})
+        self.thread = None
+        
+    def refresh(self, all_file_paths):
+        '''Start updating the index to `all_file_paths`, unless we are.'''
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._refresh,
+                                       args=(all_file_paths,))
+        self.thread.daemon = True
+        self.thread.start()
+        
+    def wait(self):
+        '''Wait for the running refresh, if any, to finish.'''
+        if self.thread is not None:
+            self.thread.join()
+            
+    def find_view(self, template_name):
+        '''
+        Find the first view file that specifies `template_name`, or `None`.
+        
+        A view file that changed since the last refresh is read again to make
+        sure that it still specifies the template.
+        '''
+        views, views_by_template, _ = self.state
+        for view_file_path in views_by_template.get(template_name, ()):
+            try:
+                mtime = os.path.getmtime(view_file_path)
+            except OSError:
+                continue
+            if mtime == views[view_file_path][0] or \
+                      template_name in _read_template_names(view_file_path):
+                return view_file_path
+        return None
+    
+    def find_template(self, template_name):
+        '''
+        Find the template file of `template_name`, or `None`.
+        
+        A template file that was deleted since the last refresh isn't returned.
+        '''
+        template_file_path = self.state[2].get(template_name)
+        if template_file_path is None or \
+                                       not os.path.exists(template_file_path):
+            return None
+        return template_file_path
+            
+    def _refresh(self, all_file_paths):
+        # Runs on the refresh thread.
+        old_views = self.state[0]
+        if old_views is None:
+            old_views = self._load()
+        views = {}
+        views_by_template = {}
+        templates_by_name = {}
+        for file_path in all_file_paths:
+            if view_file_path_pattern.search(file_path):
+                try:
+                    mtime = os.path.getmtime(file_path)
+                    if file_path in old_views and \
+                                         old_views[file_path][0] == mtime:
+                        views[file_path] = old_views[file_path]
+                    else:
+                        views[file_path] = \
+                                    (mtime, _read_template_names(file_path))
+                except (IOError, OSError):
+                    continue
+                for template_name in views[file_path][1]:
+                    views_by_template.setdefault(template_name,
+                                                 []).append(file_path)
+            if template_file_pattern.match(os.path.basename(file_path)):
+                template_name = _shorten_template_file_path(file_path)
+                if template_name is not None:
+                    templates_by_name.setdefault(template_name, file_path)
+        self.state = (views, views_by_template, templates_by_name)
+        if views != old_views:
+            self._save(views)
+            
+    def _get_file_path(self):
+        '''Get the path of the cache file, or `None` if there's no cache.'''
+        try:
+            return shared.get_cache_file_path(self.cache_file_name)
+        except (IOError, OSError):
+            return None
+        
+    def _load(self):
+        file_path = self._get_file_path()
+        if file_path is None:
+            return {}
+        try:
+            with open(file_path) as file:
+                data = json.load(file)
+            if data['version'] != self._FORMAT_VERSION:
+                return {}
+            return dict(
+                (file_path, (mtime, tuple(template_names))) for
+                file_path, (mtime, template_names) in data['views'].items()
+            )
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return {}
+        
+    def _save(self, views):
+        file_path = self._get_file_path()
+        if file_path is None:
+            return
+        # Writing to a temporary file first, so a crash can't leave a broken
+        # index behind.
+        temporary_file_path = '%s.tmp' % file_path
+        try:
+            with open(temporary_file_path, 'w') as file:
+                json.dump({'version': self._FORMAT_VERSION, 'views': views},
+                          file)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            os.rename(temporary_file_path, file_path)
+        except (IOError, OSError):
+            pass
+    
+    
+_view_template_indices = {}
+
+
+def _get_view_template_index(project):
+    '''Get the `_ViewTemplateIndex` of `project`, kept for the session.'''
+    project_file_path = project.GetFilename() or 'untitled'
+    if project_file_path not in _view_template_indices:
+        # Hashing the path as bytes; byte strings may already be non-ASCII.
+        project_file_path_bytes = project_file_path if \
+                         isinstance(project_file_path, str) else \
+                                             project_file_path.encode('utf-8')
+        _view_template_indices[project_file_path] = _ViewTemplateIndex(
+            'django_view_template_index_%s.json' %
+                               hashlib.md5(project_file_path_bytes).hexdigest()
+        )
+    return _view_template_indices[project_file_path]
+
+
 def django_toggle_between_view_and_template():
     '''
     Toggle between a view file in Django and the corresponding template file.
@@ -38,6 +212,9 @@ def django_toggle_between_view_and_template():
     This assumes that the view file has the word `view` in it and has a
     definition for the class attribute `template_name`.
     
+    The view files are indexed in the background, and only the ones that
+    changed are read again. The index is saved between Wing sessions.
+    
     Suggested key combination: `Insert Quoteleft` (i.e. backtick)
     '''
     
@@ -51,35 +228,33 @@ def django_toggle_between_view_and_template():
     folder, file_name = os.path.split(file_path)
     
     
+    view_template_index = _get_view_template_index(project)
+    view_template_index.refresh(all_file_paths)
+    
     if file_name.endswith('.py'):
         match = template_name_pattern.search(document_text)
         if match:
             template_partial_file_path = match.group(1)
-            matching_file_paths = [
-                file_path for file_path in all_file_paths
-                if template_partial_file_path in file_path.replace('\\', '/')
-            ]
-            if matching_file_paths:
-                matching_file_path = matching_file_paths[0]
+            matching_file_path = view_template_index.find_template(
+                                                     template_partial_file_path
+            )
+            if matching_file_path is None:
+                matching_file_paths = shared.get_project_path_index(
+                    project
+                ).find_by_suffix(template_partial_file_path)
+                if matching_file_paths:
+                    matching_file_path = matching_file_paths[0]
+            if matching_file_path is not None:
                 app.OpenEditor(matching_file_path, raise_window=True)
     elif template_file_pattern.match(file_name):
-        short_file_path = shorten_template_file_path_pattern.match(
-                                         file_path.replace('\\', '/')).group(1)
-        specifies_our_template_pattern = re.compile(
-            r'''template_name *= * ['"]%s['"]''' % re.escape(short_file_path)
-        )
-        all_view_file_paths = [
-            file_path for file_path in all_file_paths
-            if view_file_path_pattern.search(file_path)
-        ]
-            
-        matching_file_paths_iterator = (
-            file_path for file_path in all_view_file_paths if
-            specifies_our_template_pattern.search(
-                                            shared.get_file_content(file_path))
-        )
-        try:
-            matching_file_path = next(matching_file_paths_iterator)
-        except StopIteration:
+        short_file_path = _shorten_template_file_path(file_path)
+        matching_file_path = view_template_index.find_view(short_file_path)
+        if matching_file_path is None and view_template_index.state[0] is None:
+            # The index was never made, so we wait for the first refresh. Later
+            # refreshes run in the background, and new views are found on the
+            # next press.
+            view_template_index.wait()
+            matching_file_path = view_template_index.find_view(short_file_path)
+        if matching_file_path is None:
             return
         app.OpenEditor(matching_file_path, raise_window=True)
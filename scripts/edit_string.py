@@ -12,6 +12,7 @@ sys.path += [
 import ast
 import re
 import collections
+import threading
 
 import wingapi
 import wingutils.datatype
@@ -20,7 +21,6 @@ import guiutils.wgtk
 import guiutils.dialogs
 
 import shared
-import string_selecting
 
 
 string_head_pattern = re.compile('''^(?P<modifiers>(?:b|u|)r?)'''
@@ -42,10 +42,99 @@ base_escape_map = {
     '\v': '\\v',
 }
 
+# The order in which `format_string` escapes characters. The backslash comes
+# first, so the backslashes of the other escapes don't get escaped again.
+_escape_order = ('\\', '\'', '\"', '\a', '\b', '\f', '\n', '\r', '\t', '\v')
+
+_literal_values = {}
+'''
+Values of the string literals that `format_string` verified, by their source.
+
+When a long string is edited again, most of the literals it's split to are the
+same as last time, so only the ones that changed get evaluated.
+'''
+
+_literal_values_lock = threading.Lock()
+'''
+Guards `_literal_values`, which the preview's background thread uses too.
+'''
+
+_MAX_LITERAL_VALUES = 100000
+
+
+def _split_content(content, segment_length, quote_character, triple):
+    '''
+    Split the escaped `content` of a string to segments for separate lines.
+    
+    A segment ends after the last space that fits in `segment_length`, or
+    right after `segment_length + 1` characters if there's no such space. In
+    that case the cut is moved back so it isn't inside an escape sequence or,
+    in a triple-quoted string, right after an unescaped quote. Each segment is
+    searched only within its own length, so this is linear.
+    '''
+    segment_length = max(segment_length, 0)
+    segments = []
+    start = 0
+    while len(content) - start > segment_length:
+        space_position = content.rfind(' ', start, start + segment_length)
+        if space_position != -1:
+            end = space_position + 1
+        else:
+            end = start + segment_length + 1
+            while end - 1 > start and not _is_safe_cut(content, start, end,
+                                                       quote_character,
+                                                       triple):
+                end -= 1
+            if end - 1 == start:
+                end = start + segment_length + 1
+        segments.append(content[start:end])
+        start = end
+    segments.append(content[start:])
+    return segments
+    
+
+def _is_safe_cut(content, start, end, quote_character, triple):
+    '''Can the segment of `content` from `start` end at `end`?'''
+    segment = content[start:end]
+    n_trailing_quotes = 0
+    if triple:
+        without_quotes = segment.rstrip(quote_character)
+        n_trailing_quotes = len(segment) - len(without_quotes)
+        segment = without_quotes
+    n_trailing_backslashes = len(segment) - len(segment.rstrip('\\'))
+    # A trailing quote is fine only if it's a single escaped one:
+    return n_trailing_backslashes % 2 == min(n_trailing_quotes, 2)
+    
+
+def _evaluate_literals(literals):
+    '''
+    Evaluate Python string literals, reusing values from earlier calls.
+    
+    The literals we haven't seen are evaluated together, in one parse.
+    Returns a list of values, and a dict of the new ones, which the caller
+    should add to `_literal_values` only after checking them.
+    '''
+    with _literal_values_lock:
+        known_values = dict(
+            (literal, _literal_values[literal]) for literal in set(literals)
+            if literal in _literal_values
+        )
+    new_literals = [literal for literal in set(literals) if
+                    literal not in known_values]
+    new_values = {}
+    if new_literals:
+        values = ast.literal_eval('(%s,)' % ',\n'.join(new_literals))
+        if len(values) != len(new_literals):
+            raise SyntaxError('Malformed string literal.')
+        new_values = dict(zip(new_literals, values))
+    known_values.update(new_values)
+    return ([known_values[literal] for literal in literals], new_values)
+
 
 def format_string(string, double=False, triple=False, bytes_=False, raw=False,
                   f_string=False, unicode_=False, avoid_multiline=False,
-                  docstring_style=False, starting_column=None):
+                  docstring_style=False, starting_column=None,
+                  last_column=None):
     if not avoid_multiline:
         assert starting_column is not None
     # if docstring_style:
@@ -54,108 +143,192 @@ def format_string(string, double=False, triple=False, bytes_=False, raw=False,
     assert f_string + unicode_ in (0, 1)
     quote_character = '"' if double else "'"
     quote_string = quote_character * (3 if triple else 1)
-    last_column = \
-        wingapi.gApplication.GetPreference('edit.text-wrap-column') - 1
+    if last_column is None:
+        last_column = \
+            wingapi.gApplication.GetPreference('edit.text-wrap-column') - 1
     
     if raw and string.endswith(quote_character):
         raise Exception("Can't do a raw string that ends with its quote "
                         "character.")
     
-    content_list = []
-        
-    i = 0
-    while i < len(string):
-        if triple and string.startswith(quote_string, i):
-            content_list.append('\\%s' % quote_string)
-            i += 3
-            continue
-        elif triple and (i == len(string) - 1) and string[i] == quote_string[0]:
-            content_list.append('\\%s' % quote_string[0])
-            i += 1
-            continue # Will now end loop because we're at end of string
-        else:
-            current_substring = string[i]
-            i += 1
-
-        if ((current_substring in ('"', "'")) and triple) or \
-                                 (current_substring == '"' and not double) or \
-                                         (current_substring == "'" and double):
-            content_list.append(current_substring)
-        elif current_substring in base_escape_map and not raw:
-            content_list.append(base_escape_map[current_substring])
-        else:
-            content_list.append(current_substring)
-            
-    content = ''.join(content_list)
+    if raw:
+        escape_table = ()
+    else:
+        escape_table = [
+            (character, base_escape_map[character]) for character in
+            _escape_order if character not in ('"', "'") or
+                                 (character == quote_character and not triple)
+        ]
     
-    def wrap_content(content):
-        return '%s%s%s%s' % (
-            ''.join((
-                ('f' if f_string else ''),
-                ('b' if bytes_ else ''),
-                ('u' if unicode_ else ''),
-                ('r' if raw else ''),
-            )),
-            quote_string,
-            content,
-            quote_string
-        )
+    # In a triple-quoted string, runs of three quotes are escaped, and so is
+    # a quote at the very end that isn't part of such a run.
+    body = string
+    ending = ''
+    if triple and string.endswith(quote_character) and \
+                    (len(string) - len(string.rstrip(quote_character))) % 3:
+        body = string[:-1]
+        ending = '\\%s' % quote_character
+    for character, escape in escape_table:
+        body = body.replace(character, escape)
+    if triple:
+        body = body.replace(quote_string, '\\%s' % quote_string)
+    content = body + ending
     
-    formatted_string = wrap_content(content)
+    prefix = ''.join((
+        ('f' if f_string else ''),
+        ('b' if bytes_ else ''),
+        ('u' if unicode_ else ''),
+        ('r' if raw else ''),
+    ))
+    
+    def wrap_content(content):
+        return '%s%s%s%s' % (prefix, quote_string, content, quote_string)
     
-    if not avoid_multiline and \
-                       (starting_column + len(formatted_string) > last_column):
+    if not avoid_multiline and (starting_column + len(prefix) +
+                          len(quote_string) * 2 + len(content) > last_column):
         # Splitting the string to a multiline one.
         segment_length = last_column - starting_column - \
                  len(quote_string) * 2 - sum(map(int, (bytes_, f_string,
                                                        unicode_, raw)))
+        content_segments = _split_content(content, segment_length,
+                                          quote_character, triple)
+    else:
         content_segments = [content]
-        while True:
-            last_content_segment = content_segments[-1]
-            if len(last_content_segment) <= segment_length:
-                break
-            rfind_result = last_content_segment.rfind(' ', 0, segment_length)
-            if rfind_result == -1:
-                place_to_cut = segment_length
-                # This might cut something important but we'll cross that
-                # bridge when we get to it.
-            else:
-                place_to_cut = rfind_result
-            del content_segments[-1]
-            content_segments.append(last_content_segment[:place_to_cut+1])
-            content_segments.append(last_content_segment[place_to_cut+1:])
-                
         
-        separator = ('\n%s' % (' ' * (starting_column)))
-        formatted_string = separator.join(
-            map(wrap_content, content_segments)
-        )
+    separator = ('\n%s' % (' ' * (starting_column or 0)))
+    formatted_string = separator.join(map(wrap_content, content_segments))
     # elif docstring_style:
         # formatted_string.replace('\\n', '\n')
         
-        
-    #if isinstance(formatted_string, unicode):
-        #formatted_string = formatted_string.encode()
-    formatted_string_without_f = (formatted_string.replace('f', '', 1) if
-                                  f_string else formatted_string)
-    if not ast.literal_eval('(%s)' % formatted_string_without_f) == string:
-        raise Exception('Formatting unsuccessful. Tried to format this:\r\n'
-                        '%s\r\n'
-                        '\r\n'
-                        'The algorithm come up with this:\r\n'
-                        '%s\r\n'
-                        '\r\n'
-                        'Which actually comes out as a different string, '
-                                                           'which is this:\r\n'
-                        '%s\r\n'
-              % (string, formatted_string, ast.literal_eval(formatted_string), ))
-    return formatted_string
+    # Checking each segment separately, and only the ones that we didn't check
+    # before. (We can't evaluate f-strings, but an f-string without fields
+    # has the same value as a plain one.)
+    evaluated_prefix = prefix.replace('f', '')
+    literals = [
+        '%s%s%s%s' % (evaluated_prefix, quote_string, content_segment,
+                      quote_string) for content_segment in content_segments
+    ]
+    try:
+        values, new_values = _evaluate_literals(literals)
+    except (SyntaxError, ValueError) as exception:
+        actual_string = '(Not a valid string: %s)' % exception
+    else:
+        actual_string = ''.join(values)
+        if actual_string == string:
+            with _literal_values_lock:
+                if len(_literal_values) + len(new_values) > \
+                                                       _MAX_LITERAL_VALUES:
+                    _literal_values.clear()
+                _literal_values.update(new_values)
+            return formatted_string
+    raise Exception('Formatting unsuccessful. Tried to format this:\r\n'
+                    '%s\r\n'
+                    '\r\n'
+                    'The algorithm come up with this:\r\n'
+                    '%s\r\n'
+                    '\r\n'
+                    'Which actually comes out as a different string, '
+                                                       'which is this:\r\n'
+                    '%s\r\n'
+                    % (string, formatted_string, actual_string))
     
 
 def _bool_to_qt_check_state(bool_):
     return guiutils.wgtk.Qt.Checked if bool_ else guiutils.wgtk.Qt.Unchecked
 
 
+_PREVIEW_DELAY = 150
+'''Milliseconds without changes in the dialog before its preview is updated.'''
+
+_PREVIEW_POLL_INTERVAL = 20
+'''Milliseconds between checks whether a preview finished formatting.'''
+
+
+class _BackgroundFormatter(object):
+    '''
+    Formats strings with `format_string` off the UI thread, for a preview.
+
+    Call `request` with the arguments for `format_string` on every change.
+    Formatting starts only after `_PREVIEW_DELAY` milliseconds without another
+    request, and only one formatting runs at a time. When a formatting of the
+    latest request is done, `show_result` is called on the UI thread with the
+    formatted string, or with the exception that `format_string` raised.
+
+    The segments that didn't change since the last formatting are verified
+    from `format_string`'s cache, so typing in a long string stays quick.
+    '''
+    def __init__(self, app, show_result):
+        self.app = app
+        self.show_result = show_result
+        self.requested_kwargs = None
+        self.n_requests = 0
+        self.is_waiting = False
+        self.thread = None
+        self.finished = None
+        self.last_result = None
+        self.closed = False
+
+    def request(self, kwargs):
+        self.requested_kwargs = kwargs
+        self.n_requests += 1
+        n_requests = self.n_requests
+        self.app.InstallTimeout(_PREVIEW_DELAY,
+                                lambda: self._on_delay_over(n_requests))
+
+    def get_result(self, kwargs):
+        '''
+        Get the result of formatting with `kwargs`, if it's the last one done.
+
+        Returns a tuple `(kwargs, result)`, or `None`.
+        '''
+        if self.last_result is not None and self.last_result[0] == kwargs:
+            return self.last_result
+
+    def close(self):
+        '''Stop showing results. A formatting that's running is abandoned.'''
+        self.closed = True
+
+    def _on_delay_over(self, n_requests):
+        if self.closed or n_requests != self.n_requests:
+            return # Another request came in during the delay.
+        self.is_waiting = True
+        self._start()
+
+    def _start(self):
+        if self.thread is not None:
+            return # `_poll` will start us when the running formatting is done.
+        self.is_waiting = False
+        kwargs = self.requested_kwargs
+        if self.get_result(kwargs) is not None:
+            self.show_result(self.last_result[1])
+            return
+        self.thread = threading.Thread(target=self._format, args=(kwargs,))
+        self.thread.daemon = True
+        self.thread.start()
+        self.app.InstallTimeout(_PREVIEW_POLL_INTERVAL, self._poll)
+
+    def _format(self, kwargs):
+        # Runs on the formatting thread.
+        try:
+            result = format_string(**kwargs)
+        except Exception as exception:
+            result = exception
+        self.finished = (kwargs, result)
+
+    def _poll(self):
+        if self.closed:
+            return
+        if self.thread.is_alive():
+            self.app.InstallTimeout(_PREVIEW_POLL_INTERVAL, self._poll)
+            return
+        self.thread = None
+        self.last_result, self.finished = self.finished, None
+        if self.is_waiting:
+            self._start()
+        elif self.last_result[0] == self.requested_kwargs:
+            self.show_result(self.last_result[1])
+
+
 def edit_string():
     '''
     Open a dialog for editing a string.
@@ -164,6 +337,8 @@ def edit_string():
     Otherwise you can enter a new string and it'll be inserted into the
     document. The dialog has lots of checkboxes for toggling things about the
     string: Whether it's unicode, raw, bytes, f-string, type of quote, etc.
+    A preview below them shows the formatted string as you type, or why it
+    can't be formatted.
     
     When is this better than editing a string in the editor?
     
@@ -221,16 +396,20 @@ def edit_string():
     )
     for checkbox in checkboxes: # docstring_style_checkbox):
         sub_layout.addWidget(checkbox)
+    preview_label = guiutils.wgtk.QLabel('Preview:')
+    preview_text_edit = guiutils.wgtk.QTextEdit()
+    preview_text_edit.setReadOnly(True)
     layout.addWidget(text_edit_label)
     layout.addWidget(text_edit)
     layout.addLayout(sub_layout)
+    layout.addWidget(preview_label)
+    layout.addWidget(preview_text_edit)
     
-    replacing_old_string = \
-        string_selecting._is_position_on_string(editor, selection_start)
+    string_index = shared.get_string_index(document)
+    old_string_number = string_index.get_string_at(selection_start)
+    replacing_old_string = old_string_number is not None
     if replacing_old_string:
-        old_string_ranges = \
-           string_selecting._find_string_from_position(editor, selection_start,
-                                                       multiline=True)
+        old_string_ranges = string_index.get_group_spans(old_string_number)
         old_string_raw = document.GetCharRange(old_string_ranges[0][0],
                                                old_string_ranges[-1][1])
         old_string = ast.literal_eval('(%s)' % old_string_raw)
@@ -270,25 +449,53 @@ def edit_string():
     else:
         string_starting_column = selection_start_column
         
+    def get_format_string_kwargs():
+        return dict(
+            string=text_edit.toPlainText(),
+            bytes_=bool(bytes_checkbox.checkState()),
+            f_string=bool(f_string_checkbox.checkState()),
+            unicode_=bool(unicode_checkbox.checkState()),
+            raw=bool(raw_checkbox.checkState()),
+            double=bool(double_checkbox.checkState()),
+            triple=bool(triple_checkbox.checkState()),
+            avoid_multiline=bool(avoid_multiline_checkbox.checkState()),
+            starting_column=string_starting_column,
+            last_column=last_column,
+            # docstring_style=bool(docstring_style_checkbox.checkState())
+        )
+    
+    def show_preview(result):
+        if isinstance(result, Exception):
+            preview_label.setText('Preview: (Formatting unsuccessful)')
+            preview_text_edit.setPlainText(str(result))
+        else:
+            preview_label.setText('Preview:')
+            preview_text_edit.setPlainText(result)
+            
+    background_formatter = _BackgroundFormatter(app, show_preview)
+    # However the dialog gets closed, (like with Escape or its close box,)
+    # its widgets are destroyed, and we must not show results in them:
+    widget.destroyed.connect(lambda *args: background_formatter.close())
+    
+    def update_preview(*args):
+        background_formatter.request(get_format_string_kwargs())
+        
+    text_edit.textChanged.connect(update_preview)
+    for checkbox in checkboxes:
+        checkbox.stateChanged.connect(update_preview)
+    update_preview()
+        
     def ok():
         try:
-            string = text_edit.toPlainText()
-            bytes_ = bool(bytes_checkbox.checkState())
-            f_string = bool(f_string_checkbox.checkState())
-            unicode_ = bool(unicode_checkbox.checkState())
-            raw = bool(raw_checkbox.checkState())
-            double = bool(double_checkbox.checkState())
-            triple = bool(triple_checkbox.checkState())
-            avoid_multiline = bool(avoid_multiline_checkbox.checkState())
-            # docstring_style = bool(docstring_style_checkbox.checkState())
-            
-            formatted_string = format_string(
-                string, bytes_=bytes_, f_string=f_string, unicode_=unicode_,
-                raw=raw, double=double, triple=triple,
-                avoid_multiline=avoid_multiline,
-                starting_column=string_starting_column,
-                # docstring_style=docstring_style
-            )
+            format_string_kwargs = get_format_string_kwargs()
+            finished_preview = \
+                         background_formatter.get_result(format_string_kwargs)
+            if finished_preview is not None:
+                formatted_string = finished_preview[1]
+                if isinstance(formatted_string, Exception):
+                    raise formatted_string
+            else:
+                formatted_string = format_string(**format_string_kwargs)
             with shared.UndoableAction(document):
                 if replacing_old_string:
                     document.DeleteChars(old_string_ranges[0][0],
@@ -309,9 +516,14 @@ def edit_string():
             app.ShowMessageDialog('Error', str(exception),
                                   buttons=[('_OK', None)])
             return True
+        background_formatter.close()
+        
+    def cancel():
+        background_formatter.close()
+        
     buttons = [
         guiutils.dialogs.CButtonSpec('_OK', ok),
-        guiutils.dialogs.CButtonSpec('_Cancel', None),
+        guiutils.dialogs.CButtonSpec('_Cancel', cancel),
     ]
     dialog = guiutils.dialogs.CWidgetDialog(None, 'Edit string',
                                             'Edit string', widget, buttons)
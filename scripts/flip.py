@@ -10,6 +10,8 @@ sys.path += [
 ]
 
 
+import re
+
 import wingapi
 
 import shared
@@ -57,36 +59,139 @@ flip_pairs = (
     ('pre', 'post'),
 )
 
-all_words = sum(flip_pairs, ())
-
-
-def _is_any_word_on_caret(document_text, caret_position, words):
-    ''' '''
-    sorted_words = sorted(words, key=len, reverse=True)
-    max_word_length = len(sorted_words[0])
-    first_cut_point = max(caret_position - max_word_length, 0)
-    second_cut_point = min(caret_position + max_word_length,
-                           len(document_text))
-    cut_text = document_text[first_cut_point:second_cut_point]
-    caret_position_in_cut_text = caret_position - first_cut_point
-    words_in_cut_text = [word for word in sorted_words if word in cut_text]
-    for word in words_in_cut_text:
-        word_start_position_in_cut_text = cut_text.find(word)
-        word_end_position_in_cut_text = cut_text.find(word) + len(word)
-        if word_start_position_in_cut_text <= caret_position_in_cut_text <= \
-                                                 word_end_position_in_cut_text:
-            word_start_position = word_start_position_in_cut_text + \
-                                                                first_cut_point
-            return (word, word_start_position)
-    else:
-        return (None, None)
+def _load_flip_pair_file(path):
+    '''
+    Load pairs of opposite words from a file, one pair per line.
+    
+    Each line has two words separated by whitespace. Empty lines, lines that
+    start with `#` and lines that don't have exactly two words are skipped.
+    '''
+    pairs = []
+    with open(path) as file:
+        for line in file:
+            words = line.split()
+            if len(words) == 2 and not words[0].startswith('#'):
+                pairs.append(tuple(words))
+    return pairs
+
+
+def _load_user_flip_pairs():
+    '''
+    Load the pairs in the files listed in `flip_pair_files`, if there are any.
+    
+    To add your own pairs, set `flip_pair_files` in
+    `cute_wing_stuff_local_settings.py` to a list of paths. Files that can't be
+    read are skipped.
+    '''
+    pairs = []
+    for path in shared.get_local_setting('flip_pair_files', ()):
+        try:
+            pairs.extend(_load_flip_pair_file(os.path.expanduser(path)))
+        except (IOError, OSError):
+            pass
+    return pairs
+
+
+def _get_case_variants(word):
+    '''
+    Get `word` as it is, and in lowercase, capitalized and uppercase.
+    
+    Words in camelcase and other mixed case are only returned as they are.
+    '''
+    variants = (word, word.lower(), word[:1].upper() + word[1:].lower(),
+                word.upper())
+    return variants if word in variants[1:] else (word,)
+
+
+def _build_opposites(pairs):
+    '''
+    Map every word in `pairs`, in every case variant, to its opposite.
+    
+    The opposite has the same case as the word, so `Start` flips to `End` and
+    `START` to `END`. When a word is in more than one pair, the first one wins.
+    '''
+    opposites = {}
+    for first_word, second_word in pairs:
+        for first_variant, second_variant in zip(
+                    _get_case_variants(first_word),
+                    _get_case_variants(second_word)):
+            opposites.setdefault(first_variant, second_variant)
+            opposites.setdefault(second_variant, first_variant)
+    return opposites
+
+
+def _build_word_pattern(words):
+    '''
+    Compile a regex that matches any of `words` on its own.
+    
+    A word has to start and end at a word boundary, where camelcase humps,
+    underscores and digits count as boundaries, so `start` matches in
+    `start_index` and `startIndex` but not in `restart` or `starting`.
+    Longer words come first, so `horizontally` wins over `horizontal`.
+    '''
+    words_by_case = {'lower': [], 'upper': [], 'mixed': []}
+    for word in words:
+        case = 'lower' if word.islower() else 'upper' if word.isupper() else \
+                                                                       'mixed'
+        words_by_case[case].append(word)
+    boundaries = {
+        'lower': (r'(?<![a-zA-Z])', r'(?![a-z])'),
+        'mixed': (r'(?<![A-Z])', r'(?![a-z])'),
+        'upper': (r'(?<![A-Z])', r'(?![A-Z])'),
+    }
+    alternatives = []
+    for case in ('lower', 'mixed', 'upper'):
+        if not words_by_case[case]:
+            continue
+        sorted_words = sorted(words_by_case[case], key=len, reverse=True)
+        before, after = boundaries[case]
+        alternatives.append('%s(?:%s)%s' % (
+            before, '|'.join(map(re.escape, sorted_words)), after
+        ))
+    return re.compile('|'.join(alternatives))
+
+
+flip_pairs = tuple(_load_user_flip_pairs()) + flip_pairs
+
+_opposites = _build_opposites(flip_pairs)
+
+_word_pattern = _build_word_pattern(_opposites)
+
+_max_word_length = max(map(len, _opposites))
+
+
+def _find_word_on_caret(document_text, caret_position):
+    '''
+    Find the flippable word that the caret is on or touching.
+    
+    Returns `(word, word_start_position)`, or `(None, None)` if there's no
+    such word.
+    '''
+    # Lookbehinds see the text before `pos`, so only the lookahead needs the
+    # extra character at the end.
+    search_start = max(caret_position - _max_word_length, 0)
+    search_end = min(caret_position + _max_word_length + 1, len(document_text))
+    for match in _word_pattern.finditer(document_text, search_start,
+                                        search_end):
+        if match.start() > caret_position:
+            break
+        if caret_position <= match.end():
+            return (match.group(), match.start())
+    return (None, None)
+
 
 def flip(editor=wingapi.kArgEditor):
     '''
     Flip between opposite words.
     
     Put the caret on a word like `True` or `start` or `new` and watch it change
-    into `False` or `end` or `old`.
+    into `False` or `end` or `old`. The word can be a part of a name, like
+    `start` in `start_index` or `Start` in `getStart`, and its case is kept, so
+    `START` changes into `END`.
+    
+    To add your own pairs, list files of them in `flip_pair_files` in
+    `cute_wing_stuff_local_settings.py`. Each line in such a file has two
+    opposite words separated by whitespace.
     
     Suggested key combination: `Insert P`
     '''
@@ -95,25 +200,13 @@ def flip(editor=wingapi.kArgEditor):
     assert isinstance(document, wingapi.CAPIDocument)
     
     with shared.UndoableAction(document):
-        word, word_start_position = _is_any_word_on_caret(
+        word, word_start_position = _find_word_on_caret(
             shared.get_text(document), 
-            editor.GetSelection()[0], 
-            all_words
+            editor.GetSelection()[0]
         )
         if not word:
             return
-        
-        for first_word, second_word in flip_pairs:
-            if first_word == word:
-                new_word = second_word
-                break
-            elif second_word == word:
-                new_word = first_word
-                break
-            else:
-                continue
-        else:
-            raise RuntimeError
+        new_word = _opposites[word]
         
         with shared.SelectionRestorer(editor):
             document.DeleteChars(word_start_position,
@@ -65,38 +65,35 @@ if monkeypatch:
     ###########################################################################
 
     # Monkeypatching `ExpandFileFragment` so Wing won't show .pyc, .pyo and
-    # .pyd files when browsing using `open-from-keyboard`:
+    # .pyd files when browsing using `open-from-keyboard`, and so it'll list
+    # each folder only when it changes, instead of on every keystroke:
     
     def ExpandFileFragment(entry):
         """ Try to expand given entry for possible matches, completing as far
         as we can """
-        from guiutils.widgets_qt4 import os, sys, textutils, location, fileutils
+        from guiutils.widgets_qt4 import os, textutils, location, fileutils
         # Utility to obtain list of files for directory on disk
         dirname, filefrag = os.path.split(textutils.AsUnicode(entry))
+        ### Modified part: Using a cached listing without compiled files. #####
+        #                                                                     #
         try:
-            file_list = location.ListDir(os.path.expanduser(dirname), log_error=False)
+            folder_listing = shared.get_folder_listing(
+                os.path.expanduser(dirname),
+                ignored_extensions=('.pyc', '.pyo', '.pyd'),
+                list_folder=lambda path: location.ListDir(path,
+                                                          log_error=False)
+            )
         except OSError:
-            file_list = []
+            return []
       
         allfiles = []
-        for file in file_list:
-            # This is the only modified part.
-            ### Throwing away compiled Python files: ##########################
-            #                                                                 #
-            if file.endswith('.pyc') or file.endswith('.pyo') or \
-                                                         file.endswith('.pyd'):
-                continue
-            #                                                                 #
-            ### Finished throwing away compiled Python files. #################
-            if sys.platform == 'win32':
-                file_matches = file.lower().startswith(filefrag.lower())
-            else:
-                file_matches = file.startswith(filefrag)
-            if file_matches:
-                match = fileutils.join(dirname, file)
-                if os.path.isdir(match) and match[-1] != os.sep:
-                    match = match + os.sep
-                allfiles.append(match)
+        for file in folder_listing.find_by_prefix(filefrag):
+            match = fileutils.join(dirname, file)
+            if folder_listing.is_folder(file) and match[-1] != os.sep:
+                match = match + os.sep
+            allfiles.append(match)
+        #                                                                     #
+        ### Finished modified part. ###########################################
       
         return allfiles
 
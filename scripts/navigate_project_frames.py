@@ -10,20 +10,102 @@ sys.path += [
 ]
 
 
+import bisect
+import weakref
+
 import wingapi
 
 import shared
 
 
-def _normalize_path(path):
-    ''' '''
-    if not sys.platform.startswith('win'):
-        return os.path.realpath(path)
+_stack_classifications = weakref.WeakKeyDictionary()
+'''
+The stack classifications of each run state, by thread ID.
+
+A stack classification is a tuple `(revision, stack_length,
+project_frame_indices)`, where `project_frame_indices` is a sorted list of the
+indices of the frames that are on project files, and `revision` is the
+revision of the project's path index at the time. They're dropped whenever the
+run state pauses or runs, so the stack is fetched only once per pause.
+'''
+
+
+def _clear_stack_classifications(run_state_classifications):
+    def clear(*args):
+        run_state_classifications.clear()
+    return clear
+
+
+def _get_stack_classification(application, run_state, thread_id,
+                              frame_index):
+    '''
+    Get `(stack_length, project_frame_indices)` for the thread's stack.
+
+    The classification is cached until the run state pauses or runs again, or
+    until files are added to or removed from the project.
+    '''
+    path_index = shared.get_project_path_index(application.GetProject())
+    try:
+        run_state_classifications = _stack_classifications[run_state]
+    except KeyError:
+        run_state_classifications = _stack_classifications[run_state] = {}
+        clear = _clear_stack_classifications(run_state_classifications)
+        run_state.connect('paused', clear)
+        run_state.connect('running', clear)
+    try:
+        revision, stack_length, project_frame_indices = \
+                                          run_state_classifications[thread_id]
+    except KeyError:
+        pass
     else:
-        return os.path.realpath(path).lower()
+        if revision == path_index.revision and frame_index < stack_length:
+            return (stack_length, project_frame_indices)
+        
+    stack = run_state.GetStack() or ()
+    all_project_files = path_index.get_normalized_paths()
+    project_frame_indices = [
+        i for i, (file_path, _, _, _, _) in enumerate(stack) if
+        shared.normalize_path(file_path) in all_project_files
+    ]
+    run_state_classifications[thread_id] = \
+                       (path_index.revision, len(stack), project_frame_indices)
+    return (len(stack), project_frame_indices)
+    
 
+def _go_to_project_frame(direction, count, to_end, application):
+    '''
+    Go `count` project frames up or down the stack, or all the way.
+    
+    `direction` is -1 to go up, (to the outer frames,) or 1 to go down. If
+    `to_end` is true, go to the outermost or innermost project frame.
+    '''
+    assert count >= 1
+    run_state = application.GetDebugger().GetCurrentRunState()
+    thread_id, frame_index = run_state.GetStackFrame()
+    stack_length, project_frame_indices = _get_stack_classification(
+        application, run_state, thread_id, frame_index
+    )
+    if direction == -1:
+        project_frame_indices_beyond = project_frame_indices[
+            :bisect.bisect_left(project_frame_indices, frame_index)
+        ][::-1]
+    else:
+        project_frame_indices_beyond = project_frame_indices[
+            bisect.bisect_right(project_frame_indices, frame_index):
+        ]
+    if not project_frame_indices_beyond:
+        return
+    if to_end:
+        new_frame_index = project_frame_indices_beyond[-1]
+    else:
+        new_frame_index = project_frame_indices_beyond[
+            min(count, len(project_frame_indices_beyond)) - 1
+        ]
+    run_state.SetStackFrame(thread_id, new_frame_index)
+    
 
-def go_up_to_project_frame(application=wingapi.gApplication):
+def go_up_to_project_frame(count=1, outermost=False,
+                           application=wingapi.gApplication):
     '''
     Go up one frame in the debugger, skipping any non-project frames.
 
@@ -35,36 +117,20 @@ def go_up_to_project_frame(application=wingapi.gApplication):
     `go-up-to-project-frame` to the rescue! Invoke this script while debugging
     in order to be taken to the closest higher stack frame that's on a project
     file rather than an external module.
-
-    Suggested key combination: `Alt-F11`
-    '''
-    project = application.GetProject()
-    debugger = application.GetDebugger()
-    all_project_files = set(map(_normalize_path, project.GetAllFiles()))
-    _current_run_state = debugger.GetCurrentRunState()
-    _thread_id, _frame_index = _current_run_state.GetStackFrame()
-    _stack = _current_run_state.GetStack()
     
-    if not _stack:
-        return 
-    
-    file_paths = [_normalize_path(file_path) for file_path, _, _, _, _ in
-                  _stack]
-    file_paths_in_project_above_current_frame = filter(
-        lambda (i, file_path): file_path in all_project_files and
-                                                              i < _frame_index,
-        enumerate(file_paths)
-    )
-    if not file_paths_in_project_above_current_frame:
-        return 
-    index_of_last_file_path_in_project = \
-                               file_paths_in_project_above_current_frame[-1][0]
+    Use `count` to go up `count` project frames in one go, or `outermost=True`
+    to go all the way up to the outermost project frame.
+
+    Suggested key combinations:
     
-    _current_run_state.SetStackFrame(_thread_id,
-                                     index_of_last_file_path_in_project)
+        `Alt-F11`
+        `Alt-Shift-F11` for outermost=True
+    '''
+    _go_to_project_frame(-1, count, outermost, application)
 
 
-def go_down_to_project_frame(application=wingapi.gApplication):
+def go_down_to_project_frame(count=1, innermost=False,
+                             application=wingapi.gApplication):
     '''
     Go down one frame in the debugger, skipping any non-project frames.
 
@@ -76,40 +142,29 @@ def go_down_to_project_frame(application=wingapi.gApplication):
     `go-down-to-project-frame` to the rescue! Invoke this script while
     debugging in order to be taken to the closest lower stack frame that's on a
     project file rather than an external module.
-
-    Suggested key combination: `Alt-F12`
-    '''
-    project = application.GetProject()
-    debugger = application.GetDebugger()
-    all_project_files = set(map(_normalize_path, project.GetAllFiles()))
-    _current_run_state = debugger.GetCurrentRunState()
-    _thread_id, _frame_index = _current_run_state.GetStackFrame()
-    _stack = _current_run_state.GetStack()
     
-    if not _stack:
-        return 
-    
-    file_paths = [_normalize_path(file_path) for file_path, _, _, _, _ in
-                  _stack]
-    file_paths_in_project_below_current_frame = filter(
-        lambda (i, file_path): file_path in all_project_files and
-                                                              i > _frame_index,
-        enumerate(file_paths)
-    )
-    if not file_paths_in_project_below_current_frame:
-        return 
-    index_of_last_file_path_in_project = \
-                               file_paths_in_project_below_current_frame[0][0]
+    Use `count` to go down `count` project frames in one go, or
+    `innermost=True` to go all the way down to the innermost project frame.
+
+    Suggested key combinations:
     
-    _current_run_state.SetStackFrame(_thread_id,
-                                     index_of_last_file_path_in_project)
+        `Alt-F12`
+        `Alt-Shift-F12` for innermost=True
+    '''
+    _go_to_project_frame(1, count, innermost, application)
 
 
 def _available(application=wingapi.gApplication):
     ''' '''
     debugger_run_state = \
                         wingapi.gApplication.GetDebugger().GetCurrentRunState()
-    return bool(debugger_run_state and debugger_run_state.GetStack())
+    if not debugger_run_state:
+        return False
+    thread_id, frame_index = debugger_run_state.GetStackFrame()
+    stack_length, _ = _get_stack_classification(
+        wingapi.gApplication, debugger_run_state, thread_id, frame_index
+    )
+    return bool(stack_length)
 
 go_up_to_project_frame.available = _available
 go_down_to_project_frame.available = _available
@@ -9,7 +9,6 @@ See their documentation for more information.
 
 from __future__ import with_statement
 
-import re
 import bisect
 
 import os.path, sys
@@ -24,37 +23,58 @@ import wingapi
 import shared
 
     
-assignment_pattern = re.compile(
-    r'''(?<=\n)(?P<indent>[ \t]*)''' # Before LHS
+class AssignmentIndex(shared.StatementIndex):
+    '''
+    Index of the left-hand and right-hand sides of assignments in a document.
     
-    # LHS:
-    r'''(?P<lhs>(?!if |while |elif |assert )[^ \n][^=\n\(]*?)'''
+    The assignments are found by `shared.find_assignments`, one top-level
+    statement at a time, and a statement is scanned again only when an edit
+    touches it. For each statement we keep the starts and ends of its
+    left-hand sides and of its right-hand sides, relative to the statement.
+    '''
     
-    r''' +(?:[+\-*/%|&^]|<<|>>|//|\*\*)?= +''' # operator and padding
+    _side_offsets = {'lhs': 0, 'rhs': 2}
     
-    # RHS:
-    r'''(?P<rhs>[^ ][^\n]*(?:\n|$)''' 
-    r'''(?:(?:[ \t]*[)\]}][^\n]*[\n])|(?:(?=(?P=indent)'''
-    r'''[ \t])[^\n]*(?:\n|$)))*)'''
-)    
+    def analyze_statement(self, statement_text):
+        return tuple(zip(*shared.find_assignments(statement_text))) or \
+                                                              ((), (), (), ())
     
-
-def _get_matches(document):
-    assert isinstance(document, wingapi.CAPIDocument)
-    document_text = shared.get_text(document)
-    return tuple(assignment_pattern.finditer(document_text))
-
-def _get_lhs_positions(document):
-    matches = _get_matches(document)
-    return tuple(match.span('lhs') for match in matches)
+    def find_next(self, side, position):
+        '''
+        Find the first `side` that ends at or after `position`.
+        
+        `side` is either `'lhs'` or `'rhs'`.
+        '''
+        offset = self._side_offsets[side]
+        for i in xrange(self.get_statement_number(position),
+                        len(self.statement_starts)):
+            statement_start = self.statement_starts[i]
+            starts, ends = self.results[i][offset:offset + 2]
+            j = bisect.bisect_left(ends, position - statement_start)
+            if j < len(ends):
+                return (statement_start + starts[j], statement_start + ends[j])
+        return None
+    
+    def find_previous(self, side, position):
+        '''
+        Find the last `side` that starts before `position`.
+        
+        `side` is either `'lhs'` or `'rhs'`.
+        '''
+        offset = self._side_offsets[side]
+        for i in xrange(self.get_statement_number(position), -1, -1):
+            statement_start = self.statement_starts[i]
+            starts, ends = self.results[i][offset:offset + 2]
+            j = bisect.bisect_left(starts, position - statement_start) - 1
+            if j >= 0:
+                return (statement_start + starts[j], statement_start + ends[j])
+        return None
     
-def _get_rhs_positions(document):
-    matches = _get_matches(document)
-    document_text = shared.get_text(document)
-    stripper = lambda (start, end): \
-        shared.strip_segment_from_whitespace_and_newlines(document_text,
-                                                          start, end)
-    return map(stripper, (match.span('rhs') for match in matches))
+
+def _get_assignment_index(document):
+    '''Get the `AssignmentIndex` of `document`.'''
+    return shared.get_patched_index(document, 'assignment_index',
+                                    AssignmentIndex)
 
 
 ###############################################################################
@@ -70,13 +90,12 @@ def select_next_lhs(editor=wingapi.kArgEditor, app=wingapi.kArgApplication):
     _, position = editor.GetSelection()
     position += 1
 
-    lhs_positions = _get_lhs_positions(editor.GetDocument())
-    lhs_ends = tuple(lhs_position[1] for lhs_position in lhs_positions)
-    lhs_index = bisect.bisect_left(lhs_ends, position)
-    
-    if 0 <= lhs_index < len(lhs_ends):
+    lhs_position = _get_assignment_index(editor.GetDocument()).find_next(
+        'lhs', position
+    )
+    if lhs_position is not None:
         app.ExecuteCommand('set-visit-history-anchor')
-        editor.SetSelection(*lhs_positions[lhs_index])
+        editor.SetSelection(*lhs_position)
         
 
 def select_prev_lhs(editor=wingapi.kArgEditor, app=wingapi.kArgApplication):
@@ -89,13 +108,12 @@ def select_prev_lhs(editor=wingapi.kArgEditor, app=wingapi.kArgApplication):
     position, _ = editor.GetSelection()
     position -= 1
 
-    lhs_positions = _get_lhs_positions(editor.GetDocument())
-    lhs_starts = tuple(lhs_position[0] for lhs_position in lhs_positions)
-    lhs_index = bisect.bisect_left(lhs_starts, position) - 1
-    
-    if 0 <= lhs_index < len(lhs_starts):
+    lhs_position = _get_assignment_index(editor.GetDocument()).find_previous(
+        'lhs', position
+    )
+    if lhs_position is not None:
         app.ExecuteCommand('set-visit-history-anchor')
-        editor.SetSelection(*lhs_positions[lhs_index])
+        editor.SetSelection(*lhs_position)
 
 
 def select_next_rhs(editor=wingapi.kArgEditor, app=wingapi.kArgApplication):
@@ -108,13 +126,12 @@ def select_next_rhs(editor=wingapi.kArgEditor, app=wingapi.kArgApplication):
     _, position = editor.GetSelection()
     position += 1
 
-    rhs_positions = _get_rhs_positions(editor.GetDocument())
-    rhs_ends = tuple(rhs_position[1] for rhs_position in rhs_positions)
-    rhs_index = bisect.bisect_left(rhs_ends, position)
-    
-    if 0 <= rhs_index < len(rhs_ends):
+    rhs_position = _get_assignment_index(editor.GetDocument()).find_next(
+        'rhs', position
+    )
+    if rhs_position is not None:
         app.ExecuteCommand('set-visit-history-anchor')
-        editor.SetSelection(*rhs_positions[rhs_index])
+        editor.SetSelection(*rhs_position)
         
 
 def select_prev_rhs(editor=wingapi.kArgEditor, app=wingapi.kArgApplication):
@@ -127,11 +144,10 @@ def select_prev_rhs(editor=wingapi.kArgEditor, app=wingapi.kArgApplication):
     position, _ = editor.GetSelection()
     position -= 1
 
-    rhs_positions = _get_rhs_positions(editor.GetDocument())
-    rhs_starts = tuple(rhs_position[0] for rhs_position in rhs_positions)
-    rhs_index = bisect.bisect_left(rhs_starts, position) - 1
-    
-    if 0 <= rhs_index < len(rhs_starts):
+    rhs_position = _get_assignment_index(editor.GetDocument()).find_previous(
+        'rhs', position
+    )
+    if rhs_position is not None:
         app.ExecuteCommand('set-visit-history-anchor')
-        editor.SetSelection(*rhs_positions[rhs_index])
+        editor.SetSelection(*rhs_position)
 
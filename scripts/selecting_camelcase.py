@@ -25,38 +25,6 @@ import edit
 import shared
 
 
-camelcase_pattern = re.compile(
-    r'''(?:[a-zA-Z_]*[a-z]+[a-zA-Z0-9_]*[A-Z]+[a-zA-Z0-9_]*)'''
-    r'''|'''
-    r'''(?:[a-zA-Z_]*[A-Z]+[a-zA-Z0-9_]*[a-z]+[a-zA-Z0-9_]*)'''
-)
-
-
-def _get_all_camelcase_positions(editor):
-    text = shared.get_text(editor.GetDocument())
-    matches = tuple(camelcase_pattern.finditer(text))
-    return tuple((match.start(), match.end()) for match in matches)
-
-
-def _get_relevant_camelcase_positions(editor, caret_position):
-    assert isinstance(editor, wingapi.CAPIEditor)
-    all_camelcase_positions = _get_all_camelcase_positions(editor)
-    last_start_position = last_end_position = None
-    for i, (start_position, end_position) in \
-                                            enumerate(all_camelcase_positions):
-        if end_position >= caret_position:
-            next_start_position, next_end_position = \
-                                                   start_position, end_position
-            break
-        else:
-            last_start_position, last_end_position = \
-                                                   start_position, end_position
-    else:
-        next_start_position = next_end_position = None        
-    return ((last_start_position, last_end_position),
-            (next_start_position, next_end_position))
-
-
 def select_next_camelcase(editor=wingapi.kArgEditor,
                           app=wingapi.kArgApplication):
     '''
@@ -72,9 +40,10 @@ def select_next_camelcase(editor=wingapi.kArgEditor,
 
     caret_position = editor.GetSelection()[1] + 1
     
-    _, next_camelcase_position = \
-                      _get_relevant_camelcase_positions(editor, caret_position)
-    if next_camelcase_position != (None, None):
+    next_camelcase_position = shared.get_token_index(document).find_next(
+        'camelcase', caret_position
+    )
+    if next_camelcase_position is not None:
         app.ExecuteCommand('set-visit-history-anchor')
         editor.SetSelection(*next_camelcase_position)
 
@@ -94,9 +63,10 @@ def select_prev_camelcase(editor=wingapi.kArgEditor,
     
     caret_position = editor.GetSelection()[0]
     
-    prev_camelcase_position, _  = \
-                      _get_relevant_camelcase_positions(editor, caret_position)
-    if prev_camelcase_position != (None, None):
+    prev_camelcase_position = shared.get_token_index(document).find_previous(
+        'camelcase', caret_position
+    )
+    if prev_camelcase_position is not None:
         app.ExecuteCommand('set-visit-history-anchor')
         editor.SetSelection(*prev_camelcase_position)
     
\ No newline at end of file
@@ -25,41 +25,13 @@ import edit
 import shared
 
 
-constant_pattern = re.compile(
-    r'''(?<![A-za-z0-9_])(?:_[0-9_]*)?(?:[A-Z][0-9_]*){2,}(?![A-za-z0-9_])'''
-)
-
-
-def _get_all_constant_positions(editor):
-    text = shared.get_text(editor.GetDocument())
-    matches = tuple(constant_pattern.finditer(text))
-    return tuple((match.start(), match.end()) for match in matches)
-
-
-def _get_relevant_constant_positions(editor, caret_position):
-    assert isinstance(editor, wingapi.CAPIEditor)
-    all_constant_positions = _get_all_constant_positions(editor)
-    last_start_position = last_end_position = None
-    for i, (start_position, end_position) in enumerate(all_constant_positions):
-        if end_position >= caret_position:
-            next_start_position, next_end_position = \
-                                                   start_position, end_position
-            break
-        else:
-            last_start_position, last_end_position = \
-                                                   start_position, end_position
-    else:
-        next_start_position = next_end_position = None        
-    return ((last_start_position, last_end_position),
-            (next_start_position, next_end_position))
-
-
 def select_next_constant(editor=wingapi.kArgEditor,
                        app=wingapi.kArgApplication):
     '''
     Select the next (or current) constant in the document.
     
     Constant means a name in all caps, like DEBUG or LOGIN_REDIRECT_URL.
+    Constants in strings and comments are skipped.
     
     Suggested key combination: `Ctrl-Alt-O`
     '''
@@ -68,9 +40,10 @@ def select_next_constant(editor=wingapi.kArgEditor,
 
     caret_position = editor.GetSelection()[1] + 1
     
-    _, next_constant_position = _get_relevant_constant_positions(editor,
-                                                            caret_position)
-    if next_constant_position != (None, None):
+    next_constant_position = shared.get_token_index(document).find_next(
+        'constant', caret_position
+    )
+    if next_constant_position is not None:
         app.ExecuteCommand('set-visit-history-anchor')
         editor.SetSelection(*next_constant_position)
 
@@ -81,6 +54,7 @@ def select_prev_constant(editor=wingapi.kArgEditor,
     Select the previous constant in the document.
     
     Constant means a name in all caps, like DEBUG or LOGIN_REDIRECT_URL.
+    Constants in strings and comments are skipped.
     
     Suggested key combination: `Ctrl-Alt-Shift-O`
     '''
@@ -89,9 +63,10 @@ def select_prev_constant(editor=wingapi.kArgEditor,
     
     caret_position = editor.GetSelection()[0]
     
-    prev_constant_position, _  = _get_relevant_constant_positions(editor,
-                                                             caret_position)
-    if prev_constant_position != (None, None):
+    prev_constant_position = shared.get_token_index(document).find_previous(
+        'constant', caret_position
+    )
+    if prev_constant_position is not None:
         app.ExecuteCommand('set-visit-history-anchor')
         editor.SetSelection(*prev_constant_position)
     
\ No newline at end of file
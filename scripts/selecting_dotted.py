@@ -25,34 +25,6 @@ import edit
 import shared
 
 
-dotted_pattern = re.compile(
-    r'''(?:[a-zA-Z_][a-zA-Z_0-9]*\.)+[a-zA-Z_][a-zA-Z_0-9]*'''
-)
-
-
-def _get_all_dotted_positions(editor):
-    text = shared.get_text(editor.GetDocument())
-    matches = tuple(dotted_pattern.finditer(text))
-    return tuple((match.start(), match.end()) for match in matches)
-
-def _get_relevant_dotted_positions(editor, caret_position):
-    assert isinstance(editor, wingapi.CAPIEditor)
-    all_dotted_positions = _get_all_dotted_positions(editor)
-    last_start_position = last_end_position = None
-    for i, (start_position, end_position) in enumerate(all_dotted_positions):
-        if end_position >= caret_position:
-            next_start_position, next_end_position = \
-                                                   start_position, end_position
-            break
-        else:
-            last_start_position, last_end_position = \
-                                                   start_position, end_position
-    else:
-        next_start_position = next_end_position = None        
-    return ((last_start_position, last_end_position),
-            (next_start_position, next_end_position))
-
-
 def select_next_dotted(editor=wingapi.kArgEditor,
                          app=wingapi.kArgApplication):
     '''
@@ -65,9 +37,10 @@ def select_next_dotted(editor=wingapi.kArgEditor,
 
     caret_position = editor.GetSelection()[1] + 1
     
-    _, next_dotted_position = \
-                      _get_relevant_dotted_positions(editor, caret_position)
-    if next_dotted_position != (None, None):
+    next_dotted_position = shared.get_token_index(document).find_next(
+        'dotted', caret_position
+    )
+    if next_dotted_position is not None:
         app.ExecuteCommand('set-visit-history-anchor')
         editor.SetSelection(*next_dotted_position)
 
@@ -84,9 +57,10 @@ def select_prev_dotted(editor=wingapi.kArgEditor,
     
     caret_position = editor.GetSelection()[0]
     
-    prev_dotted_position, _  = \
-                      _get_relevant_dotted_positions(editor, caret_position)
-    if prev_dotted_position != (None, None):
+    prev_dotted_position = shared.get_token_index(document).find_previous(
+        'dotted', caret_position
+    )
+    if prev_dotted_position is not None:
         app.ExecuteCommand('set-visit-history-anchor')
         editor.SetSelection(*prev_dotted_position)
 
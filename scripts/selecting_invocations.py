@@ -10,8 +10,8 @@ See their documentation for more information.
 from __future__ import with_statement
 
 import keyword
-import itertools
 import re
+import ast
 import _ast
 import bisect
 
@@ -31,9 +31,6 @@ import shared
 invocation_pattern = re.compile(
     r'''(?<!def )(?<!class )(?<![A-Za-z_0-9])([A-Za-z_][A-Za-z_0-9]*) *\('''
 )    
-invocation_pattern_for_arguments = re.compile(
-    r'''(?<![A-Za-z_0-9])([A-Za-z_][A-Za-z_0-9]*) *\('''
-)    
     
 def _ast_parse(string):
     return compile(string.replace('\r', ''), '<unknown>', 'exec',
@@ -45,15 +42,30 @@ class ArgumentSearchingFailed(Exception):
            
 
 
-def _collect_offsets(call_string, limit_to_keywords=False):
+def _get_call_offsets(call, get_position):
+    offsets = []
+    for arg in call.args:
+        a = arg
+        while isinstance(a, _ast.BinOp):
+            a = a.left
+        offsets.append(get_position(a.lineno, a.col_offset))
+    for kw in call.keywords:
+        offsets.append(get_position(kw.value.lineno, kw.value.col_offset))
+    if call.starargs:
+        offsets.append(get_position(call.starargs.lineno,
+                                    call.starargs.col_offset))
+    if call.kwargs:
+        offsets.append(get_position(call.kwargs.lineno,
+                                    call.kwargs.col_offset))
+    return offsets
+
+
+def _collect_offsets(call_string):
+    line_index = shared.LineIndex(call_string)
     def _abs_offset(lineno, col_offset):
-        current_lineno = 0
-        total = 0
-        for line in call_string.splitlines():
-            current_lineno += 1
-            if current_lineno == lineno:
-                return col_offset + total
-            total += len(line)
+        # (On the first line, `col_offset` counts the `f` we parse with.)
+        return line_index.get_line_start(lineno - 1) + col_offset - \
+                                                              (lineno == 1)
     # parse call_string with ast
     #print('f' + call_string)
     try:
@@ -66,26 +78,21 @@ def _collect_offsets(call_string, limit_to_keywords=False):
         raise ArgumentSearchingFailed
 
     # collect offsets provided by ast
-    offsets = []
-    for arg in call.args:
-        a = arg
-        while isinstance(a, _ast.BinOp):
-            a = a.left
-        offsets.append(_abs_offset(a.lineno, a.col_offset))
-    for kw in call.keywords:
-        offsets.append(_abs_offset(kw.value.lineno, kw.value.col_offset))
-    if call.starargs:
-        offsets.append(_abs_offset(call.starargs.lineno,
-                                   call.starargs.col_offset))
-    if call.kwargs:
-        offsets.append(_abs_offset(call.kwargs.lineno,
-                                   call.kwargs.col_offset))
+    offsets = _get_call_offsets(call, _abs_offset)
     offsets.append(len(call_string))
     return offsets
 
-@caching.cache(max_size=1000)
-def _argpos(call_string, document_offset, limit_to_keywords=False):
-    #print(call_string)
+
+_keyword_argument_pattern = re.compile(r'''^ *[A-Za-z_][A-Za-z_0-9]* *=''')
+
+
+def _get_argument_spans(call_string, offsets):
+    '''
+    Get the spans of the arguments in `call_string`.
+    
+    `offsets` are where the arguments' values start, followed by the length of
+    `call_string`. Returns a list of `(start, end, is_keyword)`.
+    '''
     def _find_start(prev_end, offset):
         s = call_string[prev_end:offset]
         #print(repr(s))
@@ -96,12 +103,6 @@ def _argpos(call_string, document_offset, limit_to_keywords=False):
         m = re.search('(\s*)$', s[:max(s.rfind(','), s.rfind(')'))])
         return start + m.start()
 
-    try:
-        offsets = _collect_offsets(call_string,
-                                   limit_to_keywords=limit_to_keywords)
-    except ArgumentSearchingFailed:
-        return ()
-
     result = []
     # previous end
     end = 0
@@ -115,29 +116,160 @@ def _argpos(call_string, document_offset, limit_to_keywords=False):
         except AttributeError:
             continue
         #print 'R:', start, end
-        if limit_to_keywords:
-            candidate = call_string[start:end]
-            if not re.match(r'''^ *[A-Za-z_][A-Za-z_0-9]* *=''', candidate):
-                continue
-        result.append((start, end))
-    final_result = tuple((start + document_offset, end + document_offset)
-                         for (start, end) in result)
-    #print(final_result)
-    return final_result
+        is_keyword = bool(
+            _keyword_argument_pattern.match(call_string[start:end])
+        )
+        result.append((start, end, is_keyword))
+    return result
 
-def _get_span_of_opening_parenthesis(document, position):
-    assert isinstance(document, wingapi.CAPIDocument)
-    document_text = shared.get_text(document)
-    if not document_text[position] == '(': raise Exception
-    for i in range(1, len(document_text) - position):
-        portion = document_text[position:position+i+1]
-        if portion.count('(') == portion.count(')'):
-            if not portion[-1] == ')': raise Exception
-            return (position, position + i + 1)
-    else:
+
+@caching.cache(max_size=1000)
+def _argpos(call_string):
+    try:
+        offsets = _collect_offsets(call_string)
+    except ArgumentSearchingFailed:
+        return ()
+    return tuple(_get_argument_spans(call_string, offsets))
+
+
+def _get_span_of_opening_parenthesis(bracket_pairs, position):
+    closing_position = bracket_pairs.get(position)
+    if closing_position is None:
         return (position, position)
+    else:
+        return (position, closing_position + 1)
         
     
+_definition_pattern = re.compile(
+    r'''(?<![A-Za-z_0-9])(?:def|class)\s+([A-Za-z_][A-Za-z_0-9]*)\s*\('''
+)
+
+
+def _find_argument_spans_by_parsing(statement_text, bracket_pairs):
+    tree = _ast_parse(statement_text)
+    line_index = shared.LineIndex(statement_text)
+    get_position = lambda lineno, col_offset: \
+                           line_index.get_line_start(lineno - 1) + col_offset
+    opening_parentheses = sorted(
+        position for position in bracket_pairs if 
+                                              statement_text[position] == '('
+    )
+    spans = []
+    for node in ast.walk(tree):
+        if isinstance(node, _ast.Call):
+            offsets = _get_call_offsets(node, get_position)
+            if not offsets:
+                continue
+            # The call's parenthesis is the outermost one between the start
+            # of the call and its first argument that's still open there.
+            first_offset = min(offsets)
+            i = bisect.bisect_right(opening_parentheses,
+                                    get_position(node.lineno, node.col_offset))
+            while i < len(opening_parentheses) and \
+                    opening_parentheses[i] <= first_offset and \
+                    bracket_pairs[opening_parentheses[i]] < first_offset:
+                i += 1
+            if i == len(opening_parentheses) or \
+                                      opening_parentheses[i] > first_offset:
+                continue
+            parenthesis_start = opening_parentheses[i]
+            call_string = statement_text[
+                parenthesis_start : bracket_pairs[parenthesis_start] + 1
+            ]
+            spans.extend(
+                (parenthesis_start + start, parenthesis_start + end,
+                 is_keyword) for (start, end, is_keyword) in
+                    _get_argument_spans(
+                        call_string,
+                        [offset - parenthesis_start for offset in offsets] + 
+                                                           [len(call_string)]
+                    )
+            )
+        elif isinstance(node, (_ast.FunctionDef, _ast.ClassDef)):
+            # Parameters and base classes count as arguments too.
+            match = _definition_pattern.search(
+                statement_text, get_position(node.lineno, node.col_offset)
+            )
+            if not match or match.group(1) != node.name:
+                continue
+            parenthesis_start, parenthesis_end = \
+                _get_span_of_opening_parenthesis(bracket_pairs,
+                                                 match.end() - 1)
+            spans.extend(
+                (parenthesis_start + start, parenthesis_start + end,
+                 is_keyword) for (start, end, is_keyword) in
+                        _argpos(statement_text[parenthesis_start:
+                                                           parenthesis_end])
+            )
+    return spans
+
+
+class _StatementArguments(object):
+    '''The arguments in a top-level statement, relative to its start.'''
+    
+    def __init__(self, spans):
+        self.by_start = sorted(spans)
+        self.starts = [start for (start, end) in self.by_start]
+        self.by_end = sorted(spans, key=lambda (start, end): (end, start))
+        self.ends = [end for (start, end) in self.by_end]
+        
+
+class ArgumentIndex(shared.StatementIndex):
+    '''
+    Index of the arguments of all the calls in a document.
+    
+    Each top-level statement is parsed once, and parsed again only when an
+    edit touches it. Code that doesn't parse, like a statement that's being
+    typed, goes through `shared.RecoveringParse` instead.
+    '''
+    
+    def analyze_statement(self, statement_text):
+        bracket_pairs = shared.find_bracket_pairs(statement_text)
+        try:
+            raw_spans = _find_argument_spans_by_parsing(statement_text,
+                                                        bracket_pairs)
+        except (SyntaxError, TypeError, ValueError):
+            raw_spans = shared.RecoveringParse(statement_text).argument_spans
+        spans = [
+            shared.strip_segment_from_whitespace_and_newlines(statement_text,
+                                                              start, end)
+            for (start, end, is_keyword) in raw_spans
+        ]
+        keyword_spans = [
+            span for span, (start, end, is_keyword) in zip(spans, raw_spans)
+            if is_keyword
+        ]
+        return (_StatementArguments(spans), _StatementArguments(keyword_spans))
+    
+    def find_next(self, position, limit_to_keywords=False):
+        '''Find the first argument that ends at or after `position`.'''
+        for i in xrange(self.get_statement_number(position),
+                        len(self.statement_starts)):
+            statement_start = self.statement_starts[i]
+            arguments = self.results[i][limit_to_keywords]
+            j = bisect.bisect_left(arguments.ends, position - statement_start)
+            if j < len(arguments.ends):
+                start, end = arguments.by_end[j]
+                return (statement_start + start, statement_start + end)
+        return None
+    
+    def find_previous(self, position, limit_to_keywords=False):
+        '''Find the last argument that starts before `position`.'''
+        for i in xrange(self.get_statement_number(position), -1, -1):
+            statement_start = self.statement_starts[i]
+            arguments = self.results[i][limit_to_keywords]
+            j = bisect.bisect_left(arguments.starts,
+                                   position - statement_start) - 1
+            if j >= 0:
+                start, end = arguments.by_start[j]
+                return (statement_start + start, statement_start + end)
+        return None
+    
+    
+def _get_argument_index(document):
+    '''Get the `ArgumentIndex` of `document`.'''
+    return shared.get_patched_index(document, 'argument_index', ArgumentIndex)
+    
 
 def _get_matches(document):
     assert isinstance(document, wingapi.CAPIDocument)
@@ -145,56 +277,10 @@ def _get_matches(document):
     return tuple(match for match in invocation_pattern.finditer(document_text)
                  if not keyword.iskeyword(match.groups()[0]))
 
-def _get_matches_for_arguments(document, truncate=None):
-    assert isinstance(document, wingapi.CAPIDocument)
-    document_text = shared.get_text(document)
-    if truncate:
-        truncate_position, truncate_radius = truncate
-        if len(document_text) > truncate_radius * 2:
-            old_document_text = document_text
-            document_text = (
-                ' ' * abs(truncate_position - truncate_radius) +
-                document_text[truncate_position-truncate_radius
-                                            :truncate_position+truncate_radius]
-            )
-    return tuple(match for match in
-                 invocation_pattern_for_arguments.finditer(document_text)
-                 if not keyword.iskeyword(match.groups()[0]))
-
 def _get_invocation_positions(document):
     matches = _get_matches(document)
     return tuple(match.span(1) for match in matches)
     
-def _get_argument_batch_positions(document, truncate=None):
-    matches = _get_matches_for_arguments(document, truncate=truncate)
-    parenthesis_starts = tuple(match.span(0)[1]-1 for match in matches)
-    return map(
-        lambda parenthesis_start:
-                  _get_span_of_opening_parenthesis(document, parenthesis_start),
-        parenthesis_starts
-    )
-    
-def _get_argument_positions(document, limit_to_keywords=False, truncate=None):
-    argument_batch_positions = _get_argument_batch_positions(document,
-                                                             truncate=truncate)
-    document_text = shared.get_text(document)
-    raw_argument_positions = tuple(itertools.chain(
-        *(_argpos(
-            document_text[argument_batch_position[0]:
-                                                   argument_batch_position[1]],
-            document_offset=argument_batch_position[0],
-            limit_to_keywords=limit_to_keywords
-        )
-                       for argument_batch_position in argument_batch_positions)
-    ))
-    argument_positions = map(
-        lambda (start, end):
-            shared.strip_segment_from_whitespace_and_newlines(document_text,
-                                                              start, end),
-        raw_argument_positions
-    )
-    return argument_positions
-
 ###############################################################################
 
 
@@ -258,21 +344,13 @@ def select_next_argument(editor=wingapi.kArgEditor,
     _, position = editor.GetSelection()
     position += 1
 
-    argument_positions = _get_argument_positions(
-        editor.GetDocument(),
-        limit_to_keywords=limit_to_keywords,
-        truncate=(position, 3000)
+    argument_position = _get_argument_index(editor.GetDocument()).find_next(
+        position, limit_to_keywords=limit_to_keywords
     )
-    #print(argument_positions)
-    argument_positions = sorted(argument_positions,
-                                key=(lambda (start, end): end))
-    argument_ends = tuple(argument_position[1] for argument_position in
-                          argument_positions)
-    argument_index = bisect.bisect_left(argument_ends, position)
     
-    if 0 <= argument_index < len(argument_ends):
+    if argument_position is not None:
         app.ExecuteCommand('set-visit-history-anchor')
-        editor.SetSelection(*argument_positions[argument_index])
+        editor.SetSelection(*argument_position)
         
 
 def select_prev_argument(editor=wingapi.kArgEditor,
@@ -290,21 +368,13 @@ def select_prev_argument(editor=wingapi.kArgEditor,
     position, _ = editor.GetSelection()
     position -= 1
 
-    argument_positions = _get_argument_positions(
-        editor.GetDocument(),
-        limit_to_keywords=limit_to_keywords,
-        truncate=(position, 3000)
-    )
-    #print(argument_positions)
-    argument_positions = sorted(argument_positions,
-                                key=(lambda (start, end): start))
-    argument_ends = tuple(argument_position[0] for argument_position in
-                          argument_positions)
-    argument_index = bisect.bisect_left(argument_ends, position) - 1
+    argument_position = _get_argument_index(
+        editor.GetDocument()
+    ).find_previous(position, limit_to_keywords=limit_to_keywords)
     
-    if 0 <= argument_index < len(argument_ends):
+    if argument_position is not None:
         app.ExecuteCommand('set-visit-history-anchor')
-        editor.SetSelection(*argument_positions[argument_index])
+        editor.SetSelection(*argument_position)
         
         
 def remove_invocation(editor=wingapi.kArgEditor,
@@ -25,38 +25,13 @@ import edit
 import shared
 
 
-number_pattern = re.compile(r'''-?(([0-9]+(\.[0-9]+)?)|(\.[0-9]+))''')
-
-
-def _get_all_number_positions(editor):
-    text = shared.get_text(editor.GetDocument())
-    matches = tuple(number_pattern.finditer(text))
-    return tuple((match.start(), match.end()) for match in matches)
-
-
-def _get_relevant_number_positions(editor, caret_position):
-    assert isinstance(editor, wingapi.CAPIEditor)
-    all_number_positions = _get_all_number_positions(editor)
-    last_start_position = last_end_position = None
-    for i, (start_position, end_position) in enumerate(all_number_positions):
-        if end_position >= caret_position:
-            next_start_position, next_end_position = \
-                                                   start_position, end_position
-            break
-        else:
-            last_start_position, last_end_position = \
-                                                   start_position, end_position
-    else:
-        next_start_position = next_end_position = None        
-    return ((last_start_position, last_end_position),
-            (next_start_position, next_end_position))
-
-
 def select_next_number(editor=wingapi.kArgEditor,
                        app=wingapi.kArgApplication):
     '''
     Select the next (or current) number in the document.
     
+    Numbers in strings and comments are skipped.
+    
     Suggested key combination: `Ctrl-0`
     '''
     assert isinstance(editor, wingapi.CAPIEditor)
@@ -64,9 +39,10 @@ def select_next_number(editor=wingapi.kArgEditor,
 
     caret_position = editor.GetSelection()[1] + 1
     
-    _, next_number_position = _get_relevant_number_positions(editor,
-                                                            caret_position)
-    if next_number_position != (None, None):
+    next_number_position = shared.get_token_index(document).find_next(
+        'number', caret_position
+    )
+    if next_number_position is not None:
         app.ExecuteCommand('set-visit-history-anchor')
         editor.SetSelection(*next_number_position)
 
@@ -76,6 +52,8 @@ def select_prev_number(editor=wingapi.kArgEditor,
     '''
     Select the previous number in the document.
     
+    Numbers in strings and comments are skipped.
+    
     Suggested key combination: `Ctrl-9`
     '''
     assert isinstance(editor, wingapi.CAPIEditor)
@@ -90,9 +68,10 @@ def select_prev_number(editor=wingapi.kArgEditor,
     
     caret_position = editor.GetSelection()[0]
     
-    prev_number_position, _  = _get_relevant_number_positions(editor,
-                                                             caret_position)
-    if prev_number_position != (None, None):
+    prev_number_position = shared.get_token_index(document).find_previous(
+        'number', caret_position
+    )
+    if prev_number_position is not None:
         app.ExecuteCommand('set-visit-history-anchor')
         editor.SetSelection(*prev_number_position)
     
\ No newline at end of file
@@ -25,62 +25,6 @@ import edit
 import shared
 
 
-assignment_pattern = re.compile(
-    r'''(?<!!|<|>|=)(?:\+|-|\*\*?|//?|%|\||\^|&|>>|<<)?=(?!=)'''
-)
-operator_pattern = re.compile(
-    r'''(?<!<|>)'''
-    r'''(?:\+|-|\*\*?|//?|%|\||\^|&|>>|<<|~|==|!=|<|<=|>|>=)(?!=|\*|/|<|>)'''
-)
-
-
-def _get_all_operator_positions(editor):
-    text = shared.get_text(editor.GetDocument())
-    matches = tuple(operator_pattern.finditer(text))
-    return tuple((match.start(), match.end()) for match in matches)
-
-def _get_all_assignment_positions(editor):
-    text = shared.get_text(editor.GetDocument())
-    matches = tuple(assignment_pattern.finditer(text))
-    return tuple((match.start(), match.end()) for match in matches)
-
-
-def _get_relevant_operator_positions(editor, caret_position):
-    assert isinstance(editor, wingapi.CAPIEditor)
-    all_operator_positions = _get_all_operator_positions(editor)
-    last_start_position = last_end_position = None
-    for i, (start_position, end_position) in enumerate(all_operator_positions):
-        if end_position >= caret_position:
-            next_start_position, next_end_position = \
-                                                   start_position, end_position
-            break
-        else:
-            last_start_position, last_end_position = \
-                                                   start_position, end_position
-    else:
-        next_start_position = next_end_position = None        
-    return ((last_start_position, last_end_position),
-            (next_start_position, next_end_position))
-
-
-def _get_relevant_assignment_positions(editor, caret_position):
-    assert isinstance(editor, wingapi.CAPIEditor)
-    all_assignment_positions = _get_all_assignment_positions(editor)
-    last_start_position = last_end_position = None
-    for i, (start_position, end_position) in enumerate(all_assignment_positions):
-        if end_position >= caret_position:
-            next_start_position, next_end_position = \
-                                                   start_position, end_position
-            break
-        else:
-            last_start_position, last_end_position = \
-                                                   start_position, end_position
-    else:
-        next_start_position = next_end_position = None        
-    return ((last_start_position, last_end_position),
-            (next_start_position, next_end_position))
-
-
 def select_next_operator(editor=wingapi.kArgEditor,
                          app=wingapi.kArgApplication):
     '''
@@ -90,6 +34,8 @@ def select_next_operator(editor=wingapi.kArgEditor,
     
         + - * / ** // % | & ^ << >> == != < <= > >=
     
+    Operators in strings and comments are skipped.
+    
     Suggested key combination: `Alt-Backslash`
     '''
     assert isinstance(editor, wingapi.CAPIEditor)
@@ -97,9 +43,10 @@ def select_next_operator(editor=wingapi.kArgEditor,
 
     caret_position = editor.GetSelection()[1] + 1
     
-    _, next_operator_position = \
-                      _get_relevant_operator_positions(editor, caret_position)
-    if next_operator_position != (None, None):
+    next_operator_position = shared.get_token_index(document).find_next(
+        'operator', caret_position
+    )
+    if next_operator_position is not None:
         app.ExecuteCommand('set-visit-history-anchor')
         editor.SetSelection(*next_operator_position)
 
@@ -113,6 +60,8 @@ def select_prev_operator(editor=wingapi.kArgEditor,
     
         + - * / ** // % | & ^ << >> == != < <= > >=
     
+    Operators in strings and comments are skipped.
+    
     Suggested key combination: `Alt-Bar`
     '''
     assert isinstance(editor, wingapi.CAPIEditor)
@@ -120,9 +69,10 @@ def select_prev_operator(editor=wingapi.kArgEditor,
     
     caret_position = editor.GetSelection()[0]
     
-    prev_operator_position, _  = \
-                      _get_relevant_operator_positions(editor, caret_position)
-    if prev_operator_position != (None, None):
+    prev_operator_position = shared.get_token_index(document).find_previous(
+        'operator', caret_position
+    )
+    if prev_operator_position is not None:
         app.ExecuteCommand('set-visit-history-anchor')
         editor.SetSelection(*prev_operator_position)
 
@@ -136,6 +86,8 @@ def select_next_assignment(editor=wingapi.kArgEditor,
     
         = += -= *= /= **= //= %= |= &= ^= <<= >>=
     
+    Assignments in strings and comments are skipped.
+    
     Suggested key combination: `Ctrl-Alt-Backslash`
     '''
     assert isinstance(editor, wingapi.CAPIEditor)
@@ -143,9 +95,10 @@ def select_next_assignment(editor=wingapi.kArgEditor,
 
     caret_position = editor.GetSelection()[1] + 1
     
-    _, next_assignment_position = \
-                      _get_relevant_assignment_positions(editor, caret_position)
-    if next_assignment_position != (None, None):
+    next_assignment_position = shared.get_token_index(document).find_next(
+        'assignment', caret_position
+    )
+    if next_assignment_position is not None:
         app.ExecuteCommand('set-visit-history-anchor')
         editor.SetSelection(*next_assignment_position)
 
@@ -158,6 +111,8 @@ def select_prev_assignment(editor=wingapi.kArgEditor,
     This includes:
     
         = += -= *= /= **= //= %= |= &= ^= <<= >>=
+    
+    Assignments in strings and comments are skipped.
 
     Suggested key combination: `Ctrl-Alt-Bar`
     '''
@@ -166,9 +121,10 @@ def select_prev_assignment(editor=wingapi.kArgEditor,
     
     caret_position = editor.GetSelection()[0]
     
-    prev_assignment_position, _  = \
-                      _get_relevant_assignment_positions(editor, caret_position)
-    if prev_assignment_position != (None, None):
+    prev_assignment_position = shared.get_token_index(document).find_previous(
+        'assignment', caret_position
+    )
+    if prev_assignment_position is not None:
         app.ExecuteCommand('set-visit-history-anchor')
         editor.SetSelection(*prev_assignment_position)
     
\ No newline at end of file
@@ -10,8 +10,8 @@ See their documentation for more information.
 from __future__ import with_statement
 
 import bisect
+import keyword
 import re
-import _ast
 
 import os.path, sys
 sys.path += [
@@ -25,103 +25,120 @@ import wingapi
 import shared
 
 
-SAFETY_LIMIT = 60
-'''The maximum number of times we'll do `select-more` before giving up.'''
-
-def _ast_parse(string):
-    return compile(string, '<unknown>', 'exec', _ast.PyCF_ONLY_AST)
+class ExpressionIndex(shared.StatementIndex):
+    '''
+    Index of the spans of the Python expressions in a document.
     
-
-def _is_expression(string):
-    '''Is `string` a Python expression?'''
+    The expressions are found by `shared.RecoveringParse`, so code that's
+    being typed has them too. Each top-level statement is parsed once, and
+    parsed again only when an edit touches it.
+    '''
     
-    # Throwing out '\r' characters because `ast` can't process them for some
-    # reason:
-    string = string.replace('\r', '')
-    try:
-        nodes = _ast_parse(string).body
-    except SyntaxError:
-        return False
-    else:
-        if len(nodes) != 1:
-            return False
-        else:
-            (node,) = nodes
-            return type(node) == _ast.Expr
+    def analyze_statement(self, statement_text):
+        return sorted(shared.RecoveringParse(statement_text).expression_spans)
+        
+    def get_enclosing_expressions(self, start, end):
+        '''Get the spans of the expressions that contain `start` to `end`.'''
+        i = self.get_statement_number(start)
+        statement_start = self.statement_starts[i]
+        expression_spans = self.results[i]
+        relative_start = start - statement_start
+        relative_end = end - statement_start
+        n_candidates = bisect.bisect_right(expression_spans,
+                                           (relative_start, sys.maxint))
+        return [
+            (statement_start + expression_start,
+             statement_start + expression_end) for
+            (expression_start, expression_end) in
+                                         expression_spans[:n_candidates]
+            if expression_end >= relative_end
+        ]
+            
     
+def _get_expression_index(document):
+    '''Get the `ExpressionIndex` of `document`.'''
+    return shared.get_patched_index(document, 'expression_index',
+                                    ExpressionIndex)
 
 
 variable_name_pattern_text = r'[a-zA-Z_][0-9a-zA-Z_]*'
 dotted_name_pattern = re.compile(
-    r'\.?^%s(\.%s)*$' %
+    r'(?<![0-9a-zA-Z_])%s(?:\.%s)*' %
                        (variable_name_pattern_text, variable_name_pattern_text)
 )
 
-def _is_dotted_name(string):
-    '''Is `string` a dotted name?'''
-    assert isinstance(string, str)
-    return bool(dotted_name_pattern.match(string.strip()))
-    
 
-whitespace_characters = ' \n\r\t\f\v'
+def _get_dotted_name_spans(document):
+    '''Get the starts and ends of the dotted names in `document`.'''
+    def get_spans():
+        spans = [match.span() for match in
+                 dotted_name_pattern.finditer(shared.get_text(document))]
+        return ([start for (start, end) in spans],
+                [end for (start, end) in spans])
+    return shared.get_document_state(document).get_cached('dotted_name_spans',
+                                                          get_spans)
     
-def _is_whitespaceless_name(string):
-    '''Is `string` a whitespace-less name?'''
-    assert isinstance(string, str)
-    return not any((whitespace_character in string for whitespace_character
-                in whitespace_characters))
+
+def _get_enclosing_dotted_name(document, start, end):
+    '''Get the span of the dotted name that contains `start` to `end`.'''
+    starts, ends = _get_dotted_name_spans(document)
+    i = bisect.bisect_right(starts, start) - 1
+    if i >= 0 and ends[i] >= end:
+        return (starts[i], ends[i])
+    return None
     
 
-def _select_more_until_biggest_match(condition, editor=wingapi.kArgEditor):
-    '''`select-more` until reaching biggest text that satisfies `condition`.'''
-    assert isinstance(editor, wingapi.CAPIEditor)
-    document = editor.GetDocument()
-    select_more = lambda: wingapi.gApplication.ExecuteCommand('select-more')
-    is_selection_good = lambda: condition(
-        document.GetCharRange(*editor.GetSelection()).strip()
-    )
+_whitespace_pattern = re.compile(r'''[ \n\r\t\f\v]''')
 
-    last_success_n_iterations = None
-    
-    last_start, last_end = original_selection = editor.GetSelection()
-    
-    with shared.ScrollRestorer(editor):
-        with shared.SelectionRestorer(editor):
-            for i in range(SAFETY_LIMIT):
-                select_more()
-                current_start, current_end = editor.GetSelection()
-                if (current_start == last_start) and (current_end == last_end):
-                    break
-                if is_selection_good():
-                    last_success_n_iterations = i
-                last_start, last_end = current_start, current_end
-                
-        if last_success_n_iterations is not None:
-            for i in range(last_success_n_iterations+1):
-                select_more()
-            
+
+def _get_stripped_selection(editor):
+    return shared.strip_segment_from_whitespace_and_newlines(
+        shared.get_text(editor.GetDocument()), *editor.GetSelection()
+    )
+    
+    
+def _select_biggest(editor, spans):
+    if spans:
+        editor.SetSelection(
+            *max(spans, key=lambda (start, end): (end - start, -start))
+        )
+        
             
 def select_expression(editor=wingapi.kArgEditor):
     '''
     Select the Python expression that the cursor is currently on.
     
-    This does `select-more` until the biggest possible legal Python expression
-    is selected.
+    This selects the biggest legal Python expression that contains the
+    current selection.
 
     Suggested key combination: `Ctrl-Alt-Plus`
     '''
-    _select_more_until_biggest_match(_is_expression, editor)
+    assert isinstance(editor, wingapi.CAPIEditor)
+    document = editor.GetDocument()
+    start, end = _get_stripped_selection(editor)
+    spans = _get_expression_index(document).get_enclosing_expressions(start,
+                                                                     end)
+    if not spans:
+        # Not in code, like in a comment. A name is still an expression.
+        dotted_name = _get_enclosing_dotted_name(document, start, end)
+        if dotted_name and not \
+           keyword.iskeyword(shared.get_text(document)[slice(*dotted_name)]):
+            spans.append(dotted_name)
+    _select_biggest(editor, spans)
             
     
 def select_dotted_name(editor=wingapi.kArgEditor):
     '''
     Select the dotted name that the cursor is currently on, like `foo.bar.baz`.
     
-    This does `select-more` until the biggest possible dotted name is selected.
+    This selects the biggest dotted name that contains the current selection.
     
     Suggested key combination: `Alt-Plus`
     '''
-    _select_more_until_biggest_match(_is_dotted_name, editor)
+    assert isinstance(editor, wingapi.CAPIEditor)
+    dotted_name = _get_enclosing_dotted_name(editor.GetDocument(),
+                                             *_get_stripped_selection(editor))
+    _select_biggest(editor, [dotted_name] if dotted_name else [])
     
     
 def select_whitespaceless_name(editor=wingapi.kArgEditor):
@@ -130,26 +147,34 @@ def select_whitespaceless_name(editor=wingapi.kArgEditor):
     
     Example: `foo.bar.baz(e=3)`.
     
-    This does `select-more` until the biggest possible whitespace-less name is
-    selected.
+    This selects the biggest expression without whitespace that contains the
+    current selection.
     
     Suggested key combination: `Ctrl-Alt-Equal`
     '''
-    _select_more_until_biggest_match(_is_whitespaceless_name, editor)
-    
-
-_scope_name_pattern = re.compile(
-    r'''(?:^|[ \t\r\n])(?:def|class) +([a-zA-Z_][0-9a-zA-Z_]*)'''
-    r'''[ \t\r\n]*[(:]''',
-    flags=re.DOTALL
-)
-
-
-def _get_scope_name_positions(document):
+    assert isinstance(editor, wingapi.CAPIEditor)
+    document = editor.GetDocument()
     document_text = shared.get_text(document)
-    matches = _scope_name_pattern.finditer(document_text)
-    return tuple(match.span(1) for match in matches)
+    start, end = _get_stripped_selection(editor)
+    spans = [
+        (expression_start, expression_end) for
+        (expression_start, expression_end) in
+               _get_expression_index(document).get_enclosing_expressions(start,
+                                                                         end)
+        if not _whitespace_pattern.search(document_text, expression_start,
+                                          expression_end)
+    ]
+    dotted_name = _get_enclosing_dotted_name(document, start, end)
+    if dotted_name:
+        spans.append(dotted_name)
+    _select_biggest(editor, spans)
+    
 
+def _select_scope_name(editor, app, scope_outline, i):
+    if i is not None:
+        app.ExecuteCommand('set-visit-history-anchor')
+        editor.SetSelection(*scope_outline.get_name_span(i))
+        
 
 def select_next_scope_name(editor=wingapi.kArgEditor,
                            app=wingapi.kArgApplication):
@@ -164,14 +189,9 @@ def select_next_scope_name(editor=wingapi.kArgEditor,
     _, position = editor.GetSelection()
     position += 1
 
-    scope_name_positions = _get_scope_name_positions(editor.GetDocument())
-    scope_name_ends = tuple(scope_name_position[1] for scope_name_position in
-                            scope_name_positions)
-    scope_name_index = bisect.bisect_left(scope_name_ends, position)
-    
-    if 0 <= scope_name_index < len(scope_name_ends):
-        app.ExecuteCommand('set-visit-history-anchor')
-        editor.SetSelection(*scope_name_positions[scope_name_index])
+    scope_outline = shared.get_scope_outline(editor.GetDocument())
+    _select_scope_name(editor, app, scope_outline,
+                       scope_outline.find_next(position))
         
 
 def select_prev_scope_name(editor=wingapi.kArgEditor,
@@ -187,12 +207,64 @@ def select_prev_scope_name(editor=wingapi.kArgEditor,
     position, _ = editor.GetSelection()
     position -= 1
 
-    scope_name_positions = _get_scope_name_positions(editor.GetDocument())
-    scope_name_starts = tuple(scope_name_position[0] for scope_name_position
-                              in scope_name_positions)
-    scope_name_index = bisect.bisect_left(scope_name_starts, position) - 1
+    scope_outline = shared.get_scope_outline(editor.GetDocument())
+    _select_scope_name(editor, app, scope_outline,
+                       scope_outline.find_previous(position))
     
-    if 0 <= scope_name_index < len(scope_name_starts):
-        app.ExecuteCommand('set-visit-history-anchor')
-        editor.SetSelection(*scope_name_positions[scope_name_index])
-
+    
+def _get_current_scope(editor, scope_outline):
+    '''Get the scope whose name is selected, or else the one we're in.'''
+    start, end = editor.GetSelection()
+    i = scope_outline.find_next(end)
+    if i is not None and scope_outline.name_starts[i] <= start:
+        return i
+    return scope_outline.get_enclosing_scope(start)
+        
+        
+def select_next_sibling_scope_name(editor=wingapi.kArgEditor,
+                                   app=wingapi.kArgApplication):
+    '''
+    Select the name of the next scope at the same level as the current one.
+    
+    For example, in a method this goes to the name of the next method in the
+    class, skipping any functions defined inside this one.
+    '''    
+    assert isinstance(editor, wingapi.CAPIEditor)
+    scope_outline = shared.get_scope_outline(editor.GetDocument())
+    i = _get_current_scope(editor, scope_outline)
+    if i is not None:
+        _select_scope_name(editor, app, scope_outline,
+                           scope_outline.next_siblings[i])
+    
+    
+def select_prev_sibling_scope_name(editor=wingapi.kArgEditor,
+                                   app=wingapi.kArgApplication):
+    '''
+    Select the name of the previous scope at the same level as the current one.
+    
+    For example, in a method this goes to the name of the previous method in
+    the class.
+    '''    
+    assert isinstance(editor, wingapi.CAPIEditor)
+    scope_outline = shared.get_scope_outline(editor.GetDocument())
+    i = _get_current_scope(editor, scope_outline)
+    if i is not None:
+        _select_scope_name(editor, app, scope_outline,
+                           scope_outline.previous_siblings[i])
+    
+    
+def select_enclosing_scope_name(editor=wingapi.kArgEditor,
+                                app=wingapi.kArgApplication):
+    '''
+    Select the name of the function or class that the cursor is in.
+    
+    If that name is already selected, select the name of the scope around it,
+    so doing this again and again goes up from a method to its class.
+    '''    
+    assert isinstance(editor, wingapi.CAPIEditor)
+    scope_outline = shared.get_scope_outline(editor.GetDocument())
+    i = scope_outline.get_enclosing_scope(editor.GetSelection()[0])
+    if i is not None and \
+                     scope_outline.get_name_span(i) == editor.GetSelection():
+        i = scope_outline.parents[i]
+    _select_scope_name(editor, app, scope_outline, i)
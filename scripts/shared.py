@@ -5,10 +5,20 @@
 
 from  __future__ import with_statement
 
+import array
+import bisect
 import collections
+import itertools
+import keyword
+import operator
+import os.path
 import re
+import sre_constants
+import sre_parse
 import sys
 import subprocess
+import time
+import weakref
 
 from python_toolbox import context_management
 
@@ -163,17 +173,11 @@ def strip_selection_if_single_line(editor):
         editor.SetSelection(new_start, new_end)
     
     
-_whitespace_and_newlines_stripping_pattern = re.compile(
-    r'''^(?P<leading>[ \r\n\t]*)(?P<content>.*?)(?P<trailing>[ \r\n\t]*)$''',
-    flags=re.DOTALL
-)    
 def strip_segment_from_whitespace_and_newlines(text, start, end):
     
-    selection_text = text[start:end]
-    match = _whitespace_and_newlines_stripping_pattern.match(selection_text)
-    assert match
-    new_start = start + len(match.group('leading'))
-    new_end = end - len(match.group('trailing'))
+    stripped_text = text[start:end].lstrip(' \r\n\t')
+    new_start = end - len(stripped_text)
+    new_end = new_start + len(stripped_text.rstrip(' \r\n\t'))
     
     return new_start, new_end
     
@@ -210,26 +214,70 @@ def get_cursor_position(editor):
     return start        
 
 
-def select_current_word(editor=wingapi.kArgEditor):
-    '''Select the current word that the cursor is on.'''
+SELECT_CURRENT_WORD_WINDOW = 100
+'''
+Characters to fetch on each side of the caret when looking for a word.
+
+If the word runs off the edge of the fetched text, the window grows fourfold
+and we try again.
+'''
+
+_word_characters_pattern = re.compile(r'[0-9a-zA-Z_]*')
+_non_word_characters_pattern = re.compile(r'[^0-9a-zA-Z_]*')
+
+
+def _find_word_in_window(text, position):
+    '''
+    Find the word in `text` that `position` is on, or the word before it.
+    
+    Returns `(start, end)`, or `None` if there's no word before `position`.
+    '''
+    word_end = _word_characters_pattern.match(text, position).end()
+    reversed_head = text[position-1::-1] if position else ''
+    n_word_characters_before = \
+                           _word_characters_pattern.match(reversed_head).end()
+    if n_word_characters_before or word_end > position:
+        return (position - n_word_characters_before, word_end)
+    # Not on a word; doing what `backward-word` would, taking the word before:
+    n_gap = _non_word_characters_pattern.match(reversed_head).end()
+    word_length = \
+             _word_characters_pattern.match(reversed_head, n_gap).end() - n_gap
+    if not word_length:
+        return None
+    return (position - n_gap - word_length, position - n_gap)
+
+
+def select_current_word(editor=wingapi.kArgEditor,
+                        window_size=SELECT_CURRENT_WORD_WINDOW):
+    '''
+    Select the current word that the cursor is on.
+    
+    If the cursor isn't on a word, selects the word before it. Fetches only
+    `window_size` characters on each side of the cursor, growing the window
+    only if the word doesn't fit in it.
+    '''
     assert isinstance(editor, wingapi.CAPIEditor)
     document = editor.GetDocument()
     assert isinstance(document, wingapi.CAPIDocument)
-    editor.ExecuteCommand('backward-word')
-    start = get_cursor_position(editor)
-    length = 0
-    for length in range(1000): 
-        if start + length == document.GetLength():
-            break
+    position, _ = editor.GetSelection()
+    document_length = document.GetLength()
+    while True:
+        window_start = max(position - window_size, 0)
+        window_end = min(position + window_size, document_length)
+        text = document.GetCharRange(window_start, window_end)
+        word_span = _find_word_in_window(text, position - window_start)
+        if word_span is None:
+            if window_start == 0:
+                start = end = position
+                break
         else:
-            character = document.GetCharRange(start + length,
-                                              start + length + 1)
-            assert len(character) == 1
-            if character.isalnum() or character == '_':
-                continue
-            else:
+            relative_start, relative_end = word_span
+            if (relative_start > 0 or window_start == 0) and \
+                (relative_end < len(text) or window_end == document_length):
+                start = window_start + relative_start
+                end = window_start + relative_end
                 break
-    end = start + length
+        window_size *= 4
     editor.SetSelection(start, end)
     return start, end
 
@@ -301,20 +349,21 @@ def _move_half_page(direction, editor=wingapi.kArgEditor):
     document = editor.GetDocument()
     
     lines_to_move = editor.GetNumberOfVisibleLines() // 2
+    line_index = get_line_index(document)
     
     # Determining current location: ###########################################
     current_position, _ = editor.GetSelection()
-    current_line = document.GetLineNumberFromPosition(current_position)
-    column = current_position - document.GetLineStart(current_line)
+    current_line = line_index.get_line_number(current_position)
+    column = current_position - line_index.get_line_start(current_line)
     ###########################################################################
     
     # Determining new location to go to: ######################################
     new_line = current_line + (lines_to_move * direction)
-    length_of_new_line = \
-                document.GetLineEnd(new_line) - document.GetLineStart(new_line)
+    new_line_start = line_index.get_line_start(new_line)
+    length_of_new_line = line_index.get_line_end(new_line) - new_line_start
     new_column = min((column, length_of_new_line))
     new_position = _clip_to_document_range(
-        document.GetLineStart(new_line) + new_column,
+        new_line_start + new_column,
         document=document
     )
     ###########################################################################
@@ -327,15 +376,16 @@ def character_position_to_line_position(document, character_position,
                                         line_offset=0):
     ''' '''
     assert isinstance(document, wingapi.CAPIDocument)
-    line_number = document.GetLineNumberFromPosition(character_position)
-    line_position = character_position - document.GetLineStart(line_number)
+    line_index = get_line_index(document)
+    line_number = line_index.get_line_number(character_position)
+    line_position = character_position - line_index.get_line_start(line_number)
     return (line_number+line_offset, line_position)
     
     
 def line_position_to_character_position(document, line_number, line_position):
     ''' '''
     assert isinstance(document, wingapi.CAPIDocument)
-    return document.GetLineStart(line_number) + line_position
+    return get_line_index(document).get_line_start(line_number) + line_position
     
     
 def plural_word_to_singular_word(plural_word):
@@ -360,11 +410,1880 @@ def clip_ahk():
     autopy.key.tap(135) # F24 for making AHK think it's a new word
     
     
+MAX_PENDING_LINE_INDEX_EDITS = 50
+'''Edits we'll queue for patching a `LineIndex` before just rebuilding it.'''
+
+MAX_LOGGED_EDITS = 100
+'''Edits a `DocumentState` remembers for indexes that patch themselves.'''
+
+
+class DocumentState(object):
+    '''
+    Things we know about a document, valid until the document's text changes.
+    
+    Get one with `get_document_state`. Every time the document's `modified`
+    signal fires, `revision` goes up and everything cached for the old
+    revision is thrown away. As a safety net, a change in the document's length
+    that we didn't hear about does the same.
+    
+    The exceptions are `line_index`, which is patched after each edit rather
+    than thrown away, and `indexes`, which holds indexes that patch themselves
+    when queried, using `get_edits_since`.
+    '''
+    
+    def __init__(self, document):
+        assert isinstance(document, wingapi.CAPIDocument)
+        self.revision = 0
+        self.text = None
+        self.length = None
+        self.line_index = None
+        self.indexes = {}
+        self._cache = {}
+        self._edits = []
+        self._first_logged_revision = 0
+        self._document_reference = weakref.ref(document)
+        document.connect('modified', self._on_modified)
+        
+    def _on_modified(self, *args):
+        self.revision += 1
+        self.text = self.length = None
+        self._cache.clear()
+        self._log_edit(*args[:3])
+        if self.line_index is not None:
+            if len(args) >= 3 and self.line_index.n_pending_edits < \
+                                                  MAX_PENDING_LINE_INDEX_EDITS:
+                insert, position, length = args[:3]
+                if insert:
+                    self.line_index.record_edit(position, 0, length)
+                else:
+                    self.line_index.record_edit(position, length, 0)
+            else:
+                self.line_index = None
+                
+    def _log_edit(self, insert=None, position=None, length=None):
+        if position is None:
+            # We don't know what changed, so nothing before now can be patched.
+            del self._edits[:]
+            self._first_logged_revision = self.revision
+            return
+        if insert:
+            self._edits.append((self.revision, position, 0, length))
+        else:
+            self._edits.append((self.revision, position, length, 0))
+        if len(self._edits) > MAX_LOGGED_EDITS:
+            self._first_logged_revision = self._edits.pop(0)[0]
+            
+    def get_edits_since(self, revision):
+        '''
+        Get the edits made to the document since `revision`.
+        
+        Returns a list of `(position, n_removed, n_inserted)` tuples in the
+        order they were made, or `None` if we don't know all of them, in which
+        case whatever was built at `revision` should be rebuilt.
+        '''
+        if revision < self._first_logged_revision:
+            return None
+        return [edit[1:] for edit in self._edits if edit[0] > revision]
+        
+    def _check_length(self, length):
+        if length != self.length:
+            if self.length is not None:
+                self._on_modified()
+            self.length = length
+            
+    def get_cached(self, key, function):
+        '''
+        Get the value of `function()`, calling it at most once per revision.
+        
+        `key` identifies the value, for example `'word_spans'`.
+        '''
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = self._cache[key] = function()
+            return value
+        
+        
+_document_states = weakref.WeakKeyDictionary()
+
+
+def get_document_state(document):
+    '''Get the `DocumentState` of `document`, making sure it's current.'''
+    assert isinstance(document, wingapi.CAPIDocument)
+    try:
+        document_state = _document_states[document]
+    except KeyError:
+        document_state = _document_states[document] = DocumentState(document)
+    document_state._check_length(document.GetLength())
+    return document_state
+    
+    
 def get_text(document):
+    '''
+    Get the full text of `document`.
+    
+    The text is fetched once per document revision, so calling this many times
+    in a row is cheap, and gives the very same string object.
+    '''
     # Getting the text using `GetCharRange` instead of `GetText` because
     # `GetText` returns unicode.
-    assert isinstance(document, wingapi.CAPIDocument)
-    return document.GetCharRange(0, document.GetLength())
+    document_state = get_document_state(document)
+    if document_state.text is None:
+        document_state.text = document.GetCharRange(0, document_state.length)
+    return document_state.text
+
+
+_line_break_pattern = re.compile(r'\r\n|\r|\n')
+
+
+class LineIndex(object):
+    '''
+    Index of where the lines of a text start and end.
+    
+    The positions of the line breaks are kept in two compact `array`s, so
+    converting between character positions and line numbers is a bisect.
+    
+    A `LineIndex` can be patched with `record_edit` after the text is edited,
+    instead of being built again from the entire text. Edits are only queued,
+    and on the next lookup they're applied together: The text of the range
+    they changed is fetched with `get_char_range(start, end)` and searched for
+    line breaks. The breaks after the range aren't shifted right away; the
+    breaks from `_shift_index` on are kept without the `_shift` they need, so
+    an edit only has to touch the breaks between it and the previous edit.
+    '''
+    
+    def __init__(self, text, get_char_range=None):
+        self._get_char_range = get_char_range
+        self._pending_edits = []
+        self._build(text)
+        
+    def _build(self, text):
+        matches = tuple(_line_break_pattern.finditer(text))
+        self._break_starts = array.array('l', [match.start() for match in
+                                               matches])
+        self._break_ends = array.array('l', [match.end() for match in
+                                             matches])
+        self._shift_index = len(self._break_ends)
+        self._shift = 0
+        self.length = len(text)
+        
+    @property
+    def n_pending_edits(self):
+        return len(self._pending_edits)
+        
+    def record_edit(self, position, n_removed, n_inserted):
+        '''Record that `n_removed` characters in `position` were replaced.'''
+        assert self._get_char_range is not None
+        self._pending_edits.append((position, n_removed, n_inserted))
+        self.length += n_inserted - n_removed
+        
+    def _move_shift_index(self, shift_index):
+        '''Apply `_shift` to the breaks between `_shift_index` and here.'''
+        if self._shift and shift_index != self._shift_index:
+            if shift_index > self._shift_index:
+                moved, shift = slice(self._shift_index, shift_index), \
+                                                                   self._shift
+            else:
+                moved, shift = slice(shift_index, self._shift_index), \
+                                                                  -self._shift
+            for breaks in (self._break_starts, self._break_ends):
+                breaks[moved] = array.array('l', itertools.imap(
+                    operator.add, breaks[moved],
+                    itertools.repeat(shift, moved.stop - moved.start)
+                ))
+        self._shift_index = shift_index
+        
+    def _bisect_ends(self, position):
+        '''Get the number of line breaks that end before or at `position`.'''
+        index = bisect.bisect_right(self._break_ends, position, 0,
+                                    self._shift_index)
+        if index < self._shift_index:
+            return index
+        return bisect.bisect_right(self._break_ends, position - self._shift,
+                                   self._shift_index)
+    
+    def _get_break(self, breaks, index):
+        if index < self._shift_index:
+            return breaks[index]
+        return breaks[index] + self._shift
+        
+    def _apply_pending_edits(self):
+        pending_edits, self._pending_edits = self._pending_edits, []
+        # Finding the range that the edits changed, in the old positions,
+        # `[changed_start, old_changed_end)`, and in the new ones,
+        # `[changed_start, new_changed_end)`:
+        changed_start, n_removed, n_inserted = pending_edits[0]
+        old_changed_end = changed_start + n_removed
+        new_changed_end = changed_start + n_inserted
+        for position, n_removed, n_inserted in pending_edits[1:]:
+            if position + n_removed > new_changed_end:
+                old_changed_end += position + n_removed - new_changed_end
+                new_changed_end = position + n_removed
+            new_changed_end += n_inserted - n_removed
+            changed_start = min(changed_start, position)
+        if new_changed_end - changed_start > self.length // 2:
+            # The edits are all over the text, so rebuilding is quicker.
+            self._build(self._get_char_range(0, self.length))
+            return
+        
+        # Only line breaks that end in `(changed_start - 1, ...]` could have
+        # been changed by the edits, (like a `\r\n` that was split into two,)
+        # those that end before it are untouched, and those that end after it
+        # are just shifted.
+        window_start = max(changed_start - 2, 0)
+        window_text = self._get_char_range(
+            window_start, min(new_changed_end + 2, self.length)
+        )
+        new_breaks = [
+            (window_start + match.start(), window_start + match.end()) for
+            match in _line_break_pattern.finditer(window_text) if
+            changed_start - 1 < window_start + match.end() <=
+                                                           new_changed_end + 1
+        ]
+        first_index = self._bisect_ends(changed_start - 1)
+        last_index = self._bisect_ends(old_changed_end + 1)
+        self._move_shift_index(last_index)
+        self._break_starts[first_index:last_index] = array.array(
+            'l', [start for (start, end) in new_breaks]
+        )
+        self._break_ends[first_index:last_index] = array.array(
+            'l', [end for (start, end) in new_breaks]
+        )
+        self._shift_index = first_index + len(new_breaks)
+        self._shift += new_changed_end - old_changed_end
+            
+    def get_line_count(self):
+        if self._pending_edits:
+            self._apply_pending_edits()
+        return len(self._break_ends) + 1
+    
+    def get_line_number(self, position):
+        '''Get the number of the line that `position` is on.'''
+        if self._pending_edits:
+            self._apply_pending_edits()
+        return self._bisect_ends(position)
+    
+    def get_line_start(self, line_number):
+        '''Get the position where line number `line_number` starts.'''
+        if self._pending_edits:
+            self._apply_pending_edits()
+        line_number = min(max(line_number, 0), len(self._break_ends))
+        return self._get_break(self._break_ends, line_number - 1) if \
+                                                             line_number else 0
+    
+    def get_line_end(self, line_number):
+        '''Get the position where line `line_number` ends, before its EOL.'''
+        if self._pending_edits:
+            self._apply_pending_edits()
+        line_number = min(max(line_number, 0), len(self._break_ends))
+        if line_number == len(self._break_starts):
+            return self.length
+        else:
+            return self._get_break(self._break_starts, line_number)
+            
+            
+def get_line_index(document):
+    '''
+    Get a `LineIndex` for `document`.
+    
+    Built once per document and patched after every edit, so converting
+    between positions and lines is a local lookup instead of an API call.
+    '''
+    document_state = get_document_state(document)
+    line_index = document_state.line_index
+    if line_index is None or line_index.length != document_state.length:
+        document_reference = weakref.ref(document)
+        line_index = document_state.line_index = LineIndex(
+            get_text(document),
+            lambda start, end: document_reference().GetCharRange(start, end)
+        )
+    return line_index
+
+
+# String literals, allowing unterminated ones, like when they're being typed:
+_string_literal_pattern_text = (
+    r'''(?:[rR][bBfF]?|[uUbBfF][rR]?)?(?:'''
+    r'''\'\'\'[^'\\]*(?:(?:\\.|'(?!''))[^'\\]*)*(?:\'\'\'|\Z)|'''
+    r'''"""[^"\\]*(?:(?:\\.|"(?!""))[^"\\]*)*(?:"""|\Z)|'''
+    r''''[^'\\\r\n]*(?:\\.[^'\\\r\n]*)*'?|'''
+    r'''"[^"\\\r\n]*(?:\\.[^"\\\r\n]*)*"?)'''
+)
+
+_code_token_pattern = re.compile(
+    # Comments, string literals and brackets in Python code.
+    r'''(?P<comment>#[^\r\n]*)|'''
+    r'''(?P<string>%s)|'''
+    r'''(?P<bracket>[()\[\]{}])''' % _string_literal_pattern_text,
+    re.DOTALL
+)
+
+_closing_brackets = {'(': ')', '[': ']', '{': '}'}
+
+
+def find_bracket_pairs(text):
+    '''
+    Get a dict mapping each opening bracket in `text` to its closing one.
+    
+    Brackets in strings and comments are ignored.
+    '''
+    bracket_pairs = {}
+    open_brackets = []
+    for match in _code_token_pattern.finditer(text):
+        if match.lastgroup != 'bracket':
+            continue
+        position = match.start()
+        bracket = text[position]
+        if bracket in _closing_brackets:
+            open_brackets.append((_closing_brackets[bracket], position))
+            continue
+        # A closing bracket. If it doesn't match the innermost open bracket,
+        # we assume the brackets in between were left unclosed, as long as
+        # there's a matching one further out.
+        for i in xrange(len(open_brackets) - 1, -1, -1):
+            if open_brackets[i][0] == bracket:
+                bracket_pairs[open_brackets[i][1]] = position
+                del open_brackets[i:]
+                break
+    return bracket_pairs
+
+
+def get_bracket_pairs(document):
+    '''
+    Get a dict mapping each opening bracket in `document` to its closing one.
+    
+    Brackets in strings and comments are ignored. The dict is built in one
+    pass over the document, once per revision.
+    '''
+    return get_document_state(document).get_cached(
+        'bracket_pairs', lambda: find_bracket_pairs(get_text(document))
+    )
+
+
+def get_patched_index(document, key, index_type):
+    '''
+    Get an index of `document` that's kept up to date by patching it.
+    
+    `index_type(text, revision)` builds the index, which should have a
+    `revision` attribute and a `patch(text, edits, revision)` method, where
+    `edits` are as returned by `DocumentState.get_edits_since`. The index is
+    kept in the document's `DocumentState.indexes` under `key`, and it's
+    patched when it's out of date, or rebuilt if we don't know what changed.
+    '''
+    document_state = get_document_state(document)
+    index = document_state.indexes.get(key)
+    if index is not None and index.revision != document_state.revision:
+        edits = document_state.get_edits_since(index.revision)
+        if edits is None:
+            index = None
+        else:
+            index.patch(get_text(document), edits, document_state.revision)
+    if index is None:
+        index = document_state.indexes[key] = \
+                        index_type(get_text(document), document_state.revision)
+    return index
+
+
+_statement_line_start_pattern = re.compile(
+    # Unindented lines that aren't comments, closing brackets or the `else`
+    # part of a compound statement.
+    r'''^(?=[^ \t\r\n#)\]}])(?!(?:else|elif|except|finally)\b)''',
+    flags=re.MULTILINE
+)
+_definition_line_pattern = re.compile(r'''(?:def|class)\b''')
+_line_continuation_pattern = re.compile(r'''\\\r?\n\Z''')
+
+
+def iterate_statement_starts(text, start=0):
+    '''
+    Iterate over the positions where top-level statements in `text` start.
+    
+    `start`, which must be the start of a top-level statement, comes first.
+    Lines in strings or in brackets don't count, except that a `def` or
+    `class` line always starts a new statement, so an unclosed bracket doesn't
+    swallow the rest of the text. Decorators go with what they decorate.
+    '''
+    yield start
+    code_tokens = _code_token_pattern.finditer(text, start)
+    code_token = next(code_tokens, None)
+    depth = 0
+    in_decorators = text.startswith('@', start)
+    for line_match in _statement_line_start_pattern.finditer(text, start + 1):
+        line_start = line_match.start()
+        while code_token is not None and code_token.end() <= line_start:
+            if code_token.lastgroup == 'bracket':
+                if text[code_token.start()] in _closing_brackets:
+                    depth += 1
+                elif depth:
+                    depth -= 1
+            code_token = next(code_tokens, None)
+        if code_token is not None and code_token.start() < line_start:
+            continue # We're in a multi-line string.
+        is_definition = bool(_definition_line_pattern.match(text, line_start))
+        if is_definition:
+            depth = 0
+        elif depth or _line_continuation_pattern.search(
+                                  text, max(line_start - 3, 0), line_start):
+            continue
+        if in_decorators:
+            if text.startswith('@', line_start):
+                continue
+            in_decorators = False
+            if is_definition:
+                continue
+        in_decorators = text.startswith('@', line_start)
+        yield line_start
+        
+        
+class StatementIndex(object):
+    '''
+    Analysis of each top-level statement of a text, patched after edits.
+    
+    Subclasses define `analyze_statement(statement_text)`, which is called on
+    the text of each top-level statement, and its result is kept in `results`,
+    next to the position where the statement starts in `statement_starts`.
+    After edits, only the statements they touched are split and analyzed
+    again. Use with `get_patched_index`.
+    '''
+    
+    def __init__(self, text, revision):
+        self.statement_starts = []
+        self.results = []
+        self.revision = revision
+        self._reanalyze(text, 0, 0, 0)
+        
+    def analyze_statement(self, statement_text):
+        raise NotImplementedError
+    
+    def get_statement_number(self, position):
+        '''Get the index of the statement that `position` is in.'''
+        return max(bisect.bisect_right(self.statement_starts, position) - 1, 0)
+    
+    def patch(self, text, edits, revision):
+        statement_starts = self.statement_starts
+        dirty_ranges = []
+        for i, (position, n_removed, n_inserted) in enumerate(edits):
+            # The statements an edit reaches are dirty, and so is the one
+            # before them if the edit is on the first line of a statement,
+            # because that may join the two. (We can only check that on the
+            # text after the last edit.)
+            first = self.get_statement_number(position)
+            if first and (i + 1 < len(edits) or
+                 text.find('\n', statement_starts[first], position) == -1):
+                first -= 1
+            last = max(bisect.bisect_right(statement_starts,
+                                           position + n_removed) - 1, 0)
+            dirty_ranges.append((first, last))
+            for j in xrange(first + 1, len(statement_starts)):
+                if statement_starts[j] >= position + n_removed:
+                    statement_starts[j] += n_inserted - n_removed
+                elif statement_starts[j] > position:
+                    statement_starts[j] = position
+        self.revision = revision
+        
+        # Analyzing each run of dirty statements separately, so two edits far
+        # apart don't make us analyze everything between them. Going from the
+        # end, so the statement numbers before each run stay valid.
+        dirty_ranges.sort()
+        merged_dirty_ranges = []
+        for first, last in dirty_ranges:
+            if merged_dirty_ranges and first <= merged_dirty_ranges[-1][1] + 1:
+                merged_dirty_ranges[-1][1] = max(merged_dirty_ranges[-1][1],
+                                                 last)
+            else:
+                merged_dirty_ranges.append([first, last])
+        for first, last in reversed(merged_dirty_ranges):
+            self._reanalyze(text, first, last + 1, statement_starts[first])
+        
+    def _reanalyze(self, text, first, stop, start):
+        # Splitting again from the start of the first dirty statement, until
+        # we get back in step with a statement start after the dirty ones.
+        statement_starts = self.statement_starts
+        dirty_end = statement_starts[stop] if stop < len(statement_starts) \
+                                                                else len(text)
+        new_statement_starts = []
+        for statement_start in iterate_statement_starts(text, start):
+            if statement_start >= dirty_end and statement_start != start:
+                stop = bisect.bisect_left(statement_starts, statement_start,
+                                          stop)
+                if stop < len(statement_starts) and \
+                               statement_starts[stop] == statement_start:
+                    break
+            new_statement_starts.append(statement_start)
+        else:
+            stop = len(statement_starts)
+        ends = new_statement_starts[1:] + \
+               [statement_starts[stop] if stop < len(statement_starts) else
+                                                                   len(text)]
+        self.statement_starts[first:stop] = new_statement_starts
+        self.results[first:stop] = [
+            self.analyze_statement(text[statement_start:statement_end])
+            for statement_start, statement_end in zip(new_statement_starts,
+                                                      ends)
+        ]
+
+
+_python_token_pattern = re.compile(
+    r'''(?P<continuation>\\(?:\r\n|\r|\n))|'''
+    r'''(?P<newline>\r\n|\r|\n)|'''
+    r'''(?P<comment>#[^\r\n]*)|'''
+    r'''(?P<string>%s)|'''
+    r'''(?P<number>(?:0[xXoObB][0-9a-fA-F]+|(?:[0-9]+\.?[0-9]*|\.[0-9]+)'''
+    r'''(?:[eE][-+]?[0-9]+)?)[jJlL]?)|'''
+    r'''(?P<name>[A-Za-z_][A-Za-z_0-9]*)|'''
+    r'''(?P<bracket>[()\[\]{}])|'''
+    r'''(?P<operator>\*\*=?|//=?|<<=?|>>=?|->|<>|[-+*/%%&|^=<>!]=|'''
+    r'''[-+*/%%&|^~<>=.,:;@`])|'''
+    r'''(?P<error>[^ \t\f])''' % _string_literal_pattern_text,
+    re.DOTALL
+)
+
+_statement_keywords = frozenset((
+    'as', 'assert', 'async', 'await', 'break', 'class', 'continue', 'def',
+    'del', 'elif', 'else', 'except', 'exec', 'finally', 'for', 'from',
+    'global', 'if', 'import', 'in', 'nonlocal', 'pass', 'print', 'raise',
+    'return', 'try', 'while', 'with', 'yield'
+))
+
+_binary_operator_precedences = {
+    'or': 1, 'and': 2,
+    'in': 4, 'is': 4, '<': 4, '>': 4, '==': 4, '>=': 4, '<=': 4, '!=': 4,
+    '<>': 4,
+    '|': 5, '^': 6, '&': 7, '<<': 8, '>>': 8, '+': 9, '-': 9,
+    '*': 10, '/': 10, '//': 10, '%': 10, '@': 10,
+}
+# (`not` comes in at 3, between `and` and the comparisons.)
+
+
+class RecoveringParse(object):
+    '''
+    Spans of the expressions and call arguments in Python code.
+    
+    Unlike `compile`, this works on code that doesn't parse, like the code we
+    have while typing: It goes over tokens, closes unclosed brackets at the
+    end of their line, and skips tokens that don't fit. 
+    
+    `expression_spans` is a list of `(start, end)` and `argument_spans` is a
+    list of `(start, end, is_keyword)`, including the parameters of `def` and
+    `class` statements.
+    '''
+    
+    def __init__(self, text):
+        self.expression_spans = []
+        self.argument_spans = []
+        self._tokenize(text)
+        for line_start, line_end in zip(self._line_starts,
+                                        self._line_starts[1:]):
+            self._stop = line_end
+            try:
+                self._parse_statement(line_start)
+            except RuntimeError:
+                # Brackets nested too deeply for the recursion limit; we'll
+                # make do with what we've got.
+                pass
+        del self._kinds, self._values, self._starts, self._ends, \
+                                                                self._closings
+        
+    def _tokenize(self, text):
+        tokens = [
+            (match.lastgroup, match.group(), match.start(), match.end())
+            for match in _python_token_pattern.finditer(text)
+            if match.lastgroup not in ('comment', 'continuation')
+        ]
+        
+        # Finding which brackets get closed, like `find_bracket_pairs` does:
+        closed_brackets = set()
+        open_brackets = []
+        for i, (kind, value, start, end) in enumerate(tokens):
+            if kind != 'bracket':
+                continue
+            if value in _closing_brackets:
+                open_brackets.append((_closing_brackets[value], i))
+                continue
+            for j in xrange(len(open_brackets) - 1, -1, -1):
+                if open_brackets[j][0] == value:
+                    closed_brackets.add(open_brackets[j][1])
+                    closed_brackets.add(i)
+                    del open_brackets[j:]
+                    break
+                
+        # Now splitting to logical lines, where only newlines outside of
+        # closed brackets count. For each opening bracket we keep where its
+        # contents stop and whether there's a closing bracket there; an
+        # unclosed bracket stops at the end of its line, or where the bracket
+        # around it closes.
+        self._kinds = kinds = []
+        self._values = values = []
+        self._starts = starts = []
+        self._ends = ends = []
+        self._closings = closings = {}
+        self._line_starts = line_starts = [0]
+        open_brackets = []
+        depth = 0
+        for i, (kind, value, start, end) in enumerate(tokens):
+            if kind == 'newline':
+                if not depth and line_starts[-1] != len(kinds):
+                    for closing, j in open_brackets:
+                        closings[j] = (len(kinds), False)
+                    del open_brackets[:]
+                    line_starts.append(len(kinds))
+                continue
+            if kind == 'bracket':
+                if value in _closing_brackets:
+                    open_brackets.append((_closing_brackets[value],
+                                          len(kinds)))
+                    depth += i in closed_brackets
+                elif i in closed_brackets:
+                    depth -= 1
+                    while True:
+                        closing, j = open_brackets.pop()
+                        if closing == value:
+                            closings[j] = (len(kinds), True)
+                            break
+                        closings[j] = (len(kinds), False)
+            kinds.append(kind)
+            values.append(value)
+            starts.append(start)
+            ends.append(end)
+        for closing, j in open_brackets:
+            closings[j] = (len(kinds), False)
+        if line_starts[-1] != len(kinds):
+            line_starts.append(len(kinds))
+            
+    def _peek(self, i):
+        '''Get token `i`, or `None` if it's past what we're parsing.'''
+        if i < self._stop and self._kinds[i] in ('name', 'operator',
+                                                  'bracket'):
+            return self._values[i]
+        return None
+    
+    def _add_expression(self, i, end):
+        self.expression_spans.append((self._starts[i], self._ends[end - 1]))
+        
+    # Each of the `_parse_*` methods below gets the index of a token to start
+    # from, and returns the index of the token after what it parsed, or `None`
+    # if it couldn't parse anything.
+        
+    def _parse_statement(self, i):
+        while i < self._stop:
+            value = self._peek(i)
+            if value in _statement_keywords:
+                if value in ('import', 'from', 'global', 'nonlocal'):
+                    break
+                i += 1
+                if value in ('def', 'class'):
+                    if i < self._stop and self._kinds[i] == 'name':
+                        i += 1
+                    if self._peek(i) == '(':
+                        i = self._parse_brackets(i, is_call=True)
+                elif value == 'for':
+                    i = self._parse_expression_list(i, no_in=True) or i
+                continue
+            i = self._parse_expression_list(i) or i + 1
+        
+    def _parse_expression_list(self, i, no_in=False):
+        end = self._parse_expression(i, no_in=no_in)
+        if end is None:
+            return None
+        list_end = end
+        while self._peek(list_end) == ',':
+            list_end += 1
+            list_end = self._parse_expression(list_end,
+                                              no_in=no_in) or list_end
+        if list_end != end:
+            self._add_expression(i, list_end)
+        return list_end
+    
+    def _parse_expression(self, i, no_in=False, no_condition=False):
+        if self._peek(i) == 'lambda':
+            return self._parse_lambda(i, no_in=no_in)
+        end = self._parse_binary_operation(i, 1, no_in=no_in)
+        if end is None or no_condition or self._peek(end) != 'if':
+            return end
+        condition_end = self._parse_binary_operation(end + 1, 1, no_in=no_in)
+        if condition_end is None or self._peek(condition_end) != 'else':
+            return end
+        else_end = self._parse_expression(condition_end + 1, no_in=no_in)
+        if else_end is None:
+            return end
+        self._add_expression(i, else_end)
+        return else_end
+    
+    def _parse_lambda(self, i, no_in=False):
+        colon = i + 1
+        while colon < self._stop and self._peek(colon) != ':':
+            if colon in self._closings:
+                colon = self._get_brackets_end(colon)
+            else:
+                colon += 1
+        end = self._parse_expression(colon + 1, no_in=no_in)
+        if end is not None:
+            self._add_expression(i, end)
+        return end
+    
+    def _get_binary_operator(self, i, no_in=False):
+        '''Get the precedence and length of the binary operator at `i`.'''
+        value = self._peek(i)
+        if value == 'not':
+            if self._peek(i + 1) == 'in' and not no_in:
+                return (4, 2)
+        elif value == 'is':
+            return (4, 1 + (self._peek(i + 1) == 'not'))
+        elif value in _binary_operator_precedences and not \
+                                                   (value == 'in' and no_in):
+            return (_binary_operator_precedences[value], 1)
+        return None
+        
+    def _parse_binary_operation(self, i, min_precedence, no_in=False):
+        if self._peek(i) == 'not':
+            if min_precedence > 3:
+                return None
+            end = self._parse_binary_operation(i + 1, 3, no_in=no_in)
+            if end is None:
+                return None
+            self._add_expression(i, end)
+        else:
+            end = self._parse_unary_operation(i)
+            if end is None:
+                return None
+        while True:
+            operator = self._get_binary_operator(end, no_in=no_in)
+            if operator is None or operator[0] < min_precedence:
+                return end
+            precedence, length = operator
+            right_end = self._parse_binary_operation(end + length,
+                                                     precedence + 1,
+                                                     no_in=no_in)
+            if right_end is None:
+                return end
+            self._add_expression(i, right_end)
+            end = right_end
+            
+    def _parse_unary_operation(self, i):
+        if self._peek(i) in ('-', '+', '~'):
+            end = self._parse_unary_operation(i + 1)
+            if end is not None:
+                self._add_expression(i, end)
+            return end
+        end = self._parse_primary(i)
+        if end is not None and self._peek(end) == '**':
+            power_end = self._parse_unary_operation(end + 1)
+            if power_end is not None:
+                self._add_expression(i, power_end)
+                end = power_end
+        return end
+    
+    def _parse_primary(self, i):
+        end = self._parse_atom(i)
+        if end is None:
+            return None
+        while True:
+            value = self._peek(end)
+            if value == '.' and self._peek(end + 1) is not None and \
+                                             self._kinds[end + 1] == 'name':
+                # (A name is an expression on its own too.)
+                self._add_expression(end + 1, end + 2)
+                end += 2
+            elif value == '(':
+                end = self._parse_brackets(end, is_call=True)
+            elif value == '[':
+                end = self._parse_brackets(end)
+            else:
+                return end
+            self._add_expression(i, end)
+    
+    def _parse_atom(self, i):
+        if i >= self._stop:
+            return None
+        kind, value = self._kinds[i], self._values[i]
+        if kind == 'name':
+            if value == 'yield':
+                end = self._parse_expression_list(i + 1) or i + 1
+            elif keyword.iskeyword(value) and value not in ('print', 'exec'):
+                return None
+            else:
+                end = i + 1
+        elif kind == 'number':
+            end = i + 1
+        elif kind == 'string':
+            end = i + 1
+            while end < self._stop and self._kinds[end] == 'string':
+                end += 1
+        elif i in self._closings:
+            end = self._parse_brackets(i)
+        else:
+            return None
+        self._add_expression(i, end)
+        return end
+    
+    def _get_brackets_end(self, i):
+        closing, is_closed = self._closings[i]
+        return closing + 1 if is_closed else closing
+    
+    def _parse_brackets(self, opening, is_call=False):
+        outer_stop = self._stop
+        self._stop = self._closings[opening][0]
+        i = opening + 1
+        while i < self._stop:
+            if self._peek(i) == ',':
+                i += 1
+            elif is_call:
+                i = self._parse_argument(i) or i + 1
+            else:
+                i = self._parse_item(i) or i + 1
+        self._stop = outer_stop
+        return self._get_brackets_end(opening)
+    
+    def _parse_argument(self, i):
+        is_keyword = False
+        if self._peek(i) in ('*', '**'):
+            end = self._parse_expression(i + 1)
+        elif self._peek(i + 1) == '=' and self._kinds[i] == 'name':
+            is_keyword = True
+            self._add_expression(i, i + 1)
+            end = self._parse_expression(i + 2)
+        else:
+            end = self._parse_comprehension(self._parse_expression(i))
+        if end is not None:
+            self.argument_spans.append(
+                (self._starts[i], self._ends[end - 1], is_keyword)
+            )
+        return end
+        
+    def _parse_item(self, i):
+        # An item in a tuple, list, dict, set or subscript, including slices
+        # and comprehensions.
+        if self._peek(i) in ('*', '**'):
+            return self._parse_expression(i + 1)
+        end = self._parse_expression(i) or i
+        while self._peek(end) == ':':
+            end = self._parse_expression(end + 1) or end + 1
+        if end == i:
+            return None
+        return self._parse_comprehension(end)
+    
+    def _parse_comprehension(self, end):
+        while end is not None and self._peek(end) == 'for':
+            targets_end = self._parse_expression_list(end + 1, no_in=True)
+            if targets_end is None or self._peek(targets_end) != 'in':
+                break
+            iterable_end = self._parse_expression(targets_end + 1,
+                                                  no_condition=True)
+            if iterable_end is None:
+                break
+            end = iterable_end
+            while self._peek(end) == 'if':
+                condition_end = self._parse_expression(end + 1,
+                                                       no_condition=True)
+                if condition_end is None:
+                    break
+                end = condition_end
+        return end
+
+
+_compound_statement_keywords = frozenset((
+    'async', 'class', 'def', 'elif', 'else', 'except', 'finally', 'for',
+    'if', 'try', 'while', 'with'
+))
+
+_assignment_operators = frozenset((
+    '=', '+=', '-=', '*=', '/=', '//=', '%=', '**=', '>>=', '<<=', '&=',
+    '^=', '|='
+))
+
+
+def find_assignments(text):
+    '''
+    Find the assignments in the Python code `text`.
+
+    Returns a list of `(lhs_start, lhs_end, rhs_start, rhs_end)`. Augmented
+    assignments like `x += 1` count, and so do annotated ones like
+    `x: int = 1`, whose left-hand side is just `x`. In `x = y = 1` the
+    right-hand side is `y = 1`. Comments aren't part of either side.
+
+    This is one pass over the tokens of `text`. Like in `RecoveringParse`,
+    only newlines outside of closed brackets end a statement, so a bracket
+    that's still being typed doesn't swallow the code after it.
+    '''
+    bracket_pairs = find_bracket_pairs(text)
+    closing_bracket_positions = set(bracket_pairs.itervalues())
+    assignments = []
+    depth = 0
+
+    # The state of the simple statement we're in:
+    lhs_start = lhs_end = rhs_start = last_end = None
+    in_header = is_skipped = has_operator = False
+
+    for match in _python_token_pattern.finditer(text):
+        kind = match.lastgroup
+        if kind == 'comment' or kind == 'continuation':
+            continue
+        value = match.group()
+        if not depth and (kind == 'newline' or value == ';' or
+                          (in_header and value == ':')):
+            if rhs_start is not None:
+                assignments.append((lhs_start, lhs_end, rhs_start, last_end))
+            lhs_start = lhs_end = rhs_start = None
+            in_header = is_skipped = has_operator = False
+            continue
+        if kind == 'newline':
+            continue
+        start, end = match.span()
+        if kind == 'bracket':
+            if start in bracket_pairs:
+                depth += 1
+            elif start in closing_bracket_positions:
+                depth -= 1
+
+        if in_header or is_skipped:
+            pass
+        elif lhs_start is None:
+            if kind == 'name' and value in _statement_keywords:
+                # A compound statement may have an assignment after its
+                # header, like `else: x = 1`. Other statements, like
+                # `return`, can't have one at all.
+                if value in _compound_statement_keywords:
+                    in_header = True
+                else:
+                    is_skipped = True
+            else:
+                lhs_start = start
+        elif has_operator:
+            if rhs_start is None:
+                rhs_start = start
+        elif not depth and value in _assignment_operators:
+            if lhs_end is None:
+                lhs_end = last_end
+            has_operator = True
+        elif not depth and value == ':' and lhs_end is None:
+            lhs_end = last_end # An annotation follows.
+        last_end = end
+
+    if rhs_start is not None:
+        assignments.append((lhs_start, lhs_end, rhs_start, last_end))
+    return assignments
+
+
+class StringIndex(object):
+    '''
+    Index of the string literals in Python code.
+
+    For each string, in order, we keep where it starts and ends, the length of
+    its prefix (like `ur`) and its quote, one of `'`, `"`, `\'\'\'` and
+    `"""`. Strings that are implicitly concatenated, like `'foo' 'bar'`, have
+    the same number in `groups`. They may be on different lines if they're in
+    brackets, and there may be comments between them.
+    '''
+
+    def __init__(self, text):
+        self.starts = array.array('l')
+        self.ends = array.array('l')
+        self.prefix_lengths = array.array('l')
+        self.quotes = []
+        self.groups = array.array('l')
+
+        bracket_pairs = find_bracket_pairs(text)
+        closing_bracket_positions = set(bracket_pairs.itervalues())
+        depth = 0
+        group = -1
+        after_string = False
+        for match in _python_token_pattern.finditer(text):
+            kind = match.lastgroup
+            if kind == 'string':
+                if not after_string:
+                    group += 1
+                string = match.group()
+                prefix_length = len(string) - len(string.lstrip('uUbBrRfF'))
+                quote = string[prefix_length:prefix_length + 3]
+                if quote not in ('"""', "'''"):
+                    quote = quote[0]
+                self.starts.append(match.start())
+                self.ends.append(match.end())
+                self.prefix_lengths.append(prefix_length)
+                self.quotes.append(quote)
+                self.groups.append(group)
+                after_string = True
+            elif kind == 'comment' or kind == 'continuation':
+                pass
+            elif kind == 'newline':
+                if not depth:
+                    after_string = False
+            else:
+                if kind == 'bracket':
+                    if match.start() in bracket_pairs:
+                        depth += 1
+                    elif match.start() in closing_bracket_positions:
+                        depth -= 1
+                after_string = False
+
+    def __len__(self):
+        return len(self.starts)
+
+    def get_span(self, i):
+        return (self.starts[i], self.ends[i])
+
+    def get_string_at(self, position, include_end=True):
+        '''
+        Find the string that `position` is in, or `None`.
+
+        The position right after a string counts as in it, unless
+        `include_end` is false.
+        '''
+        i = bisect.bisect_right(self.starts, position) - 1
+        if i >= 0 and position < self.ends[i] + include_end:
+            return i
+        return None
+
+    def find_next(self, position):
+        '''Find the first string that ends at or after `position`.'''
+        i = bisect.bisect_left(self.ends, position)
+        return i if i < len(self.starts) else None
+
+    def find_previous(self, position):
+        '''Find the last string that starts at or before `position`.'''
+        i = bisect.bisect_right(self.starts, position) - 1
+        return i if i >= 0 else None
+
+    def get_group_spans(self, i):
+        '''Get the spans of string `i` and the strings concatenated to it.'''
+        group = self.groups[i]
+        return tuple(
+            self.get_span(j) for j in
+            xrange(bisect.bisect_left(self.groups, group, 0, i),
+                   bisect.bisect_right(self.groups, group, i))
+        )
+
+
+def get_string_index(document):
+    '''Get the `StringIndex` of `document`, made once per revision.'''
+    return get_document_state(document).get_cached(
+        'string_index', lambda: StringIndex(get_text(document))
+    )
+
+
+_code_line_pattern = re.compile(
+    # The indentation of lines that have code, not just whitespace or a comment
+    r'''^[ \t]*(?=[^ \t\r\n#])''',
+    flags=re.MULTILINE
+)
+_scope_definition_pattern = re.compile(
+    r'''(?:async[ \t]+)?(def|class)[ \t]+([a-zA-Z_][0-9a-zA-Z_]*)'''
+)
+
+
+class ScopeOutline(object):
+    '''
+    Outline of the classes and functions in Python code, nested.
+    
+    Scopes are numbered in the order they appear in the text, and for scope
+    number `i`, `kinds[i]` is `'def'` or `'class'`, `names[i]` is its name
+    and `name_starts[i]` and `name_ends[i]` are where the name is. The scope
+    spans from `starts[i]`, including its decorators, to `ends[i]`, the end of
+    the last line of its body. `depths[i]` is how many scopes it's nested in,
+    and `parents[i]`, `next_siblings[i]` and `previous_siblings[i]` are the
+    numbers of the scope it's in and of its neighbors in there, or `None`.
+    `decorators[i]` is a list of the spans of its decorators.
+    
+    Scopes in strings and comments are ignored.
+    '''
+    
+    def __init__(self, text):
+        self.kinds = []
+        self.names = []
+        self.name_starts = []
+        self.name_ends = []
+        self.starts = []
+        self.ends = []
+        self.depths = []
+        self.parents = []
+        self.next_siblings = []
+        self.previous_siblings = []
+        self.decorators = []
+        
+        indentations = []
+        open_scopes = []
+        last_children = {}
+        decorators = []
+        def get_line_end(line_start):
+            # Where the line's content ends, without a line break or trailing
+            # whitespace.
+            line_end = text.find('\n', line_start)
+            if line_end == -1:
+                line_end = len(text)
+            while text[line_end - 1] in ' \t\r\n':
+                line_end -= 1
+            return line_end
+        code_tokens = _code_token_pattern.finditer(text)
+        code_token = next(code_tokens, None)
+        depth = 0
+        # The last line that has code, including lines inside a statement:
+        last_line_start = None
+        for line_match in _code_line_pattern.finditer(text):
+            line_start, code_start = line_match.span()
+            previous_line_start, last_line_start = last_line_start, line_start
+            while code_token is not None and code_token.end() <= code_start:
+                if code_token.lastgroup == 'bracket':
+                    if text[code_token.start()] in _closing_brackets:
+                        depth += 1
+                    elif depth:
+                        depth -= 1
+                code_token = next(code_tokens, None)
+            if code_token is not None and code_token.start() < code_start:
+                continue # We're in a multi-line string.
+            definition_match = _scope_definition_pattern.match(text,
+                                                                code_start)
+            if definition_match:
+                # Even in brackets, so an unclosed one won't swallow the rest
+                # of the outline.
+                depth = 0
+            elif depth or _line_continuation_pattern.search(
+                                  text, max(line_start - 3, 0), line_start):
+                continue
+            
+            indentation = code_start - line_start
+            while open_scopes and indentations[open_scopes[-1]] >= indentation:
+                self.ends[open_scopes.pop()] = \
+                                              get_line_end(previous_line_start)
+                
+            if text.startswith('@', code_start):
+                decorator_end = text.find('\n', code_start)
+                if decorator_end == -1:
+                    decorator_end = len(text)
+                decorators.append(
+                    (code_start, len(text[code_start:decorator_end].rstrip()) +
+                                                                    code_start)
+                )
+                continue
+            if definition_match:
+                i = len(self.kinds)
+                parent = open_scopes[-1] if open_scopes else None
+                self.kinds.append(definition_match.group(1))
+                self.names.append(definition_match.group(2))
+                self.name_starts.append(definition_match.start(2))
+                self.name_ends.append(definition_match.end(2))
+                self.starts.append(decorators[0][0] if decorators else
+                                                                   code_start)
+                self.ends.append(None)
+                self.depths.append(len(open_scopes))
+                self.parents.append(parent)
+                self.next_siblings.append(None)
+                self.previous_siblings.append(last_children.get(parent))
+                if last_children.get(parent) is not None:
+                    self.next_siblings[last_children[parent]] = i
+                last_children[parent] = i
+                self.decorators.append(decorators)
+                indentations.append(indentation)
+                open_scopes.append(i)
+            decorators = []
+            
+        for i in open_scopes:
+            self.ends[i] = get_line_end(last_line_start)
+        
+    def __len__(self):
+        return len(self.kinds)
+            
+    def get_name_span(self, i):
+        return (self.name_starts[i], self.name_ends[i])
+        
+    def find_next(self, position):
+        '''Find the first scope whose name ends at or after `position`.'''
+        i = bisect.bisect_left(self.name_ends, position)
+        return i if i < len(self.kinds) else None
+    
+    def find_previous(self, position):
+        '''Find the last scope whose name starts before `position`.'''
+        i = bisect.bisect_left(self.name_starts, position) - 1
+        return i if i >= 0 else None
+    
+    def get_enclosing_scope(self, position):
+        '''Find the innermost scope that `position` is in.'''
+        i = bisect.bisect_right(self.starts, position) - 1
+        if i == -1:
+            return None
+        while i is not None and self.ends[i] < position:
+            i = self.parents[i]
+        return i
+        
+
+def get_scope_outline(document):
+    '''Get the `ScopeOutline` of `document`, made once per revision.'''
+    return get_document_state(document).get_cached(
+        'scope_outline', lambda: ScopeOutline(get_text(document))
+    )
+
+
+class CharacterClassMap(object):
+    '''
+    Run-length map of which parts of a text are code, strings and comments.
+
+    `run_starts` has the position where each run starts, and `run_classes`
+    has its class, one of `CODE`, `STRING` and `COMMENT`. Each run lasts
+    until the next one starts.
+    '''
+
+    CODE = 0
+    STRING = 1
+    COMMENT = 2
+
+    def __init__(self, text):
+        self.run_starts = array.array('l')
+        self.run_classes = array.array('b')
+
+        def add_run(start, character_class):
+            if not self.run_classes or \
+                                  self.run_classes[-1] != character_class:
+                self.run_starts.append(start)
+                self.run_classes.append(character_class)
+
+        position = 0
+        for match in _code_token_pattern.finditer(text):
+            if match.lastgroup == 'bracket':
+                continue
+            start, end = match.span()
+            if start > position:
+                add_run(position, self.CODE)
+            add_run(start, self.STRING if match.lastgroup == 'string'
+                           else self.COMMENT)
+            position = end
+        if position < len(text):
+            add_run(position, self.CODE)
+
+    def get_class(self, position):
+        '''Get the class of the character at `position`.'''
+        i = bisect.bisect_right(self.run_starts, position) - 1
+        return self.run_classes[i] if i >= 0 else self.CODE
+
+    def filter_spans(self, starts, ends, character_class):
+        '''
+        Keep only the spans that are wholly inside runs of `character_class`.
+
+        `starts` and `ends` are the sorted starts and ends of the spans. This
+        walks the spans and the runs together, so it's linear. Returns new
+        `(starts, ends)` arrays.
+        '''
+        filtered_starts = array.array('l')
+        filtered_ends = array.array('l')
+        run_starts = self.run_starts
+        run_classes = self.run_classes
+        n_runs = len(run_starts)
+        i = 0
+        for start, end in itertools.izip(starts, ends):
+            while i + 1 < n_runs and run_starts[i + 1] <= start:
+                i += 1
+            if i < n_runs and run_classes[i] == character_class and \
+                           (i + 1 == n_runs or end <= run_starts[i + 1]):
+                filtered_starts.append(start)
+                filtered_ends.append(end)
+        return (filtered_starts, filtered_ends)
+
+
+def get_character_class_map(document):
+    '''Get the `CharacterClassMap` of `document`, made once per revision.'''
+    return get_document_state(document).get_cached(
+        'character_class_map',
+        lambda: CharacterClassMap(get_text(document))
+    )
+
+
+_token_chunk_pattern = re.compile(
+    r'''[a-zA-Z0-9_.]+|[-+*/%|^&<>=!~]+'''
+)
+_number_pattern = re.compile(r'''-?(([0-9]+(\.[0-9]+)?)|(\.[0-9]+))''')
+_operator_pattern = re.compile(
+    r'''(?<!<|>)'''
+    r'''(?:\+|-|\*\*?|//?|%|\||\^|&|>>|<<|~|==|!=|<|<=|>|>=)(?!=|\*|/|<|>)'''
+)
+_assignment_operator_pattern = re.compile(
+    r'''(?<!!|<|>|=)(?:\+|-|\*\*?|//?|%|\||\^|&|>>|<<)?=(?!=)'''
+)
+_constant_pattern = re.compile(r'''(?:_[0-9_]*)?(?:[A-Z][0-9_]*){2,}\Z''')
+_camelcase_pattern = re.compile(
+    r'''(?:[a-zA-Z_]*[a-z]+[a-zA-Z0-9_]*[A-Z]+[a-zA-Z0-9_]*)'''
+    r'''|'''
+    r'''(?:[a-zA-Z_]*[A-Z]+[a-zA-Z0-9_]*[a-z]+[a-zA-Z0-9_]*)'''
+)
+_dotted_pattern = re.compile(
+    r'''(?:[a-zA-Z_][a-zA-Z_0-9]*\.)+[a-zA-Z_][a-zA-Z_0-9]*'''
+)
+
+
+def _find_chunk_tokens(chunk):
+    '''
+    Find the tokens in a chunk of name characters or of operator characters.
+
+    Returns a tuple of `(category, start, end)`, with positions relative to
+    the chunk. See `TokenIndex` for the categories.
+    '''
+    tokens = []
+    if chunk[0] in '-+*/%|^&<>=!~':
+        for category, pattern in (('operator', _operator_pattern),
+                                  ('assignment',
+                                   _assignment_operator_pattern)):
+            tokens.extend((category, match.start(), match.end())
+                          for match in pattern.finditer(chunk))
+        return tuple(tokens)
+
+    if '.' in chunk:
+        tokens.extend(('dotted', match.start(), match.end())
+                      for match in _dotted_pattern.finditer(chunk))
+    tokens.extend(('number', match.start(), match.end())
+                  for match in _number_pattern.finditer(chunk))
+    piece_start = 0
+    for piece in chunk.split('.'):
+        if piece:
+            if _constant_pattern.match(piece):
+                tokens.append(('constant', piece_start,
+                               piece_start + len(piece)))
+            elif piece.lower() != piece and piece.upper() != piece:
+                tokens.extend(
+                    ('camelcase', piece_start + match.start(),
+                     piece_start + match.end())
+                    for match in _camelcase_pattern.finditer(piece)
+                )
+        piece_start += len(piece) + 1
+    return tuple(tokens)
+
+
+class TokenIndex(object):
+    '''
+    Index of the numbers, operators, constants etc. in a text, by category.
+
+    The categories are:
+
+     - `number`, like `7` or `-1.5`.
+     - `operator`, like `+` or `<=`.
+     - `assignment`, like `=` or `+=`.
+     - `constant`, a name in all caps, like `DEBUG`.
+     - `camelcase`, a name mixing lowercase and uppercase letters.
+     - `dotted`, a dotted name like `foo.bar`.
+
+    The text is scanned once, in chunks of name characters and of operator
+    characters, and every span found in a chunk is tagged with its category.
+    The starts and ends of each category's spans are kept in sorted arrays,
+    so finding the next or previous span is a bisect.
+
+    The categories in `code_categories` only count in code: their spans are
+    intersected with the code runs of `character_class_map`, so numbers in
+    docstrings and operators in comments are left out.
+    '''
+
+    categories = ('number', 'operator', 'assignment', 'constant',
+                  'camelcase', 'dotted')
+
+    code_categories = ('number', 'operator', 'assignment', 'constant')
+
+    def __init__(self, text, character_class_map):
+        assert isinstance(character_class_map, CharacterClassMap)
+        self.starts = dict(
+            (category, array.array('l')) for category in self.categories
+        )
+        self.ends = dict(
+            (category, array.array('l')) for category in self.categories
+        )
+
+        # Most chunks, like `self` or `=`, come up again and again, so we find
+        # the tokens of each distinct chunk only once:
+        chunk_tokens = {}
+        for chunk_match in _token_chunk_pattern.finditer(text):
+            chunk = chunk_match.group()
+            try:
+                tokens = chunk_tokens[chunk]
+            except KeyError:
+                tokens = chunk_tokens[chunk] = _find_chunk_tokens(chunk)
+            if not tokens:
+                continue
+            chunk_start = chunk_match.start()
+            for category, start, end in tokens:
+                start += chunk_start
+                # The minus sign of a negative number is in the operator
+                # chunk right before this one:
+                if category == 'number' and start == chunk_start and \
+                                         start and text[start - 1] == '-':
+                    start -= 1
+                self.starts[category].append(start)
+                self.ends[category].append(chunk_start + end)
+
+        for category in self.code_categories:
+            self.starts[category], self.ends[category] = \
+                character_class_map.filter_spans(self.starts[category],
+                                                 self.ends[category],
+                                                 CharacterClassMap.CODE)
+
+    def find_next(self, category, position):
+        '''
+        Find the first span of `category` that ends at or after `position`.
+
+        Returns `(start, end)`, or `None` if there's no such span.
+        '''
+        i = bisect.bisect_left(self.ends[category], position)
+        if i == len(self.ends[category]):
+            return None
+        return (self.starts[category][i], self.ends[category][i])
+
+    def find_previous(self, category, position):
+        '''
+        Find the last span of `category` that ends before `position`.
+
+        Returns `(start, end)`, or `None` if there's no such span.
+        '''
+        i = bisect.bisect_left(self.ends[category], position) - 1
+        if i == -1:
+            return None
+        return (self.starts[category][i], self.ends[category][i])
+
+
+def get_token_index(document):
+    '''Get the `TokenIndex` of `document`, made once per revision.'''
+    return get_document_state(document).get_cached(
+        'token_index',
+        lambda: TokenIndex(get_text(document),
+                           get_character_class_map(document))
+    )
+
+
+_word_pattern = re.compile(r'''[0-9a-zA-Z_]+''')
+
+_word_boundary_positions = frozenset((
+    sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_STRING,
+    sre_constants.AT_BOUNDARY, sre_constants.AT_END,
+    sre_constants.AT_END_STRING,
+))
+
+
+def _flatten_required_literals(items, flattened):
+    '''
+    Flatten parsed regex `items` to the characters that every match has.
+
+    Literal characters are added as they are, anchors at a word boundary as
+    `' '`, and anything else as `None`, which stands for characters that we
+    don't know.
+    '''
+    for op, argument in items:
+        if op == sre_constants.LITERAL:
+            flattened.append(unichr(argument) if argument > 0x7f else
+                             chr(argument))
+        elif op == sre_constants.SUBPATTERN:
+            _flatten_required_literals(argument[-1], flattened)
+        elif op == sre_constants.AT and argument in _word_boundary_positions:
+            flattened.append(' ')
+        else:
+            flattened.append(None)
+
+
+def _get_required_word(pattern):
+    '''
+    Get the longest whole word that every match of `pattern` has, if any.
+
+    A whole word is one that's between characters that aren't word characters,
+    like `objects` in `\\.objects\\.get`, so we know it'll be a word of its
+    own in any text that `pattern` matches. Returns `None` for a pattern with
+    no such word, or with flags that we can't account for.
+    '''
+    if pattern.flags & (re.IGNORECASE | re.VERBOSE):
+        return None
+    flattened = [None]
+    _flatten_required_literals(sre_parse.parse(pattern.pattern,
+                                               pattern.flags), flattened)
+    flattened.append(None)
+    words = []
+    word_start = None
+    for i, character in enumerate(flattened):
+        is_word_character = character is not None and \
+                                           _word_pattern.match(character)
+        if is_word_character:
+            if word_start is None:
+                word_start = i
+        else:
+            if word_start is not None and flattened[word_start - 1] \
+                                     is not None and character is not None:
+                words.append(''.join(flattened[word_start:i]))
+            word_start = None
+    return max(words, key=len) if words else None
+
+
+class RuleSet(object):
+    '''
+    Ordered regex rules, for finding the first one that matches a text.
+
+    Each rule is a `(name, pattern)` pair. `search` finds the first rule, in
+    order, whose pattern `re.search`es the text, just like trying the patterns
+    one by one would, but without trying all of them: Each rule is indexed by
+    the longest whole word that its pattern requires, like `objects` for
+    `\\.objects\\.get\\(`, and only the rules whose word is in the text
+    are tried, together with the rules that don't require any word. So adding
+    rules that require words, like the rules of a plugin, doesn't make
+    `search` slower on texts that don't have their words.
+    '''
+
+    def __init__(self, rules=()):
+        self.rules = []
+        self._rule_numbers_by_word = None
+        self._wordless_rule_numbers = None
+        self.add_rules(rules)
+
+    def add_rules(self, rules, first=False):
+        '''
+        Add `(name, pattern)` rules after the existing ones.
+
+        Patterns may be strings or compiled regexes. Provide `first=True` to
+        add the rules before the existing ones instead, so they take
+        precedence.
+        '''
+        new_rules = [(name, re.compile(pattern)) for name, pattern in rules]
+        if first:
+            self.rules[:0] = new_rules
+        else:
+            self.rules.extend(new_rules)
+        self._rule_numbers_by_word = None
+
+    def _index(self):
+        self._rule_numbers_by_word = collections.defaultdict(list)
+        self._wordless_rule_numbers = []
+        for i, (_, pattern) in enumerate(self.rules):
+            word = _get_required_word(pattern)
+            if word is None:
+                self._wordless_rule_numbers.append(i)
+            else:
+                self._rule_numbers_by_word[word].append(i)
+        self._rule_numbers_by_word = dict(self._rule_numbers_by_word)
+
+    def search(self, text):
+        '''
+        Find the first rule whose pattern matches somewhere in `text`.
+
+        Returns `(name, groups)`, where `groups` is a tuple of the groups of
+        the rule's pattern, or `(None, None)` if no rule matches.
+        '''
+        if self._rule_numbers_by_word is None:
+            self._index()
+        rule_numbers = self._wordless_rule_numbers
+        rule_numbers_by_word = self._rule_numbers_by_word
+        for word in set(_word_pattern.findall(text)):
+            if word in rule_numbers_by_word:
+                if rule_numbers is self._wordless_rule_numbers:
+                    rule_numbers = list(rule_numbers)
+                rule_numbers.extend(rule_numbers_by_word[word])
+        if rule_numbers is not self._wordless_rule_numbers:
+            rule_numbers.sort()
+        for i in rule_numbers:
+            name, pattern = self.rules[i]
+            match = pattern.search(text)
+            if match is not None:
+                return (name, match.groups())
+        return (None, None)
+
+
+def get_local_setting(name, default=None):
+    '''
+    Get a setting from `cute_wing_stuff_local_settings.py`, if it's there.
+
+    Returns `default` if there's no such module or it doesn't set `name`.
+    '''
+    try:
+        import cute_wing_stuff_local_settings
+    except ImportError:
+        return default
+    return getattr(cute_wing_stuff_local_settings, name, default)
+
+
+def get_cache_file_path(file_name):
+    '''
+    Get the path of a cache file that's kept between Wing sessions.
+
+    The cache files are in `~/.cute_wing_stuff`, or in `cache_folder` from
+    `cute_wing_stuff_local_settings.py` if it's set. The folder is created if
+    it doesn't exist.
+    '''
+    cache_folder = os.path.expanduser(
+        get_local_setting('cache_folder', '~/.cute_wing_stuff')
+    )
+    if not os.path.isdir(cache_folder):
+        os.makedirs(cache_folder)
+    return os.path.join(cache_folder, file_name)
+
+
+_normalized_path_memo = {}
+'''
+Results of `normalize_path`, by path.
+
+Resolving symlinks takes a syscall per component of the path, so we do it once
+per path. The memo is cleared when a project's path index is made, so a new
+project sees symlinks as they are now.
+'''
+
+_MAX_NORMALIZED_PATH_MEMO_SIZE = 200000
+
+
+def normalize_path(path):
+    '''
+    Normalize `path` for comparing, resolving symlinks.
+    
+    On Windows it's lowercased too, since paths there aren't case-sensitive.
+    Results are memoized in `_normalized_path_memo`.
+    '''
+    try:
+        return _normalized_path_memo[path]
+    except KeyError:
+        pass
+    if not sys.platform.startswith('win'):
+        normalized_path = os.path.realpath(path)
+    else:
+        normalized_path = os.path.realpath(path).lower()
+    if len(_normalized_path_memo) >= _MAX_NORMALIZED_PATH_MEMO_SIZE:
+        _normalized_path_memo.clear()
+    _normalized_path_memo[path] = normalized_path
+    return normalized_path
+    
+
+_path_separator_pattern = re.compile(r'''[/\\\\]+''')
+
+
+def _split_path_components(path):
+    '''Split `path` to components, lowercased on Windows to compare them.'''
+    if sys.platform.startswith('win'):
+        path = path.lower()
+    return [component for component in _path_separator_pattern.split(path)
+            if component]
+
+
+class ProjectPathIndex(object):
+    '''
+    Index of the paths of a project's files, for finding files by their end.
+    
+    Get one with `get_project_path_index`, which keeps it up to date with the
+    project's `files-added` and `files-removed` signals. `revision` goes up
+    whenever files are added or removed.
+    
+    The paths are kept in a trie of their components, last component first,
+    and every node has the paths under it, so `find_by_suffix` takes time
+    proportional to the length of the suffix and the number of results, not to
+    the size of the project. The trie is made on the first such query. Results
+    are in the order the files were added, which is the project's order.
+    '''
+    
+    def __init__(self, file_paths=()):
+        self._order = {}
+        self._n_added = 0
+        self._trie = None
+        self._normalized_paths = None
+        self.revision = 0
+        self.add(file_paths)
+        
+    def __len__(self):
+        return len(self._order)
+    
+    def __contains__(self, file_path):
+        return file_path in self._order
+        
+    def add(self, file_paths):
+        '''Add `file_paths` to the index. Paths already there are skipped.'''
+        self.revision += 1
+        for file_path in file_paths:
+            if file_path in self._order:
+                continue
+            self._order[file_path] = self._n_added
+            self._n_added += 1
+            if self._trie is not None:
+                self._add_to_trie(file_path)
+            if self._normalized_paths is not None:
+                self._normalized_paths.add(normalize_path(file_path))
+                
+    def remove(self, file_paths):
+        '''Remove `file_paths` from the index. Missing paths are skipped.'''
+        self.revision += 1
+        for file_path in file_paths:
+            if self._order.pop(file_path, None) is None:
+                continue
+            if self._trie is not None:
+                self._remove_from_trie(file_path)
+            self._normalized_paths = None
+            
+    def _add_to_trie(self, file_path):
+        node = self._trie
+        for component in reversed(_split_path_components(file_path)):
+            node = node[0].setdefault(component, ({}, set()))
+            node[1].add(file_path)
+            
+    def _remove_from_trie(self, file_path):
+        nodes = [self._trie]
+        components = list(reversed(_split_path_components(file_path)))
+        for component in components:
+            nodes.append(nodes[-1][0][component])
+            nodes[-1][1].discard(file_path)
+        for parent, component, node in reversed(zip(nodes, components,
+                                                    nodes[1:])):
+            if not node[1]:
+                del parent[0][component]
+            
+    def _sort(self, file_paths):
+        return sorted(file_paths, key=self._order.__getitem__)
+        
+    def find_by_suffix(self, suffix):
+        '''
+        Find the files whose path ends with `suffix`, in project order.
+        
+        `suffix` is matched by whole components, with either kind of slash, so
+        `app/page.html` matches `/project/templates/app/page.html` but not
+        `/project/templates/myapp/page.html`.
+        '''
+        if self._trie is None:
+            self._trie = ({}, set())
+            for file_path in self._order:
+                self._add_to_trie(file_path)
+        node = self._trie
+        for component in reversed(_split_path_components(suffix)):
+            node = node[0].get(component)
+            if node is None:
+                return []
+        return self._sort(node[1]) if node is not self._trie else \
+                                                       self._sort(self._order)
+    
+    def find_by_basename(self, basename):
+        '''Find the files whose name is `basename`, in project order.'''
+        if not basename or _path_separator_pattern.search(basename):
+            return []
+        return self.find_by_suffix(basename)
+    
+    def get_normalized_paths(self):
+        '''
+        Get the set of the paths, normalized with `normalize_path`.
+        
+        It's made on the first call, kept up to date when files are added, and
+        made again after files are removed, from `normalize_path`'s memo, so
+        without any syscalls. Don't change it.
+        '''
+        if self._normalized_paths is None:
+            self._normalized_paths = set(map(normalize_path, self._order))
+        return self._normalized_paths
+    
+    
+_project_path_indices = weakref.WeakKeyDictionary()
+
+
+def get_project_path_index(project):
+    '''
+    Get the `ProjectPathIndex` of `project`, made once per session.
+    
+    It's updated with the project's `files-added` and `files-removed` signals.
+    '''
+    try:
+        return _project_path_indices[project]
+    except KeyError:
+        _normalized_path_memo.clear()
+        project_path_index = _project_path_indices[project] = \
+                                    ProjectPathIndex(project.GetAllFiles())
+        project.connect('files-added', project_path_index.add)
+        project.connect('files-removed', project_path_index.remove)
+        return project_path_index
+
+
+class FolderListing(object):
+    '''
+    The names in a folder, sorted for prefix lookups.
+    
+    Get one with `get_folder_listing`, which makes it again only when the
+    folder changes. On Windows, prefixes are matched case-insensitively.
+    '''
+    def __init__(self, path, names):
+        self.path = path
+        case_insensitive = sys.platform.startswith('win')
+        keys_and_names = sorted(
+            ((name.lower() if case_insensitive else name), name)
+            for name in names
+        )
+        self._keys = [key for key, _ in keys_and_names]
+        self.names = [name for _, name in keys_and_names]
+        self._case_insensitive = case_insensitive
+        self._folder_names = {}
+        
+    def find_by_prefix(self, prefix):
+        '''Get the names that start with `prefix`, sorted.'''
+        if self._case_insensitive:
+            prefix = prefix.lower()
+        if not prefix:
+            return self.names[:]
+        start = bisect.bisect_left(self._keys, prefix)
+        # The keys that start with `prefix` are below `prefix` with its last
+        # character incremented:
+        character_function = unichr if isinstance(prefix, unicode) else chr
+        try:
+            end_key = prefix[:-1] + character_function(ord(prefix[-1]) + 1)
+        except ValueError: # The last character is already the highest one.
+            end = start
+            while end < len(self._keys) and \
+                                            self._keys[end].startswith(prefix):
+                end += 1
+        else:
+            end = bisect.bisect_left(self._keys, end_key, start)
+        return self.names[start:end]
+        
+    def is_folder(self, name):
+        '''
+        Is the entry `name` a folder?
+        
+        Checked on the first call for each name, since checking all the
+        entries of a big folder takes a while.
+        '''
+        try:
+            return self._folder_names[name]
+        except KeyError:
+            self._folder_names[name] = \
+                                   os.path.isdir(os.path.join(self.path, name))
+            return self._folder_names[name]
+        
+    def __len__(self):
+        return len(self.names)
+    
+    
+_folder_listings = {}
+'''
+Cached `FolderListing`s by `(path, ignored_extensions)`.
+
+Each one is kept with the folder's mtime and the time it was listed, and is
+used while the mtime stays the same. Adding, removing or renaming an entry
+changes its folder's mtime.
+'''
+
+_MAX_FOLDER_LISTINGS = 100
+
+_MTIME_RESOLUTION = 2
+'''
+Seconds within which changes to a folder might not change its mtime.
+
+A listing made this soon after the folder's mtime might miss a change made in
+the same tick, so it's made again next time. FAT has the coarsest mtimes, 2
+seconds.
+'''
+
+
+def get_folder_listing(path, ignored_extensions=(), list_folder=os.listdir):
+    '''
+    Get a `FolderListing` of the folder at `path`, cached until it changes.
+    
+    Names ending with any of `ignored_extensions` are left out. `list_folder`
+    is the function that lists the names in a folder. Raises `OSError` if the
+    folder can't be read.
+    '''
+    ignored_extensions = tuple(ignored_extensions)
+    mtime = os.stat(path).st_mtime
+    key = (path, ignored_extensions)
+    try:
+        cached_mtime, listing_time, folder_listing = _folder_listings[key]
+    except KeyError:
+        pass
+    else:
+        if cached_mtime == mtime and \
+                                 listing_time - mtime > _MTIME_RESOLUTION:
+            return folder_listing
+    listing_time = time.time()
+    folder_listing = FolderListing(
+        path, [name for name in list_folder(path) if
+               not name.endswith(ignored_extensions)]
+    )
+    if len(_folder_listings) >= _MAX_FOLDER_LISTINGS:
+        _folder_listings.clear()
+    _folder_listings[key] = (mtime, listing_time, folder_listing)
+    return folder_listing
+
 
 def argmin(sequence, key_function=None):
     if key_function is None:
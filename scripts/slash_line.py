@@ -48,10 +48,11 @@ def slash_line(editor=wingapi.kArgEditor, line_offset=0, at_caret=False):
     assert isinstance(editor, wingapi.CAPIEditor)
     document = editor.GetDocument()
     assert isinstance(document, wingapi.CAPIDocument)
+    line_index = shared.get_line_index(document)
     position, _ = editor.GetSelection()
-    line = document.GetLineNumberFromPosition(position) + line_offset
-    line_start = document.GetLineStart(line)
-    line_end = document.GetLineEnd(line)
+    line = line_index.get_line_number(position) + line_offset
+    line_start = line_index.get_line_start(line)
+    line_end = line_index.get_line_end(line)
     line_content = document.GetCharRange(line_start, line_end)
     current_line_length = line_end - line_start
     
@@ -11,7 +11,6 @@ from __future__ import with_statement
 
 import re
 import _ast
-import string
 
 import os.path, sys
 sys.path += [
@@ -25,99 +24,7 @@ import edit
 
 import shared
 
-def _is_position_on_string(editor, position, try_previous=True):
-    '''Is there a string in the specified position in the document?'''
-    return (
-        editor.fEditor.GetCharType(position) == edit.editor.kStringCharType or
-        (try_previous and position >= 1 and
-         (editor.fEditor.GetCharType(position - 1) ==
-                                                  edit.editor.kStringCharType))
-    )
 
-
-def _find_string_from_position(editor, position, multiline=False):
-    '''
-    Given a character in the document known to be in a string, find its string.
-    '''
-    assert isinstance(editor, wingapi.CAPIEditor)
-    assert _is_position_on_string(editor, position)
-    document_start = 0
-    document_end = editor.GetDocument().GetLength()
-    start_marker = end_marker = position
-    while end_marker < document_end and \
-                            _is_position_on_string(editor, end_marker+1):
-        end_marker += 1
-    while start_marker > document_start and \
-                          _is_position_on_string(editor, start_marker-1):
-        start_marker -= 1
-            
-    if start_marker > document_start:
-        assert not _is_position_on_string(editor, start_marker-1)
-    if end_marker < document_end:
-        assert not _is_position_on_string(editor, end_marker+1)
-    
-    if multiline:
-        string_ranges = [(start_marker, end_marker)]
-        document_text = shared.get_text(editor.GetDocument())
-        
-        ### Scanning backward: ################################################
-        #                                                                     #
-        while True:
-            start_of_first_string = string_ranges[0][0]
-            # No backwards regex search in `re` yet, doing it manually:
-            for i in range(start_of_first_string - 1, 0, -1):
-                if document_text[i] not in string.whitespace:
-                    candidate_end_of_additional_string = i
-                    print('Candidate: %s %s' % (i, document_text[i]))
-                    break
-            else:
-                break    
-                    
-            if _is_position_on_string(editor,
-                       candidate_end_of_additional_string, try_previous=False):
-                string_ranges.insert(
-                    0, 
-                    _find_string_from_position(
-                        editor,
-                        candidate_end_of_additional_string
-                    )
-                )
-                continue
-            else:
-                break
-        #                                                                     #
-        ### Finished scanning backward. #######################################
-
-        ### Scanning forward: #################################################
-        #                                                                     #
-        while True:
-            end_of_last_string = string_ranges[-1][1]
-            search_result = re.search('\S',
-                                      document_text[end_of_last_string:])
-            if search_result:
-                candidate_start_of_additional_string = \
-                                   end_of_last_string + search_result.span()[0]
-                if _is_position_on_string(editor,
-                                          candidate_start_of_additional_string,
-                                          try_previous=False):
-                    string_ranges.append(
-                        _find_string_from_position(
-                            editor,
-                            candidate_start_of_additional_string
-                        )
-                    )
-                    continue
-                    
-            # (This is like an `else` clause for both the above `if`s.)
-            return tuple(string_ranges)
-        #                                                                     #
-        ### Finished scanning forward. ########################################
-        
-        
-    else: # not multiline
-        return (start_marker, end_marker)
-            
-            
 def select_next_string(inner=False, editor=wingapi.kArgEditor,
                        app=wingapi.kArgApplication):
     '''
@@ -134,15 +41,15 @@ def select_next_string(inner=False, editor=wingapi.kArgEditor,
 
     app.ExecuteCommand('set-visit-history-anchor')
 
-    document_start = 0
     document_end = document.GetLength()
+    string_index = shared.get_string_index(document)
     
     selection_start, selection_end = editor.GetSelection()
     
     for _ in [0]:
-        if _is_position_on_string(editor, selection_start):
-            current_string_range = \
-                             _find_string_from_position(editor, selection_start)
+        current_string = string_index.get_string_at(selection_start)
+        if current_string is not None:
+            current_string_range = string_index.get_span(current_string)
             if (selection_start, selection_end) == current_string_range:
                 base_position = current_string_range[1] + 1
                 if base_position > document_end:
@@ -163,13 +70,10 @@ def select_next_string(inner=False, editor=wingapi.kArgEditor,
         else:
             base_position = selection_start
     
-        for position in range(base_position, document_end+1):
-            if _is_position_on_string(editor, position):
-                string_range = _find_string_from_position(editor, position)
-                editor.SetSelection(*string_range)
-                break
-        else:
+        next_string = string_index.find_next(base_position)
+        if next_string is None:
             return
+        editor.SetSelection(*string_index.get_span(next_string))
     
     if inner:
         _innerize_selected_string(editor)
@@ -191,37 +95,34 @@ def select_prev_string(inner=False, editor=wingapi.kArgEditor,
 
     app.ExecuteCommand('set-visit-history-anchor')
 
-    document_start = 0
-    document_end = document.GetLength()
+    string_index = shared.get_string_index(document)
     
     caret_position = editor.GetSelection()[1]
 
     for _ in [0]:
             
-        if _is_position_on_string(editor, caret_position) or \
-                      _is_position_on_string(editor, caret_position - 1):
-            current_string_range = \
-                              _find_string_from_position(editor, caret_position)
-            base_position = current_string_range[0] - 1
-            if base_position < document_start:
+        current_string = string_index.get_string_at(caret_position)
+        if current_string is None:
+            current_string = string_index.get_string_at(caret_position - 1)
+        if current_string is not None:
+            base_position = string_index.starts[current_string] - 1
+            if base_position < 0:
                 return
         else:
             base_position = caret_position
     
-        for position in range(base_position, document_start-1, -1):
-            if _is_position_on_string(editor, position):
-                string_range = _find_string_from_position(editor, position)
-                editor.SetSelection(*string_range)
-                break
-        else:
+        previous_string = string_index.find_previous(base_position)
+        if previous_string is None:
             return
+        editor.SetSelection(*string_index.get_span(previous_string))
     
     if inner:
         _innerize_selected_string(editor)
     
 
 string_pattern = re.compile(
-    '''^(?P<prefix>[uUbB]?[rR]?)(?P<delimiter>(\''')|(""")|(')|(")).*$''',
+    '''^(?P<prefix>(?:[rR][bBfF]?|[uUbBfF][rR]?)?)'''
+    '''(?P<delimiter>(\''')|(""")|(')|(")).*$''',
     flags=re.DOTALL
 )
 